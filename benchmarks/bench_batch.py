@@ -0,0 +1,47 @@
+#! /usr/bin/python3
+"""
+Measures how batch compilation throughput scales with worker processes.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import textcad_engine
+
+
+def part(holes):
+    plate = {"category": "element", "name": "cube", "size": [100, 100, 5],
+             "center": [False, False, False]}
+    return {"category": "operation", "name": "difference",
+            "elements": [plate] + [
+                {"category": "element", "name": "hole", "radius": 2,
+                 "height": 10, "center": [True, True, False],
+                 "location": [5 + 3 * (i % 30), 5 + 3 * (i // 30), -1]}
+                for i in range(holes)]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=400)
+    parser.add_argument("--holes", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        for idx in range(args.files):
+            with open(os.path.join(root, "part%d.json" % idx), 'w') as f:
+                json.dump(part(args.holes), f)
+        options = textcad_engine.argumentParser().parse_args([])
+        serial = None
+        jobs = 1
+        while jobs <= (os.cpu_count() or 1):
+            start = time.time()
+            textcad_engine.compileBatch([root], options, jobs=jobs)
+            elapsed = time.time() - start
+            serial = serial or elapsed
+            print("%2d workers %.2fs  %6.1f files/s  speedup %.2fx"
+                  % (jobs, elapsed, args.files / elapsed, serial / elapsed))
+            jobs *= 2
@@ -0,0 +1,73 @@
+#! /usr/bin/python3
+"""
+Compares finding clash candidates among the parts of a large assembly
+with AssemblyIndex, a bounding volume hierarchy, against testing every
+pair of part boxes with NumPy, as the assembly grows.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import textcad_engine
+import numpy
+
+
+def assembly(parts, seed=0):
+    """Brackets on a grid, a few of them nudged into their neighbours"""
+    rand = random.Random(seed)
+    columns = int(parts ** 0.5) + 1
+    elements = []
+    for idx in range(parts):
+        nudge = rand.uniform(0, 3) if rand.random() < 0.05 else 0
+        elements.append({
+            "category": "operation", "name": "difference",
+            "location": [idx % columns * 12 + nudge, idx // columns * 12, 0],
+            "rotation": {"angle": rand.choice([0, 90]), "axis": [0, 0, 1]},
+            "elements": [{"category": "element", "name": "cube",
+                          "size": [10, 10, 4],
+                          "center": [True, True, False]},
+                         {"category": "element", "name": "hole",
+                          "radius": 2, "height": 6,
+                          "center": [True, True, False]}]})
+    return {"category": "operation", "name": "union", "elements": elements}
+
+
+def allPairs(lows, highs):
+    found = []
+    for idx in range(len(lows)):
+        hits = numpy.nonzero((lows[idx + 1:] < highs[idx] - 1e-9).all(axis=1)
+                             & (lows[idx] < highs[idx + 1:] - 1e-9)
+                             .all(axis=1))[0]
+        found += [(idx, idx + 1 + hit) for hit in hits.tolist()]
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--parts", type=int, nargs='+',
+                        default=[1000, 4000, 16000])
+    args = parser.parse_args()
+
+    engine = textcad_engine.OpenSCADEngine()
+    print("%7s %9s %9s %9s %11s" % ("parts", "index ms", "bvh ms",
+                                    "pairs ms", "candidates"))
+    for parts in args.parts:
+        tree = assembly(parts)
+        start = time.perf_counter()
+        index = textcad_engine.AssemblyIndex(engine, tree)
+        indexed = time.perf_counter() - start
+        start = time.perf_counter()
+        hierarchy = textcad_engine.BoundingVolumeHierarchy(index.lows,
+                                                           index.highs)
+        found = hierarchy.pairs()
+        bvh = time.perf_counter() - start
+        start = time.perf_counter()
+        expect = allPairs(index.lows, index.highs)
+        brute = time.perf_counter() - start
+        assert found == expect
+        print("%7d %9.1f %9.1f %9.1f %11d" % (parts, indexed * 1000,
+                                              bvh * 1000, brute * 1000,
+                                              len(found)))
@@ -0,0 +1,64 @@
+#! /usr/bin/python3
+"""
+Compares compiling an assembly whose repeated brackets carry their
+construction inline with one referencing them from a ComponentLibrary,
+where each bracket is validated and compiled once, as it grows.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+import textcad_engine
+import generators
+
+
+def assembly(parts, designs, inline):
+    elements = []
+    for idx in range(parts):
+        part = {"category": "element", "name": "bracket" + str(idx % 4),
+                "location": [idx % 20 * 12, idx // 20 * 12, 0]}
+        if inline:
+            part['construction'] = designs[idx % 4]
+        elements.append(part)
+    return {"category": "operation", "name": "union", "elements": elements}
+
+
+def best(run, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--parts", type=int, nargs='+',
+                        default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rand = generators.random.Random(0)
+    designs = [generators.subAssembly(rand) for _ in range(4)]
+    with tempfile.TemporaryDirectory() as tmp:
+        for idx, design in enumerate(designs):
+            with open(os.path.join(tmp, "bracket%d.json" % idx), 'w') as f:
+                json.dump(design, f)
+        print("%7s %10s %11s" % ("parts", "inline ms", "library ms"))
+        for parts in args.parts:
+            plain = textcad_engine.OpenSCADEngine()
+            inline, expect = best(lambda: plain.parseJSON(
+                assembly(parts, designs, True)), args.repeat)
+            engine = textcad_engine.OpenSCADEngine()
+            engine.library = textcad_engine.ComponentLibrary(tmp)
+            library, text = best(lambda: engine.parseJSON(
+                assembly(parts, designs, False)), args.repeat)
+            assert text == expect
+            print("%7d %10.1f %11.1f" % (parts, inline * 1000,
+                                         library * 1000))
@@ -0,0 +1,81 @@
+#! /usr/bin/python3
+"""
+Compares the latency of compiling a small part with a cold command line
+run against asking a warm --serve engine, both through the thin client
+(one interpreter start) and from a process already holding a connection
+to it.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+root = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, root)
+import textcad_client
+
+PART = {"category": "operation", "name": "difference",
+        "elements": [{"category": "element", "name": "cube",
+                      "size": [20, 20, 5], "center": [True, True, False]},
+                     {"category": "element", "name": "hole", "radius": 2,
+                      "height": 8, "center": [True, True, False]}]}
+
+
+def best(run, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    path = os.path.join(tmp.name, "part.json")
+    with open(path, 'w') as f:
+        json.dump(PART, f)
+    address = os.path.join(tmp.name, "textcad.sock")
+    engine = os.path.join(root, "textcad_engine.py")
+    client = os.path.join(root, "textcad_client.py")
+    server = subprocess.Popen([sys.executable, engine, "--serve", address],
+                              stderr=subprocess.DEVNULL)
+    while not os.path.exists(address):
+        time.sleep(0.01)
+
+    def cold():
+        subprocess.run([sys.executable, engine, path, "-o", os.devnull],
+                       stdout=subprocess.DEVNULL, check=True)
+
+    def thin():
+        subprocess.run([sys.executable, client, "-s", address, path,
+                        "-o", os.devnull], check=True)
+
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.connect(address)
+    responses = connection.makefile('rb')
+    line = (json.dumps({"path": path}) + "\n").encode()
+
+    def warm():
+        connection.sendall(line)
+        assert json.loads(responses.readline())['ok']
+
+    coldTime = best(cold, args.repeat)
+    thinTime = best(thin, args.repeat)
+    warmTime = best(warm, args.repeat * 10)
+    connection.close()
+    textcad_client.request({"op": "shutdown"}, address)
+    server.wait()
+    print("cold cli  %.1f ms" % (coldTime * 1000))
+    print("client    %.1f ms  (%.1fx)" % (thinTime * 1000,
+                                          coldTime / thinTime))
+    print("socket    %.2f ms  (%.0fx)" % (warmTime * 1000,
+                                          coldTime / warmTime))
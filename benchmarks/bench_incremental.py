@@ -0,0 +1,61 @@
+#! /usr/bin/python3
+"""
+Compares a full compile with a SubtreeMemo re-run after editing one leaf
+of a large plate-like model.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import textcad_engine
+
+
+def hole(idx):
+    return {"category": "element", "name": "hole", "radius": 2 + idx % 3,
+            "height": 8, "center": [True, False, True],
+            "location": [idx % 100, idx // 100, 3],
+            "rotation": {"angle": 30, "axis": [0, 0, 1]},
+            "color": [0.5, 0.5, 0.5]}
+
+
+def model(groups, size):
+    return {"category": "operation", "name": "difference",
+            "elements": [{"category": "operation", "name": "union",
+                          "elements": [hole(group * size + idx)
+                                       for idx in range(size)]}
+                         for group in range(groups)]}
+
+
+def timed(engine, tree):
+    start = time.perf_counter()
+    engine.writeJSON(tree, io.StringIO())
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--size", type=int, default=100)
+    args = parser.parse_args()
+
+    tree = model(args.groups, args.size)
+    memoized = textcad_engine.OpenSCADEngine()
+    memoized.memo = textcad_engine.SubtreeMemo()
+    first = timed(memoized, tree)
+    # Edit a copy of the path to one leaf, as the memo needs
+    group = args.groups // 2
+    tree = dict(tree, elements=list(tree['elements']))
+    tree['elements'][group] = dict(tree['elements'][group], elements=list(
+        tree['elements'][group]['elements']))
+    tree['elements'][group]['elements'][0] = dict(
+        tree['elements'][group]['elements'][0], radius=7)
+    memoized.memo.hits = memoized.memo.misses = 0
+    edit = timed(memoized, tree)
+    full = timed(textcad_engine.OpenSCADEngine(), tree)
+    print("nodes %d  full %.1f ms  memo first run %.1f ms  "
+          "memo after edit %.1f ms (%d reused, %d emitted)"
+          % (args.groups * (args.size + 1) + 1, full * 1000, first * 1000,
+             edit * 1000, memoized.memo.hits, memoized.memo.misses))
@@ -0,0 +1,95 @@
+#! /usr/bin/python3
+"""
+Compares emitting a large mixed model straight from its JSON dicts with
+loading it into the typed node IR and emitting that, in time and in
+memory held by the tree.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import textcad_engine
+
+
+def part(idx):
+    location = [idx % 100, idx // 100, 0]
+    if idx % 3 == 0:
+        return {"category": "element", "name": "hole", "radius": 2,
+                "height": 8, "center": [True, True, False],
+                "location": location, "color": [0.5, 0.5, 0.5]}
+    if idx % 3 == 1:
+        return {"category": "element", "name": "cylinder", "radius": 1.5,
+                "height": 4, "center": [True, True, False],
+                "location": location,
+                "rotation": {"angle": 30, "axis": [0, 0, 1]}}
+    return {"category": "operation", "name": "translate",
+            "location": location,
+            "elements": [{"category": "element", "name": "cube",
+                          "size": [1, 2, 3],
+                          "center": [False, False, False]}]}
+
+
+def model(nodes):
+    """About nodes nodes, in unions of 100 parts"""
+    groups = max(1, nodes // 134)
+    return {"category": "operation", "name": "union",
+            "elements": [{"category": "operation", "name": "union",
+                          "elements": [part(group * 100 + idx)
+                                       for idx in range(100)]}
+                         for group in range(groups)]}
+
+
+def held(build):
+    """Returns what build() returns and the bytes it left allocated"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+
+def best(run, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = textcad_engine.OpenSCADEngine()
+    text = json.dumps(model(args.nodes))
+    tree, dictBytes = held(lambda: json.loads(text))
+    loaded, irBytes = held(lambda: engine.load(tree))
+    count = sum(1 for node in textcad_engine.iterNodes(tree))
+
+    def viaDicts():
+        writer = textcad_engine.ScadWriter(io.StringIO())
+        engine.emit(tree, writer)
+        writer.flush()
+
+    def viaModel():
+        writer = textcad_engine.ScadWriter(io.StringIO())
+        engine.emitModel(loaded, writer)
+        writer.flush()
+
+    dictTime = best(viaDicts, args.repeat)
+    loadTime = best(lambda: engine.load(tree), args.repeat)
+    modelTime = best(viaModel, args.repeat)
+    print("nodes %d" % count)
+    print("memory  dicts %.0f bytes/node  ir %.0f bytes/node"
+          % (dictBytes / count, irBytes / count))
+    print("emit    dicts %.1f ms  ir %.1f ms  (load %.1f ms)"
+          % (dictTime * 1000, modelTime * 1000, loadTime * 1000))
@@ -0,0 +1,49 @@
+#! /usr/bin/python3
+"""
+Times writing binary STL with MeshExport for the wide-union shape of
+generators.py as it grows, against rendering the same tree's OpenSCAD
+text with openscad when that is installed.
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+import textcad_engine
+import generators
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs='+',
+                        default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    engine = textcad_engine.OpenSCADEngine()
+    pool = textcad_engine.RenderPool(workers=1) \
+        if shutil.which("openscad") else None
+    print("%7s %9s %10s %12s" % ("parts", "facets", "numpy ms",
+                                 "openscad ms"))
+    for size in args.sizes:
+        tree = generators.wideUnion(size)
+        times = []
+        for _ in range(args.repeat):
+            mesh = textcad_engine.MeshExport()
+            start = time.perf_counter()
+            facets = mesh.write(engine, tree, io.BytesIO())
+            times.append(time.perf_counter() - start)
+        rendered = "-"
+        if pool:
+            with tempfile.TemporaryDirectory() as tmp:
+                result = pool.render(engine.parseJSON(tree),
+                                     os.path.join(tmp, "bench.stl"))
+            rendered = "%.1f" % (result.wallTime * 1000) if result.ok \
+                else "failed"
+        print("%7d %9d %10.1f %12s" % (size, facets, min(times) * 1000,
+                                       rendered))
@@ -0,0 +1,82 @@
+#! /usr/bin/python3
+"""
+Finds the crossover between serial emission and ParallelEmitter for a
+root union of a growing number of children, to choose its threshold.
+Each width is emitted both ways and checked to give the same text.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import textcad_engine
+
+
+def part(idx):
+    location = [idx % 100, idx // 100, 0]
+    if idx % 2:
+        return {"category": "operation", "name": "difference",
+                "location": location,
+                "elements": [{"category": "element", "name": "cube",
+                              "size": [4, 4, 2],
+                              "center": [True, True, False]},
+                             {"category": "element", "name": "hole",
+                              "radius": 1, "height": 3,
+                              "center": [True, True, False]}]}
+    return {"category": "element", "name": "cylinder", "radius": 1.5,
+            "height": 4, "center": [True, True, False],
+            "location": location, "rotation": {"angle": 30,
+                                               "axis": [0, 0, 1]}}
+
+
+def best(run, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--widths", type=int, nargs='+',
+                        default=[1000, 3000, 10000, 30000, 100000, 300000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    serial = textcad_engine.OpenSCADEngine()
+    parallel = textcad_engine.OpenSCADEngine()
+    parallel.parallel = textcad_engine.ParallelEmitter(args.workers,
+                                                       threshold=1)
+
+    def emitter(engine, model):
+        def run():
+            sink = io.StringIO()
+            writer = textcad_engine.ScadWriter(sink)
+            engine.emitModel(model, writer)
+            writer.flush()
+            return sink.getvalue()
+        return run
+
+    print("workers %d" % args.workers)
+    print("%9s %11s %11s %8s" % ("children", "serial ms", "parallel ms",
+                                 "speedup"))
+    crossover = None
+    for width in args.widths:
+        model = serial.load({"category": "operation", "name": "union",
+                             "elements": [part(idx)
+                                          for idx in range(width)]})
+        serialTime, expect = best(emitter(serial, model), args.repeat)
+        parallelTime, text = best(emitter(parallel, model), args.repeat)
+        assert text == expect
+        speedup = serialTime / parallelTime
+        if crossover is None and speedup > 1:
+            crossover = width
+        print("%9d %11.1f %11.1f %7.2fx" % (width, serialTime * 1000,
+                                            parallelTime * 1000, speedup))
+    print("crossover: " + ("%d children" % crossover if crossover
+                           else "none measured"))
@@ -0,0 +1,77 @@
+#! /usr/bin/python3
+"""
+Times changing one parameter of a large parametric model and emitting
+it again, with a ParametricModel re-rendering only the nodes that use
+the parameter, against evaluating the whole tree and compiling it.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import textcad_engine
+
+
+def template(parts):
+    """A plate with parts holes; every tenth uses the bolt parameters"""
+    elements = [{"category": "element", "name": "cube",
+                 "size": [{"expression": "pitch * 10"},
+                          {"expression": "pitch * " + str(parts // 10)}, 4],
+                 "center": [False, False, False]}]
+    for idx in range(parts):
+        hole = {"category": "element", "name": "hole", "radius": 1,
+                "height": 10, "center": [True, True, False],
+                "location": [idx % 10 * 6, idx // 10 * 6, 0]}
+        if idx % 10 == 0:
+            hole['radius'] = {"expression": "bolt + fit"}
+        elements.append(hole)
+    return {"category": "operation", "name": "difference",
+            "parameters": {"pitch": 6, "bolt": 1.5, "fit": "bolt / 10"},
+            "elements": elements}
+
+
+def best(run, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--parts", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = textcad_engine.OpenSCADEngine()
+    tree = template(args.parts)
+    start = time.perf_counter()
+    model = textcad_engine.ParametricModel(engine, tree)
+    setup = time.perf_counter() - start
+    sizes = iter(range(1, 1000))
+
+    def edit():
+        model.set("bolt", 1.5 + next(sizes) / 100)
+        model.write(io.StringIO())
+
+    def whole():
+        values = model.values
+        sweep = model.sweep
+        plain = textcad_engine.copyTree(tree)
+        for node in textcad_engine.iterNodes(plain):
+            for key, value in node.items():
+                if key not in sweep.structure:
+                    node[key] = sweep.substitute(value, values)
+        del plain['parameters']
+        engine.parseJSON(plain)
+
+    incremental = best(edit, args.repeat)
+    full = best(whole, args.repeat)
+    print("parts %d  (model built in %.1f ms, %d nodes re-rendered per edit)"
+          % (args.parts, setup * 1000, model.rendered))
+    print("set + write %.2f ms  evaluate + compile %.2f ms  (%.0fx)"
+          % (incremental * 1000, full * 1000, full / incremental))
@@ -0,0 +1,74 @@
+#! /usr/bin/python3
+"""
+Compares the peak resident memory of compiling a large generated input
+with and without --stream, against the size of the input file.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ENGINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                      "textcad_engine.py")
+
+
+def part(idx):
+    return {"category": "operation", "name": "translate",
+            "location": [idx % 1000, idx // 1000, 0],
+            "elements": [{"category": "element", "name": "cube",
+                          "size": [4, 4, 1],
+                          "center": [True, True, False]},
+                         {"category": "element", "name": "hole",
+                          "radius": 1, "height": 3,
+                          "center": [True, True, False],
+                          "color": [0.5, 0.5, 0.5]}]}
+
+
+def generate(path, parts, lines):
+    with open(path, 'w') as output:
+        if not lines:
+            output.write('{"category": "operation", "name": "union", '
+                         '"elements": [')
+        for idx in range(parts):
+            if idx and not lines:
+                output.write(", ")
+            output.write(json.dumps(part(idx)))
+            if lines:
+                output.write("\n")
+        if not lines:
+            output.write("]}")
+
+
+def measure(args):
+    """Runs the engine; returns seconds taken and peak RSS in bytes"""
+    start = time.time()
+    child = subprocess.Popen([sys.executable, ENGINE, "-o", os.devnull]
+                             + args, stdout=subprocess.DEVNULL)
+    pid, status, usage = os.wait4(child.pid, 0)
+    if status:
+        raise SystemExit("engine failed: " + " ".join(args))
+    return time.time() - start, usage.ru_maxrss * 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--parts", type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tree = os.path.join(tmp, "layout.json")
+        lines = os.path.join(tmp, "layout.jsonl")
+        generate(tree, args.parts, False)
+        generate(lines, args.parts, True)
+        size = os.path.getsize(tree)
+        print("input %.1f MB, %d parts; interpreter start-up %.1f MB"
+              % (size / 1e6, args.parts, measure(["--version"])[1] / 1e6))
+        for label, options in (("whole", [tree]),
+                               ("--stream", ["--stream", tree]),
+                               ("--json-lines", ["--json-lines", lines])):
+            elapsed, peak = measure(options)
+            print("%-13s %6.2f s  peak RSS %7.1f MB (%.0f%% of input)"
+                  % (label, elapsed, peak / 1e6, 100 * peak / size))
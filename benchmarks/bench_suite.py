@@ -0,0 +1,179 @@
+#! /usr/bin/python3
+"""
+Times compiling each tree shape in generators.py end to end with
+parseJSON and stage by stage: load (validating into the node IR),
+analyze (the optimization passes), emit (writing the text to memory)
+and write (writing it to a file). Each stage's peak traced memory is
+measured in a separate run, since tracemalloc slows what it traces.
+Results are written as JSON; given an earlier result with --compare,
+stages slower by more than --tolerance are listed and the exit status
+is 1.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+root = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.dirname(__file__))
+import textcad_engine
+import generators
+
+stages = ["load", "analyze", "emit", "write", "parseJSON"]
+
+
+def engineWith(passes):
+    engine = textcad_engine.OpenSCADEngine()
+    if "simplify" in passes:
+        engine.passes.append(textcad_engine.SimplifyPass())
+    if "dedup" in passes:
+        engine.passes.append(textcad_engine.DeduplicatePass())
+    if "resolution" in passes:
+        engine.resolution = textcad_engine.ResolutionPolicy("draft")
+    return engine
+
+
+def stageRuns(engine, tree, path):
+    """Returns a function running each stage, in order, on tree"""
+    state = {}
+
+    def load():
+        state['model'] = engine.load(tree)
+
+    def analyze():
+        if engine.passes or engine.resolution:
+            state['model'] = engine.load(engine.optimize(tree))
+
+    def emit():
+        sink = io.StringIO()
+        writer = textcad_engine.ScadWriter(sink)
+        engine.emitModel(state['model'], writer)
+        writer.flush()
+        state['text'] = sink.getvalue()
+
+    def write():
+        with open(path, 'w') as output:
+            writer = textcad_engine.ScadWriter(output)
+            writer.write(state['text'])
+            writer.flush()
+
+    def end():
+        state['parsed'] = engine.parseJSON(tree)
+
+    return [load, analyze, emit, write, end], state
+
+
+def measure(engine, tree, path, repeat):
+    """Returns the timings and peak memory of each stage"""
+    runs, state = stageRuns(engine, tree, path)
+    times = {stage: [] for stage in stages}
+    for _ in range(repeat):
+        for stage, run in zip(stages, runs):
+            start = time.perf_counter()
+            run()
+            times[stage].append(time.perf_counter() - start)
+    assert state['parsed'] == state['text']
+    result = {}
+    for stage, run in zip(stages, runs):
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        result[stage] = {"best": min(times[stage]),
+                         "median": statistics.median(times[stage]),
+                         "peakBytes": peak}
+    return result, len(state['text'])
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=root,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL,
+                              universal_newlines=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def regressions(baseline, current, tolerance):
+    """Yields (shape, stage, old, new) for each stage slower than before"""
+    for shape, case in current['shapes'].items():
+        old = baseline['shapes'].get(shape)
+        if not old or old['nodes'] != case['nodes']:
+            continue
+        for stage, timing in case['stages'].items():
+            before = old['stages'].get(stage, {}).get('best')
+            if before and timing['best'] > before * (1 + tolerance):
+                yield shape, stage, before, timing['best']
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shapes", nargs='+',
+                        choices=sorted(generators.shapes),
+                        default=list(generators.shapes))
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiply every shape's default size")
+    parser.add_argument("--passes", nargs='*', default=["resolution"],
+                        choices=["simplify", "dedup", "resolution"],
+                        help="passes run in the analyze stage "
+                             "(default: resolution)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output",
+                        help="write the results as JSON to this file")
+    parser.add_argument("--compare", metavar="RESULTS",
+                        help="an earlier --output to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="fraction slower counted as a regression "
+                             "(default: 0.1)")
+    args = parser.parse_args()
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 100000))
+    engine = engineWith(args.passes)
+    results = {"commit": commit(),
+               "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+               "python": platform.python_version(),
+               "machine": platform.machine(),
+               "numpy": textcad_engine.numpy is not None,
+               "passes": args.passes, "repeat": args.repeat,
+               "seed": args.seed, "shapes": {}}
+    print("%-20s %8s " % ("shape", "nodes")
+          + " ".join("%10s" % stage for stage in stages) + "  peak MB")
+    with tempfile.TemporaryDirectory() as tmp:
+        for shape in args.shapes:
+            generator, size = generators.shapes[shape]
+            tree = generator(max(1, int(size * args.scale)), seed=args.seed)
+            nodes = sum(1 for node in textcad_engine.iterNodes(tree))
+            timings, size = measure(engine, tree,
+                                    os.path.join(tmp, shape + ".scad"),
+                                    args.repeat)
+            results['shapes'][shape] = {"nodes": nodes, "outputBytes": size,
+                                        "stages": timings}
+            print("%-20s %8d " % (shape, nodes)
+                  + " ".join("%8.1fms" % (timings[stage]['best'] * 1000)
+                             for stage in stages)
+                  + "  %7.1f" % (max(timing['peakBytes'] for timing
+                                     in timings.values()) / 1e6))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline:
+            slower = list(regressions(json.load(baseline), results,
+                                      args.tolerance))
+        for shape, stage, before, after in slower:
+            print("regression: %s %s %.1fms -> %.1fms (+%.0f%%)"
+                  % (shape, stage, before * 1000, after * 1000,
+                     (after / before - 1) * 100))
+        if slower:
+            sys.exit(1)
+        print("no regressions against " + args.compare)
@@ -0,0 +1,83 @@
+#! /usr/bin/python3
+"""
+Compares writing many variants of one parametric template by compiling
+each substituted tree with those written by a Sweep, which compiles the
+template once and renders its parametric nodes for all variants at once.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import textcad_engine
+
+
+def ref(name):
+    return {"parameter": name}
+
+
+def template(parts):
+    """A plate with parts bolt holes, posts and bosses, some parametric"""
+    elements = [{"category": "element", "name": "cube",
+                 "size": [ref("width"), ref("depth"), ref("thick")],
+                 "center": [True, True, False]}]
+    for idx in range(parts):
+        location = [idx % 10 * 6, idx // 10 * 6, 0]
+        if idx % 3 == 0:
+            elements.append({"category": "element", "name": "hole",
+                             "radius": ref("bolt"), "height": 20,
+                             "center": [True, True, False],
+                             "tolerance": ref("fit"), "location": location})
+        elif idx % 3 == 1:
+            elements.append({"category": "element", "name": "ntube",
+                             "apothem": ref("nut"), "sides": 6,
+                             "height": ref("thick"),
+                             "center": [True, True, False],
+                             "location": location})
+        else:
+            elements.append({"category": "operation", "name": "translate",
+                             "location": location,
+                             "elements": [{"category": "element",
+                                           "name": "cylinder", "radius": 2,
+                                           "height": 12,
+                                           "center": [True, True, False]}]})
+    return {"category": "operation", "name": "difference",
+            "elements": elements}
+
+
+def instance(tree, values):
+    return json.loads(json.dumps(tree), object_hook=lambda obj:
+                      values[obj['parameter']] if obj.keys() == {"parameter"}
+                      else obj)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--variants", type=int, default=2000)
+    parser.add_argument("--parts", type=int, default=60)
+    args = parser.parse_args()
+
+    rand = random.Random(0)
+    names = ["width", "depth", "thick", "bolt", "fit", "nut"]
+    rows = [[rand.choice([60, 80, 100]), rand.choice([60, 80]),
+             rand.uniform(2, 6), rand.uniform(1, 4), rand.choice([0.1, 0.2]),
+             rand.uniform(2, 5)] for _ in range(args.variants)]
+    tree = template(args.parts)
+    engine = textcad_engine.OpenSCADEngine()
+
+    start = time.perf_counter()
+    expect = [engine.parseJSON(instance(tree, dict(zip(names, row))))
+              for row in rows]
+    perTree = time.perf_counter() - start
+
+    start = time.perf_counter()
+    texts = list(textcad_engine.Sweep(engine, tree).texts(names, rows))
+    sweep = time.perf_counter() - start
+
+    assert texts == expect
+    print("variants %d  parts %d" % (args.variants, args.parts))
+    print("per tree %.1f ms  sweep %.1f ms  (%.1fx)"
+          % (perTree * 1000, sweep * 1000, perTree / sweep))
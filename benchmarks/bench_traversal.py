@@ -0,0 +1,83 @@
+#! /usr/bin/python3
+"""
+Compares the explicit-stack traversal in OpenSCADEngine.emit against the
+recursive walk it replaced, on deep transform chains and wide unions.
+"""
+import argparse
+import io
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import textcad_engine
+
+
+class RecursiveEngine(textcad_engine.OpenSCADEngine):
+    """The recursive traversal, kept here as the baseline"""
+
+    def emit(self, data, writer):
+        if data['category']:
+            if data['category'] == "operation":
+                if data['name'] in self.operations:
+                    scadOperation = self.parseOperation(data) + "{\n"
+                    writer.write(" " * self.level * self.indent
+                                 + scadOperation)
+                    for types in data['elements']:
+                        self.level += 1
+                        self.emit(types, writer)
+                        writer.write("\n")
+                        self.level -= 1
+                    writer.write(" " * self.level * self.indent + "}\n")
+                else:
+                    self.emit(data['construction'], writer)
+            if data['category'] == "element":
+                props = self.parseProperties(data)
+                writer.write(" " * self.level * self.indent + props)
+                if data['name'] in self.elements:
+                    writer.write(self.parseElement(data))
+                else:
+                    self.emit(data['construction'], writer)
+
+
+def leaf():
+    return {"category": "element", "name": "cylinder", "radius": 2,
+            "height": 8, "center": [True, True, False]}
+
+
+def deepTree(depth):
+    node = leaf()
+    for i in range(depth):
+        name = "translate" if i % 2 else "rotate"
+        node = {"category": "operation", "name": name,
+                "location": [i, 0, 0], "angle": 15, "axis": [0, 0, 1],
+                "elements": [node]}
+    return node
+
+
+def wideTree(width):
+    return {"category": "operation", "name": "union",
+            "elements": [leaf() for i in range(width)]}
+
+
+def timeEngine(engine, tree, repeat):
+    return min(timeit.repeat(lambda: engine.writeJSON(tree, io.StringIO()),
+                             number=1, repeat=repeat))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--depth", type=int, default=900)
+    parser.add_argument("--width", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for label, tree in (("deep", deepTree(args.depth)),
+                        ("wide", wideTree(args.width))):
+        recursive = RecursiveEngine()
+        iterative = textcad_engine.OpenSCADEngine()
+        assert recursive.parseJSON(tree) == iterative.parseJSON(tree)
+        before = timeEngine(recursive, tree, args.repeat)
+        after = timeEngine(iterative, tree, args.repeat)
+        print("%-5s recursive %.4fs  iterative %.4fs  (%.2fx)"
+              % (label, before, after, before / after))
@@ -0,0 +1,127 @@
+"""
+Deterministic textcad trees for benchmarks. Every generator takes a size
+and a seed and builds the same tree for the same arguments, so timings
+from different commits can be compared.
+"""
+import random
+
+
+def cube(size, center=(False, False, False), **placement):
+    return dict({"category": "element", "name": "cube", "size": list(size),
+                 "center": list(center)}, **placement)
+
+
+def cylinder(radius, height, **placement):
+    return dict({"category": "element", "name": "cylinder", "radius": radius,
+                 "height": height, "center": [True, True, False]},
+                **placement)
+
+
+def hole(radius, height, **placement):
+    return dict({"category": "element", "name": "hole", "radius": radius,
+                 "height": height, "center": [True, True, False]},
+                **placement)
+
+
+def operation(name, elements, **fields):
+    return dict({"category": "operation", "name": name,
+                 "elements": elements}, **fields)
+
+
+def wideUnion(size, seed=0):
+    """One union of size primitives scattered over a grid"""
+    rand = random.Random(seed)
+    shapes = []
+    for idx in range(size):
+        location = [idx % 100 * 2, idx // 100 * 2, 0]
+        if rand.random() < 0.5:
+            shapes.append(cube([1, 1, rand.choice([1, 2, 3])],
+                               location=location))
+        else:
+            shapes.append(cylinder(rand.choice([0.5, 0.8]), 2,
+                                   location=location))
+    return operation("union", shapes)
+
+
+def deepChain(size, seed=0):
+    """size nested transforms around a single sphere"""
+    rand = random.Random(seed)
+    node = {"category": "element", "name": "sphere", "radius": 1,
+            "center": [True, True, True]}
+    for idx in range(size):
+        kind = idx % 3
+        if kind == 0:
+            node = operation("translate", [node], location=[
+                rand.randint(-5, 5), rand.randint(-5, 5), 1])
+        elif kind == 1:
+            node = operation("rotate", [node], angle=rand.choice([15, 30]),
+                             axis=[0, 0, 1])
+        else:
+            node = operation("scale", [node], multiplier=[1, 1, 1.01])
+    return node
+
+
+def subAssembly(rand):
+    """A bracket of a plate, bolts and a boss"""
+    bolts = [{"category": "element", "name": "bolt",
+              "location": [x, y, 0],
+              "construction": operation("union", [
+                  {"category": "element", "name": "ntube", "apothem": 1.5,
+                   "sides": 6, "height": 1, "center": [True, True, False]},
+                  hole(0.8, 6)])}
+             for x in (2, 8) for y in (2, 8)]
+    return operation("difference", [
+        cube([10, 10, 3]),
+        operation("union", bolts),
+        cylinder(rand.choice([2, 2.5]), 5, location=[5, 5, -1])])
+
+
+def repeatedAssemblies(size, seed=0):
+    """size brackets from a handful of distinct designs, placed apart"""
+    rand = random.Random(seed)
+    designs = [subAssembly(rand) for _ in range(4)]
+    return operation("union", [
+        operation("translate", [designs[idx % len(designs)]],
+                  location=[idx % 20 * 12, idx // 20 * 12, 0])
+        for idx in range(size)])
+
+
+def holePlate(size, seed=0):
+    """A plate drilled with size holes of a few sizes"""
+    rand = random.Random(seed)
+    columns = max(1, int(size ** 0.5))
+    return operation("difference", [cube([columns * 4 + 4, size // columns
+                                          * 4 + 4, 5])] + [
+        hole(rand.choice([1, 1.5, 2.5]), 10,
+             location=[4 + idx % columns * 4, 4 + idx // columns * 4, -1])
+        for idx in range(size)])
+
+
+def mixedParts(size, seed=0):
+    """size parts drawn from all of the shapes above, as a real model"""
+    rand = random.Random(seed)
+    parts = []
+    for idx in range(size):
+        location = [idx % 25 * 30, idx // 25 * 30, 0]
+        kind = rand.randrange(4)
+        if kind == 0:
+            part = holePlate(rand.randint(4, 16), seed=idx)
+        elif kind == 1:
+            part = subAssembly(rand)
+        elif kind == 2:
+            part = deepChain(rand.randint(2, 8), seed=idx)
+        else:
+            part = operation("intersection", [
+                cube([8, 8, 8], center=(True, True, True)),
+                {"category": "element", "name": "sphere", "radius": 5,
+                 "center": [True, True, True], "color": [0.2, 0.4, 0.8]}])
+        parts.append(operation("union", [part], location=location))
+    return operation("union", parts)
+
+
+# Name: (generator, default size)
+shapes = {"wide-union": (wideUnion, 20000),
+          "deep-chain": (deepChain, 2000),
+          "repeated-assemblies": (repeatedAssemblies, 500),
+          "hole-plate": (holePlate, 10000),
+          "mixed-parts": (mixedParts, 500)}
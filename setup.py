@@ -6,5 +6,5 @@ setup(name='textcad_engine',
       author='Steve kelly',
       author_email='kd2cca@gmail.com',
       url='http://www.github.com/ParametricCSG/PCSG-OpenSCAD',
-      py_modules=['textcad_engine']
+      py_modules=['textcad_engine', 'textcad_client']
      )
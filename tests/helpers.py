@@ -0,0 +1,40 @@
+#!/usr/bin/python3.3
+"""Tree factories and compile shortcuts shared by the tests"""
+import textcad_engine
+import io
+import json
+
+
+def cube(size, location=None, **fields):
+    data = dict({"category": "element", "name": "cube", "size": size,
+                 "center": [False, False, False]}, **fields)
+    if location:
+        data['location'] = location
+    return data
+
+
+def union(elements, location=None):
+    data = {"category": "operation", "name": "union", "elements": elements}
+    if location:
+        data['location'] = location
+    return data
+
+
+def compiled(tree, options=None):
+    sink = io.StringIO()
+    textcad_engine.compileTree(tree, sink, options)
+    return sink.getvalue()
+
+
+def instance(template, values):
+    """The template with its references evaluated, as a plain tree"""
+    def hook(obj):
+        if obj.keys() == {"parameter"}:
+            return values[obj['parameter']]
+        if obj.keys() == {"expression"}:
+            return textcad_engine.Expression(obj['expression']).evaluate(
+                values)
+        return obj
+    tree = json.loads(json.dumps(template), object_hook=hook)
+    tree.pop('parameters', None)
+    return tree
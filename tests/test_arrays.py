@@ -0,0 +1,106 @@
+#!/usr/bin/python3.3
+import textcad_engine
+import unittest
+import copy
+
+
+def peg(radius=1):
+    return {"category": "element", "name": "cylinder", "radius": radius,
+            "height": 2, "center": [True, True, False], "fragments": 12}
+
+
+def array(name, **argument):
+    return dict({"category": "operation", "name": name,
+                 "elements": [peg()]}, **argument)
+
+
+class TestArrays(unittest.TestCase):
+
+    def setUp(self):
+        self.eng = textcad_engine.OpenSCADEngine()
+
+    def test_emission(self):
+        cases = [
+            (array("linearArray", count=4, step=[2, 0, 0]),
+             "for(i=[0:3])translate(v=i*[2, 0, 0])"),
+            (array("gridArray", counts=[2, 3], spacing=[5, 4, 0]),
+             "for(i=[0:1], j=[0:2])translate(v=[i*5, j*4, 0])"),
+            (array("gridArray", counts=[2, 2, 2], spacing=[1, 2, 3]),
+             "for(i=[0:1], j=[0:1], k=[0:1])translate(v=[i*1, j*2, k*3])"),
+            (array("polarArray", count=6, radius=10),
+             "for(i=[0:5])rotate(a=i*60.0, v=[0, 0, 1])"
+             "translate(v=[10, 0, 0])"),
+            (array("polarArray", count=3, radius=4, angle=90),
+             "for(i=[0:2])rotate(a=i*45.0, v=[0, 0, 1])"
+             "translate(v=[4, 0, 0])"),
+            (array("pointArray", points=[[0, 0, 0], [1, 2, 3]]),
+             "for(p=[[0, 0, 0], [1, 2, 3]])translate(v=p)")]
+        inner = self.eng.parseJSON(peg()).replace("\n", "\n    ")
+        for tree, head in cases:
+            expect = head + "{\n    " + inner.rstrip() + "\n}\n"
+            self.assertEqual(expect, self.eng.parseJSON(tree))
+            model = self.eng.load(tree)
+            self.assertEqual(self.eng.arrayCount(tree),
+                             len(self.eng.arrayCopies(tree)))
+            self.assertIsInstance(model.root, textcad_engine.Operation)
+
+    def test_validation(self):
+        cases = [(array("linearArray", count=0, step=[1, 0, 0]),
+                  "tree.count", "a positive integer"),
+                 (array("gridArray", counts=[2], spacing=[1, 1, 1]),
+                  "tree.counts", "a list of 2 or 3 positive integers"),
+                 (array("pointArray", points=[[1, 2]]),
+                  "tree.points", "a list of lists of 3 numbers")]
+        for tree, path, message in cases:
+            with self.assertRaises(textcad_engine.SchemaError) as caught:
+                self.eng.load(tree)
+            self.assertEqual(path, caught.exception.path)
+            self.assertIn(message, str(caught.exception))
+        with self.assertRaisesRegex(textcad_engine.SchemaError,
+                                    "missing 'step'"):
+            self.eng.load(array("linearArray", count=2))
+
+    def test_bounds(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest("NumPy is not installed")
+        bounds = textcad_engine.BoundsAnalysis()
+        tree = array("gridArray", counts=[3, 2], spacing=[10, 5, 0])
+        low, high = bounds.analyze(self.eng, tree)[id(tree)]
+        self.assertEqual([-1, -1, 0], low.tolist())
+        self.assertEqual([21, 6, 2], high.tolist())
+        tree = array("polarArray", count=4, radius=10)
+        low, high = bounds.analyze(self.eng, tree)[id(tree)]
+        numpy.testing.assert_allclose([-11, -11, 0], low)
+        numpy.testing.assert_allclose([11, 11, 2], high)
+        tree = {"category": "operation", "name": "difference",
+                "elements": [peg(5),
+                             array("linearArray", count=3, step=[20, 0, 0])]}
+        simplified = textcad_engine.SimplifyPass().run(self.eng, tree)
+        self.assertEqual(2, len(simplified['elements']))
+        tree['elements'][1]['location'] = [30, 0, 0]
+        simplified = textcad_engine.SimplifyPass().run(self.eng, tree)
+        self.assertEqual("cylinder", simplified['name'])
+
+    def test_resolution(self):
+        tree = {"category": "operation", "name": "union",
+                "elements": [peg(4), array("linearArray", count=50,
+                                           step=[1, 0, 0])]}
+        tree['elements'][1]['elements'][0]['radius'] = 4
+        policy = textcad_engine.ResolutionPolicy("production",
+                                                 facetBudget=5000)
+        result = policy.run(self.eng, copy.deepcopy(tree))
+        single = result['elements'][0]['fragments']
+        repeated = result['elements'][1]['elements'][0]['fragments']
+        self.assertLessEqual(policy.after, 5000)
+        self.assertEqual(single, repeated)
+        self.assertLess(single, 60)
+        flat = policy.run(self.eng, {"category": "operation",
+                                     "name": "union",
+                                     "elements": [peg(4), peg(4)]})
+        self.assertGreater(flat['elements'][0]['fragments'], single)
+
+
+if __name__ == '__main__':
+    unittest.main()
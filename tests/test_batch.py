@@ -0,0 +1,54 @@
+#!/usr/bin/python3.3
+import textcad_engine
+import unittest
+import json
+import os
+import tempfile
+
+CUBE = {"category": "element", "name": "cube", "size": [1, 2, 3],
+        "center": [False, False, False]}
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        os.makedirs(os.path.join(self.root, "a"))
+        os.makedirs(os.path.join(self.root, "b"))
+        for path in ("a/part.json", "b/part.json", "top.json"):
+            with open(os.path.join(self.root, path), 'w') as f:
+                json.dump(CUBE, f)
+        with open(os.path.join(self.root, "b", "broken.json"), 'w') as f:
+            f.write("{")
+        self.args = textcad_engine.argumentParser().parse_args([])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_findInputs(self):
+        found = textcad_engine.findInputs([self.root])
+        self.assertEqual(4, len(found))
+        found = textcad_engine.findInputs([os.path.join(self.root, "*.json")])
+        self.assertEqual([os.path.join(self.root, "top.json")], found)
+
+    def test_next_to_inputs(self):
+        results = textcad_engine.compileBatch([self.root], self.args, jobs=1)
+        errors = dict(results)
+        self.assertEqual(4, len(results))
+        self.assertTrue(errors[os.path.join(self.root, "b", "broken.json")])
+        with open(os.path.join(self.root, "a", "part.scad")) as f:
+            self.assertEqual("cube(size=[1, 2, 3]);", f.read())
+        self.assertFalse(os.path.exists(
+            os.path.join(self.root, "b", "broken.scad")))
+
+    def test_output_dir(self):
+        outputDir = os.path.join(self.root, "out")
+        results = textcad_engine.compileBatch([self.root], self.args,
+                                              outputDir=outputDir, jobs=2)
+        self.assertEqual(1, len([path for path, error in results if error]))
+        for path in ("a/part.scad", "b/part.scad", "top.scad"):
+            self.assertTrue(os.path.exists(os.path.join(outputDir, path)))
+
+if __name__ == '__main__':
+    unittest.main()
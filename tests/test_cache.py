@@ -0,0 +1,104 @@
+#!/usr/bin/python3.3
+import textcad_engine
+from helpers import cube
+import unittest
+import os
+import json
+import subprocess
+import sys
+import tempfile
+
+
+class TestCompileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cache.sqlite")
+        self.cache = textcad_engine.CompileCache(self.path)
+        self.eng = textcad_engine.OpenSCADEngine()
+        self.eng.cache = self.cache
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def test_hit(self):
+        expect = "cube(size=[1, 2, 3]);"
+        self.assertEqual(expect, self.eng.parseJSON(cube([1, 2, 3])))
+        self.assertEqual(expect, self.eng.parseJSON(cube([1, 2, 3])))
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+        stats = textcad_engine.CompileCache(self.path).stats()
+        self.assertEqual(1, stats['entries'])
+        self.assertEqual(1, stats['hits'])
+
+    def test_canonical_key(self):
+        first = {"size": [1, 1, 1], "name": "cube", "category": "element",
+                 "center": [False, False, False]}
+        self.eng.parseJSON(cube([1, 1, 1]))
+        self.eng.parseJSON(first)
+        self.assertEqual(1, self.cache.hits)
+
+    def test_options(self):
+        self.eng.parseJSON(cube([1, 1, 1]))
+        self.eng.indent = 2
+        self.eng.parseJSON(cube([1, 1, 1]))
+        self.eng.passes.append(textcad_engine.DeduplicatePass())
+        self.eng.parseJSON(cube([1, 1, 1]))
+        self.assertEqual((0, 3), (self.cache.hits, self.cache.misses))
+
+    def test_eviction(self):
+        self.cache.maxSize = 50
+        for size in range(1, 4):
+            self.eng.parseJSON(cube([size, size, size]))
+        self.assertTrue(self.cache.stats()['bytes'] <= 50)
+        self.eng.parseJSON(cube([3, 3, 3]))
+        self.assertEqual(1, self.cache.hits)
+        self.eng.parseJSON(cube([1, 1, 1]))
+        self.assertEqual(1, self.cache.hits)
+
+    def test_stored_bytes(self):
+        counted = lambda: self.cache.db.execute(
+            "SELECT value FROM counters WHERE name = 'bytes'").fetchone()[0]
+        summed = lambda: self.cache.stats()['bytes']
+        self.cache.maxSize = 60
+        for size in range(1, 6):
+            self.cache.put("part", "x" * size)
+            self.cache.put(str(size), "y" * 20)
+            self.assertEqual(summed(), counted())
+        self.assertEqual(45, summed())
+        self.assertIsNotNone(self.cache.get("part"))
+        self.cache.put("last", "z" * 30)
+        # The least recently used go until the excess 15 bytes are freed
+        self.assertEqual(55, summed())
+        self.assertEqual(["5", "last", "part"], sorted(
+            key for key, in self.cache.db.execute("SELECT key FROM entries")))
+        with self.cache.db:
+            self.cache.db.execute("DELETE FROM counters")
+        # A file without the counter has it summed when opened
+        self.cache.close()
+        self.cache = textcad_engine.CompileCache(self.path)
+        self.assertEqual(55, counted())
+
+    def test_cli(self):
+        source = os.path.join(self.tmp.name, "part.json")
+        with open(source, 'w') as f:
+            json.dump(cube([1, 2, 3]), f)
+        run = lambda *args: subprocess.run(
+            [sys.executable, textcad_engine.__file__, "--cache", self.path]
+            + list(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True)
+        for _ in range(2):
+            result = run(source)
+            self.assertEqual(0, result.returncode)
+            self.assertEqual("cube(size=[1, 2, 3]);", result.stdout)
+        stats = json.loads(run("--cache-stats").stdout)
+        self.assertEqual((1, 1, 1), (stats['entries'], stats['hits'],
+                                     stats['misses']))
+
+    def test_clear(self):
+        self.eng.parseJSON(cube([1, 1, 1]))
+        self.cache.clear()
+        self.assertEqual(0, self.cache.stats()['entries'])
+
+if __name__ == '__main__':
+    unittest.main()
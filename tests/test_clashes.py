@@ -0,0 +1,157 @@
+#!/usr/bin/python3.3
+import textcad_engine
+from helpers import cube
+import unittest
+import os
+import json
+import random
+import subprocess
+import sys
+import tempfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+ASSEMBLY = {"category": "operation", "name": "union", "elements": [
+    cube([10, 10, 10]),
+    # Touches the first cube face to face only
+    cube([10, 10, 10], [10, 0, 0]),
+    # Turned a quarter about z, then moved to x=0..5, y=5..15
+    cube([10, 5, 10], [5, 5, 0], rotation={"angle": 90, "axis": [0, 0, 1]}),
+    {"category": "operation", "name": "difference", "location": [5, 5, 5],
+     "elements": [{"category": "element", "name": "sphere", "radius": 2,
+                   "center": [True, True, True]},
+                  cube([50, 50, 50], [-25, -25, -25])]},
+    {"category": "operation", "name": "linearArray", "count": 3,
+     "step": [0, 0, 20],
+     "elements": [{"category": "element", "name": "cylinder", "radius": 1,
+                   "height": 5, "center": [True, True, False],
+                   "location": [15, 5, 8]}]}]}
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class TestBoundingVolumeHierarchy(unittest.TestCase):
+
+    def setUp(self):
+        rand = random.Random(3)
+        self.lows = numpy.array([[rand.uniform(0, 100) for axis in range(3)]
+                                 for idx in range(400)])
+        self.highs = self.lows + numpy.array(
+            [[rand.uniform(0.5, 6) for axis in range(3)]
+             for idx in range(400)])
+        self.tree = textcad_engine.BoundingVolumeHierarchy(self.lows,
+                                                           self.highs)
+
+    def overlaps(self, first, second):
+        return all(self.lows[first] < self.highs[second])  \
+            and all(self.lows[second] < self.highs[first])
+
+    def test_pairs(self):
+        expect = [(a, b) for a in range(400) for b in range(a + 1, 400)
+                  if self.overlaps(a, b)]
+        self.assertTrue(expect)
+        self.assertEqual(expect, self.tree.pairs())
+
+    def test_query(self):
+        low, high = numpy.array([20, 30, 10]), numpy.array([60, 50, 90])
+        overlapping = [idx for idx in range(400)
+                       if all(self.lows[idx] < high)
+                       and all(low < self.highs[idx])]
+        inside = [idx for idx in range(400) if all(self.lows[idx] >= low)
+                  and all(self.highs[idx] <= high)]
+        self.assertEqual(overlapping, self.tree.query(low, high))
+        self.assertEqual(inside, self.tree.query(low, high, contained=True))
+        self.assertLess(len(inside), len(overlapping))
+
+    def test_empty(self):
+        tree = textcad_engine.BoundingVolumeHierarchy([], [])
+        self.assertEqual([], tree.pairs())
+        self.assertEqual([], tree.query([0, 0, 0], [1, 1, 1]))
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class TestAssemblyIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.eng = textcad_engine.OpenSCADEngine()
+
+    def test_parts(self):
+        index = textcad_engine.AssemblyIndex(self.eng, ASSEMBLY)
+        self.assertEqual(["tree.elements[0]", "tree.elements[1]",
+                          "tree.elements[2]", "tree.elements[3]",
+                          "tree.elements[4]"], index.paths)
+        numpy.testing.assert_allclose([[0, 5, 0], [5, 15, 10]],
+                                      [index.lows[2], index.highs[2]],
+                                      atol=1e-9)
+        # The difference is only as big as its sphere
+        numpy.testing.assert_allclose([3, 3, 3], index.lows[3])
+        clashes = index.clashes()
+        self.assertEqual([("tree.elements[0]", "tree.elements[2]"),
+                          ("tree.elements[0]", "tree.elements[3]"),
+                          ("tree.elements[1]", "tree.elements[4]"),
+                          ("tree.elements[2]", "tree.elements[3]")],
+                         [clash[:2] for clash in clashes])
+        self.assertAlmostEqual(250, clashes[0][2])
+        self.assertEqual(["tree.elements[0]", "tree.elements[3]"],
+                         index.region([0, 0, 0], [10, 10, 10],
+                                      contained=True))
+
+    def test_primitives(self):
+        index = textcad_engine.AssemblyIndex(self.eng, ASSEMBLY,
+                                             "primitives")
+        self.assertEqual(["tree.elements[0]", "tree.elements[1]",
+                          "tree.elements[2]", "tree.elements[3].elements[0]",
+                          "tree.elements[4].elements[0] (copy 0)",
+                          "tree.elements[4].elements[0] (copy 1)",
+                          "tree.elements[4].elements[0] (copy 2)"],
+                         index.paths)
+        numpy.testing.assert_allclose([14, 4, 48], index.lows[-1])
+        self.assertEqual(["tree.elements[4].elements[0] (copy 1)",
+                          "tree.elements[4].elements[0] (copy 2)"],
+                         index.region([0, 0, 20], [20, 20, 60]))
+
+    def test_root_wrappers(self):
+        tree = {"category": "element", "name": "frame",
+                "location": [100, 0, 0],
+                "construction": {"category": "operation", "name": "rotate",
+                                 "angle": 180, "axis": [0, 0, 1],
+                                 "elements": [ASSEMBLY]}}
+        index = textcad_engine.AssemblyIndex(self.eng, tree)
+        self.assertEqual("tree.construction.elements[0].elements[4]",
+                         index.paths[-1])
+        self.assertEqual(4, len(index.clashes()))
+        numpy.testing.assert_allclose([90, -10, 0], index.lows[0],
+                                      atol=1e-9)
+        with self.assertRaises(textcad_engine.SchemaError):
+            textcad_engine.AssemblyIndex(self.eng, dict(ASSEMBLY, name=1))
+
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "assembly.json")
+            with open(path, 'w') as f:
+                json.dump(ASSEMBLY, f)
+            result = subprocess.run(
+                [sys.executable, textcad_engine.__file__, "-o",
+                 os.path.join(tmp, "assembly.scad"), "--check-clashes",
+                 path],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True)
+            primitives = subprocess.run(
+                [sys.executable, textcad_engine.__file__, "--check-clashes",
+                 "--clash-level", "primitives", path],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True)
+        lines = result.stderr.splitlines()
+        self.assertEqual(0, result.returncode)
+        self.assertEqual("5 parts, 4 clash candidates", lines[0])
+        self.assertEqual("  tree.elements[0] x tree.elements[2]  250 shared",
+                         lines[1])
+        self.assertEqual(0, primitives.returncode)
+        self.assertRegex(primitives.stderr, r"^\d+ primitives, ")
+
+
+if __name__ == '__main__':
+    unittest.main()
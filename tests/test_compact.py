@@ -0,0 +1,115 @@
+#!/usr/bin/python3.3
+import textcad_engine
+import unittest
+import io
+import os
+import json
+import subprocess
+import sys
+import tempfile
+
+TREE = {"category": "operation", "name": "difference",
+        "elements": [
+            {"category": "element", "name": "cube", "size": [10, 10, 2],
+             "center": [True, True, False], "color": [0.5, 0.5, 0.5]},
+            {"category": "element", "name": "ntube", "apothem": 2,
+             "sides": 6, "height": 5, "center": [True, True, False]},
+            {"category": "operation", "name": "scale",
+             "multiplier": [1, 1, 1],
+             "elements": [{"category": "element", "name": "sphere",
+                           "radius": 1.25, "center": [True, True, True]}]}]}
+
+
+class TestCompactFormat(unittest.TestCase):
+
+    def setUp(self):
+        self.compact = textcad_engine.CompactFormat()
+
+    def test_numbers(self):
+        self.assertEqual("cylinder(r=4.618802, h=5, $fn=6);",
+                         self.compact.text("cylinder(r=4.618802153517006, "
+                                           "h=5.0, $fn=6);"))
+        self.assertEqual("translate(v=[-5, -0.5, 1e-06])",
+                         self.compact.text("translate(v=[-5.0, -0.5, "
+                                           "1e-06])"))
+        exact = textcad_engine.CompactFormat(precision=None)
+        self.assertEqual("r=4.618802153517006",
+                         exact.text("r=4.618802153517006"))
+        self.assertEqual("r=4.62", textcad_engine.CompactFormat(2)
+                         .text("r=4.618802153517006"))
+        # Names and strings holding digits are left as they are
+        self.assertEqual("part2_1.5(); import(\"v2.0.stl\");",
+                         self.compact.text("part2_1.5(); "
+                                           "import(\"v2.0.stl\");"))
+
+    def test_noops(self):
+        self.assertEqual("cube(size=[1, 1, 1]);",
+                         self.compact.text("translate(v=[0, 0, 0])"
+                                           "scale(v=[1, 1, 1])color([])"
+                                           "cube(size=[1, 1, 1]);"))
+        self.assertEqual("sphere(r=1);",
+                         self.compact.text("translate(v=[0.0, -0.0, 0.0])"
+                                           "rotate(a=0.0, v=[0, 0, 1])"
+                                           "sphere(r=1.0);"))
+        self.assertEqual("translate(v=[0, 0, 1])",
+                         self.compact.text("translate(v=[0, 0, 1])"))
+        # A modifier needs something to apply to, so its wrapper stays
+        self.assertEqual("#translate(v=[0, 0, 0]) {\n    cube(size=[1, 1, 1]);"
+                         "\n}\n",
+                         self.compact.text("#translate(v=[0.0, 0.0, 0.0]) {\n"
+                                           "    cube(size=[1, 1, 1]);\n}\n"))
+        self.assertEqual("%scale(v=1)color([0.5])sphere(r=1);",
+                         self.compact.text("%scale(v=1)color([0.5])"
+                                           "rotate(a=0, v=[0, 0, 1])"
+                                           "sphere(r=1);"))
+
+    def test_minify(self):
+        minify = textcad_engine.CompactFormat(minify=True)
+        self.assertEqual("module peg(){cube(size=[1,2,3]);}"
+                         "text(\"a, b\");",
+                         minify.text("module peg(){\n    cube(size=[1, 2, 3]);"
+                                     "\n}\ntext(\"a, b\");\n"))
+
+    def test_engine(self):
+        eng = textcad_engine.OpenSCADEngine()
+        plain = eng.parseJSON(TREE)
+        eng.compact = textcad_engine.CompactFormat()
+        sink = io.StringIO()
+        reports = eng.writeJSON(TREE, sink)
+        self.assertEqual(eng.compact.text(plain), sink.getvalue())
+        self.assertNotIn("scale(", sink.getvalue())
+        self.assertNotIn(".0,", sink.getvalue())
+        self.assertTrue(reports['CompactFormat'].startswith(
+            "output %d -> " % len(plain)))
+        # The cache holds the plain text and is compacted on the way out
+        with tempfile.TemporaryDirectory() as tmp:
+            eng.cache = textcad_engine.CompileCache(
+                os.path.join(tmp, "cache.sqlite"))
+            for _ in range(2):
+                sink = io.StringIO()
+                eng.writeJSON(TREE, sink)
+                self.assertEqual(eng.compact.text(plain), sink.getvalue())
+            eng.cache.close()
+
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "part.json")
+            with open(path, 'w') as f:
+                json.dump(TREE, f)
+            output = os.path.join(tmp, "part.scad")
+            result = subprocess.run(
+                [sys.executable, textcad_engine.__file__, path, "-o", output,
+                 "--minify", "--precision", "3"],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True)
+            with open(output) as f:
+                text = f.read()
+        self.assertEqual(0, result.returncode)
+        self.assertNotIn("\n", text)
+        self.assertIn("r=2.309", text)
+        self.assertRegex(result.stderr,
+                         r"output (\d+) -> (\d+) bytes \(\d+%\)")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/python3.3
+import textcad_engine
+from helpers import compiled
+import unittest
+import copy
+import io
+import os
+import json
+import subprocess
+import sys
+import tempfile
+
+BOLT = {"category": "operation", "name": "union", "elements": [
+    {"category": "element", "name": "ntube", "apothem": 1.5, "sides": 6,
+     "height": 1, "center": [True, True, False]},
+    {"category": "element", "name": "hole", "radius": 0.8, "height": 6,
+     "center": [True, True, False]}]}
+
+# Uses bolt from the library in turn
+PLATE = {"category": "operation", "name": "difference", "elements": [
+    {"category": "element", "name": "cube", "size": [10, 10, 2],
+     "center": [False, False, False]},
+    {"category": "element", "name": "bolt", "location": [5, 5, 0]}]}
+
+
+def design(inline=False):
+    """Two plates and a loose bolt, referenced or with constructions"""
+    bolt = {"category": "element", "name": "bolt", "location": [0, 0, 9]}
+    plate = {"category": "element", "name": "plate"}
+    if inline:
+        bolt['construction'] = BOLT
+        plate['construction'] = json.loads(json.dumps(PLATE))
+        plate['construction']['elements'][1]['construction'] = BOLT
+    return {"category": "operation", "name": "union", "elements": [
+        dict(plate, location=[0, 0, 0]), dict(plate, location=[20, 0, 0]),
+        bolt]}
+
+
+class TestComponentLibrary(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.write("bolt", BOLT)
+        self.write("plate", PLATE)
+        self.library = textcad_engine.ComponentLibrary(self.tmp.name)
+        self.eng = textcad_engine.OpenSCADEngine()
+        self.eng.library = self.library
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, tree):
+        with open(os.path.join(self.tmp.name, name + ".json"), 'w') as f:
+            json.dump(tree, f)
+
+    def test_resolve(self):
+        expect = textcad_engine.OpenSCADEngine().parseJSON(design(True))
+        self.assertEqual(expect, self.eng.parseJSON(design()))
+        self.assertEqual(expect, self.eng.parseJSON(design()))
+        self.assertEqual(2, self.library.loads)
+        # Compiled once for each level a component was emitted at
+        levels = lambda name: sorted(level for _, level
+                                     in self.library.entries[name]['texts'])
+        self.assertEqual([1], levels('plate'))
+        self.assertEqual([1, 2], levels('bolt'))
+        self.assertEqual(design(True), self.library.expand(design()))
+        self.assertIs(BOLT, self.library.expand(BOLT))
+
+    def test_eviction(self):
+        library = textcad_engine.ComponentLibrary(self.tmp.name,
+                                                  maxEntries=1)
+        self.eng.library = library
+        self.eng.parseJSON(design())
+        self.assertEqual(["bolt"], list(library.entries))
+        self.assertGreater(library.evictions, 0)
+        self.assertEqual({"components": 2, "loaded": 1,
+                          "loads": library.loads,
+                          "evictions": library.evictions}, library.stats())
+
+    def test_errors(self):
+        self.write("broken", {"category": "element", "name": "cube"})
+        self.write("loop", {"category": "element", "name": "loop"})
+        library = textcad_engine.ComponentLibrary(self.tmp.name)
+        self.eng.library = library
+        tree = {"category": "operation", "name": "union", "elements": [
+            {"category": "element", "name": "broken"}]}
+        with self.assertRaises(textcad_engine.SchemaError) as caught:
+            self.eng.parseJSON(tree)
+        self.assertTrue(str(caught.exception).startswith(
+            "tree.elements[0]: component 'broken': tree: "))
+        with self.assertRaisesRegex(textcad_engine.SchemaError,
+                                    "component 'loop' uses itself"):
+            self.eng.parseJSON({"category": "element", "name": "loop"})
+        with self.assertRaisesRegex(textcad_engine.SchemaError,
+                                    "custom element 'nut' needs a "
+                                    "construction"):
+            self.eng.parseJSON({"category": "element", "name": "nut"})
+
+    def test_options(self):
+        options = textcad_engine.CompileOptions(library=self.library)
+        sink = io.StringIO()
+        textcad_engine.compileTree(design(), sink, options)
+        self.assertEqual(self.eng.parseJSON(design()), sink.getvalue())
+        # Cached output is keyed by the files the library was made from
+        self.write("bolt", dict(BOLT, location=[1, 0, 0]))
+        changed = textcad_engine.OpenSCADEngine()
+        changed.library = textcad_engine.ComponentLibrary(self.tmp.name)
+        self.assertNotEqual(self.eng.options(), changed.options())
+
+    def test_optimized(self):
+        ball = {"category": "element", "name": "sphere", "radius": 10,
+                "center": [True, True, True]}
+        self.write("ball", ball)
+        library = textcad_engine.ComponentLibrary(self.tmp.name)
+        tree = {"category": "operation", "name": "union", "elements": [
+            {"category": "element", "name": "ball"},
+            {"category": "element", "name": "ball", "location": [30, 0, 0]}]}
+        inline = copy.deepcopy(tree)
+        for node in inline['elements']:
+            node['construction'] = ball
+        options = textcad_engine.CompileOptions(
+            library=library, resolution=textcad_engine.ResolutionPolicy(
+                "preview", facetBudget=500))
+        expect = textcad_engine.CompileOptions(
+            resolution=textcad_engine.ResolutionPolicy("preview",
+                                                       facetBudget=500))
+        # The policy and its budget apply inside components too
+        text = compiled(tree, options)
+        self.assertEqual(compiled(inline, expect), text)
+        self.assertNotIn("$fn=200", text)
+        stats = textcad_engine.CompileStats()
+        stats.compile(options.engine, tree, io.StringIO())
+        self.assertEqual(2, stats.nodes['element sphere'])
+        self.assertEqual(2, stats.cost['primitives'])
+        self.assertLessEqual(stats.cost['facets'], 500)
+        # Local passes run inside components, whose text is still reused
+        rounded = {"category": "operation", "name": "minkowski",
+                   "elements": [{"category": "element", "name": "cube",
+                                 "size": [4, 4, 1],
+                                 "center": [True, True, False]},
+                                ball]}
+        self.write("ball", rounded)
+        library = textcad_engine.ComponentLibrary(self.tmp.name)
+        for node in inline['elements']:
+            node['construction'] = rounded
+        text = compiled(tree, textcad_engine.CompileOptions(
+            library=library, hullRewrite=True))
+        self.assertEqual(compiled(inline, textcad_engine.CompileOptions(
+            hullRewrite=True)), text)
+        self.assertNotIn("minkowski", text)
+        self.assertEqual(1, len(library.entries['ball']['texts']))
+
+    def test_cli(self):
+        # Not a .json file, so not a component itself
+        path = os.path.join(self.tmp.name, "design.txt")
+        with open(path, 'w') as f:
+            json.dump(design(), f)
+        result = subprocess.run(
+            [sys.executable, textcad_engine.__file__, path, "--library",
+             self.tmp.name, "--verbose"],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True)
+        self.assertEqual(0, result.returncode)
+        # Nothing but the OpenSCAD text on stdout
+        self.assertEqual(self.eng.parseJSON(design()), result.stdout)
+        self.assertIn("textcad: loaded component 'plate'", result.stderr)
+        self.assertEqual(2, result.stderr.count(
+            "Found element 'plate' at level 1, using the library "
+            "component"))
+
+
+if __name__ == '__main__':
+    unittest.main()
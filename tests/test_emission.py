@@ -0,0 +1,90 @@
+#!/usr/bin/python3.3
+import textcad_engine
+import unittest
+import io
+
+PLATE = {"category": "operation", "name": "difference",
+         "elements": [
+             {"category": "element", "name": "cube", "size": [40, 20, 5],
+              "center": [True, True, False]},
+             {"category": "operation", "name": "translate",
+              "location": [5, 0, 0],
+              "elements": [
+                  {"category": "element", "name": "hole", "radius": 3,
+                   "height": 10, "center": [True, True, True]}]}]}
+
+PLATE_SCAD = "difference(){\n" \
+    "    translate(v=[-20.0, -10.0, 0])cube(size=[40, 20, 5]);\n" \
+    "    translate(v=[5, 0, 0])translate(v=[5, 0, 0]){\n" \
+    "        translate(v=[0, 0, -5.0])" \
+    "cylinder(r=3.105828541230249, h=10, $fn=12);\n" \
+    "    }\n" \
+    "\n" \
+    "}\n"
+
+
+class CountingStream(io.StringIO):
+
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+
+class TestEmission(unittest.TestCase):
+
+    def setUp(self):
+        self.eng = textcad_engine.OpenSCADEngine()
+
+    def test_parseJSON(self):
+        self.assertEqual(PLATE_SCAD, self.eng.parseJSON(PLATE))
+
+    def test_indent(self):
+        eng = textcad_engine.OpenSCADEngine(indent=1)
+        expect = "union(){\n cube(size=[1, 1, 1]);\n}\n"
+        data = {"category": "operation", "name": "union",
+                "elements": [{"category": "element", "name": "cube",
+                              "size": [1, 1, 1],
+                              "center": [False, False, False]}]}
+        self.assertEqual(expect, eng.parseJSON(data))
+
+    def test_writeJSON1(self):
+        stream = CountingStream()
+        self.eng.writeJSON(PLATE, stream)
+        self.assertEqual(PLATE_SCAD, stream.getvalue())
+        self.assertEqual(1, stream.writes)
+
+    def test_writeJSON2(self):
+        stream = CountingStream()
+        self.eng.writeJSON(PLATE, stream, flushSize=16)
+        self.assertEqual(PLATE_SCAD, stream.getvalue())
+        self.assertTrue(stream.writes > 1)
+
+    def test_deep_tree(self):
+        depth = 5000
+        node = {"category": "element", "name": "cube", "size": [1, 1, 1],
+                "center": [False, False, False]}
+        for i in range(depth):
+            node = {"category": "operation", "name": "union",
+                    "elements": [node]}
+        output = self.eng.parseJSON(node)
+        self.assertEqual(depth, output.count("union(){"))
+        self.assertTrue(output.endswith("}\n"))
+        self.assertEqual(0, self.eng.level)
+
+    def test_writer_flush(self):
+        stream = io.StringIO()
+        writer = textcad_engine.ScadWriter(stream, flushSize=4)
+        writer.write("ab")
+        self.assertEqual("", stream.getvalue())
+        writer.write("cd")
+        self.assertEqual("abcd", stream.getvalue())
+        writer.write("e")
+        writer.flush()
+        self.assertEqual("abcde", stream.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
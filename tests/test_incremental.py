@@ -0,0 +1,120 @@
+#!/usr/bin/python3.3
+import textcad_engine
+import unittest
+import io
+import json
+import os
+import tempfile
+
+
+def hole(location):
+    return {"category": "element", "name": "hole", "radius": 1, "height": 4,
+            "center": [True, True, False], "location": location}
+
+
+def plate():
+    return {"category": "operation", "name": "difference",
+            "elements": [{"category": "element", "name": "cube",
+                          "size": [20, 20, 2],
+                          "center": [False, False, False]},
+                         {"category": "operation", "name": "union",
+                          "elements": [hole([i, 5, 0])
+                                       for i in range(5)]}]}
+
+
+class TestSubtreeMemo(unittest.TestCase):
+
+    def setUp(self):
+        self.eng = textcad_engine.OpenSCADEngine()
+        self.memo = textcad_engine.SubtreeMemo()
+        self.eng.memo = self.memo
+
+    def test_identical(self):
+        expect = textcad_engine.OpenSCADEngine().parseJSON(plate())
+        self.assertEqual(expect, self.eng.parseJSON(plate()))
+        self.assertEqual(expect, self.eng.parseJSON(plate()))
+
+    def test_edit_path(self):
+        self.eng.parseJSON(plate())
+        self.memo.hits = self.memo.misses = 0
+        tree = plate()
+        tree['elements'][1]['elements'][2]['radius'] = 2
+        expect = textcad_engine.OpenSCADEngine().parseJSON(tree)
+        self.assertEqual(expect, self.eng.parseJSON(tree))
+        # the edited hole, its union and the difference
+        self.assertEqual(3, self.memo.misses)
+        self.assertEqual(5, self.memo.hits)
+
+    def test_insert(self):
+        self.eng.parseJSON(plate())
+        self.memo.hits = self.memo.misses = 0
+        tree = plate()
+        tree['elements'][1]['elements'].insert(2, hole([9, 9, 0]))
+        expect = textcad_engine.OpenSCADEngine().parseJSON(tree)
+        self.assertEqual(expect, self.eng.parseJSON(tree))
+        # the new hole, its union and the difference
+        self.assertEqual(3, self.memo.misses)
+
+    def test_shared_path(self):
+        first = plate()
+        self.eng.parseJSON(first)
+        self.memo.hits = self.memo.misses = 0
+        tree = dict(first, elements=[dict(first['elements'][0],
+                                          size=[9, 9, 9]),
+                                     first['elements'][1]])
+        expect = textcad_engine.OpenSCADEngine().parseJSON(tree)
+        self.assertEqual(expect, self.eng.parseJSON(tree))
+        self.assertEqual((1, 2), (self.memo.hits, self.memo.misses))
+
+    def test_invalid_edit(self):
+        expect = self.eng.parseJSON(plate())
+        tree = plate()
+        tree['elements'][1]['elements'][3]['radius'] = "wide"
+        with self.assertRaises(textcad_engine.SchemaError) as caught:
+            self.eng.parseJSON(tree)
+        self.assertEqual("tree.elements[1].elements[3].radius",
+                         caught.exception.path)
+        tree['elements'][1]['elements'][3]['radius'] = 1
+        tree['elements'][1]['elements'].append({"category": "element",
+                                                "name": "cube"})
+        with self.assertRaisesRegex(textcad_engine.SchemaError,
+                                    r"elements\[1\].elements\[5\]"):
+            self.eng.parseJSON(tree)
+        self.memo.hits = self.memo.misses = 0
+        self.assertEqual(expect, self.eng.parseJSON(plate()))
+        self.assertEqual(0, self.memo.misses)
+
+    def test_options_reset(self):
+        self.eng.parseJSON(plate())
+        self.eng.indent = 2
+        expect = textcad_engine.OpenSCADEngine(indent=2).parseJSON(plate())
+        self.assertEqual(expect, self.eng.parseJSON(plate()))
+
+
+class TestWatcher(unittest.TestCase):
+
+    def test_poll(self):
+        with tempfile.TemporaryDirectory() as root:
+            source = os.path.join(root, "part.json")
+            target = os.path.join(root, "part.scad")
+            with open(source, 'w') as f:
+                json.dump(hole([0, 0, 0]), f)
+            eng = textcad_engine.OpenSCADEngine()
+            watcher = textcad_engine.Watcher(eng, source, target)
+            self.assertIsNotNone(watcher.poll())
+            self.assertIsNone(watcher.poll())
+            with open(source, 'w') as f:
+                json.dump(hole([1, 0, 0]), f)
+            os.utime(source, ns=(0, 1))
+            self.assertIsNotNone(watcher.poll())
+            with open(target) as f:
+                self.assertTrue(f.read().startswith("translate(v=[1, 0, 0])"))
+            with open(source, 'w') as f:
+                f.write("{")
+            os.utime(source, ns=(0, 2))
+            report = io.StringIO()
+            self.assertFalse(watcher.rebuild(report))
+            self.assertIn("JSONDecodeError", report.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
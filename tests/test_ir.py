@@ -0,0 +1,111 @@
+#!/usr/bin/python3.3
+import textcad_engine
+import unittest
+import io
+import copy
+
+MIXED = {"category": "operation", "name": "union",
+         "modules": [{"name": "peg",
+                      "body": {"category": "element", "name": "cylinder",
+                               "radius": 1, "height": 4,
+                               "center": [True, True, False]}}],
+         "elements": [
+             {"category": "element", "name": "cone", "topRadius": 1,
+              "bottomRadius": 2, "height": 3, "center": [True, True, True],
+              "color": [1, 0, 0], "highlight": True},
+             {"category": "operation", "name": "rotate", "angle": 45,
+              "axis": [0, 0, 1], "scale": [2, 2, 2],
+              "elements": [{"category": "element", "name": "ntube",
+                            "apothem": 2, "sides": 6, "height": 1,
+                            "center": [False, False, False]}]},
+             {"category": "operation", "name": "resize",
+              "newsize": [10, 10, 10], "auto": [True, False, True],
+              "elements": [{"category": "element", "name": "sphere",
+                            "radius": 2, "center": [True, True, True],
+                            "fragments": 24}]},
+             {"category": "operation", "name": "mirror", "axis": None,
+              "elements": [{"category": "call", "name": "peg",
+                            "location": [1, 2, 3]}]},
+             {"category": "element", "name": "bolt",
+              "location": [0, 0, 9],
+              "construction": {"category": "element", "name": "hole",
+                               "radius": 2, "height": 5, "tolerance": 0.1,
+                               "center": [True, True, False]}},
+             {"category": ""}]}
+
+
+class TestLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.eng = textcad_engine.OpenSCADEngine()
+
+    def test_nodes(self):
+        model = self.eng.load(MIXED)
+        self.assertIsInstance(model.root, textcad_engine.Operation)
+        cone, rotate, resize, mirror, bolt, empty = model.root.elements
+        self.assertIsInstance(cone, textcad_engine.Cone)
+        self.assertEqual((("highlight", True), ("color", [1, 0, 0])),
+                         cone.placement)
+        self.assertEqual({"axis": [0, 0, 1], "angle": 45}, rotate.argument)
+        self.assertIsInstance(mirror.elements[0], textcad_engine.Call)
+        self.assertIsInstance(bolt.construction, textcad_engine.Hole)
+        self.assertIsInstance(empty, textcad_engine.Empty)
+        self.assertEqual("peg", model.modules[0][0])
+        self.assertFalse(hasattr(cone, '__dict__'))
+
+    def test_emission(self):
+        expect = io.StringIO()
+        writer = textcad_engine.ScadWriter(expect)
+        self.eng.emit(MIXED, writer)
+        writer.flush()
+        self.assertEqual(expect.getvalue(), self.eng.parseJSON(MIXED))
+
+    def test_error_path(self):
+        tree = copy.deepcopy(MIXED)
+        tree['elements'][1]['elements'][0]['sides'] = 6.5
+        with self.assertRaises(textcad_engine.SchemaError) as caught:
+            self.eng.load(tree)
+        self.assertEqual("tree.elements[1].elements[0].sides",
+                         caught.exception.path)
+        self.assertIn("expected an integer, got 6.5",
+                      str(caught.exception))
+
+    def test_errors(self):
+        cases = [
+            (["elements", 0, "center"], None,
+             "tree.elements[0].center", "a list of 3 booleans"),
+            (["elements", 4, "construction"], "bolt",
+             "tree.elements[4].construction", "expected an object"),
+            (["elements", 3, "location"], [1, 2],
+             "tree.elements[3].location", "a list of 3 numbers"),
+            (["modules", 0, "body", "category"], "shape",
+             "tree.modules[0].body", "unknown category"),
+            (["elements", 2, "elements"], {},
+             "tree.elements[2]", "needs a list of elements")]
+        for keys, value, path, message in cases:
+            tree = copy.deepcopy(MIXED)
+            node = tree
+            for key in keys[:-1]:
+                node = node[key]
+            node[keys[-1]] = value
+            with self.assertRaises(textcad_engine.SchemaError) as caught:
+                self.eng.load(tree)
+            self.assertEqual(path, caught.exception.path)
+            self.assertIn(message, str(caught.exception))
+        tree = copy.deepcopy(MIXED)
+        del tree['elements'][0]['height']
+        with self.assertRaisesRegex(textcad_engine.SchemaError,
+                                    r"elements\[0\]: missing 'height'"):
+            self.eng.load(tree)
+
+    def test_nothing_written(self):
+        tree = copy.deepcopy(MIXED)
+        tree['elements'][-2]['construction']['radius'] = "2"
+        sink = io.StringIO()
+        with self.assertRaises(ValueError):
+            self.eng.writeJSON(tree, sink, flushSize=1)
+        self.assertEqual("", sink.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/python3.3
+import textcad_engine
+from helpers import cube, union, compiled
+import unittest
+import io
+import os
+import json
+import random
+import tempfile
+import concurrent.futures
+
+
+def model(seed):
+    """A tree of repeated parts, nested wrappers and round primitives"""
+    rand = random.Random(seed)
+    part = lambda loc: {"category": "operation", "name": "union",
+                        "location": loc,
+                        "elements": [cube([1, 1, 1]), cube([1, 2, 1])]}
+    elements = [part([i * 3, 0, 0]) for i in range(rand.randint(2, 5))]
+    elements.append({"category": "operation", "name": "difference",
+                     "elements": [cube([10, 10, 10]),
+                                  cube([1, 1, 1], [50, 0, 0]),
+                                  {"category": "element",
+                                   "name": "cylinder", "radius": 2,
+                                   "height": 20,
+                                   "center": [True, True, True]}]})
+    elements.append({"category": "operation", "name": "translate",
+                     "location": [rand.randint(1, 9), 0, 0],
+                     "elements": [{"category": "element", "name": "sphere",
+                                   "radius": rand.randint(1, 4),
+                                   "center": [True, True, True]}]})
+    return union(elements)
+
+
+class TestCompileTree(unittest.TestCase):
+
+    def test_options(self):
+        tree = union([cube([1, 2, 3])])
+        self.assertEqual(textcad_engine.OpenSCADEngine().parseJSON(tree),
+                         compiled(tree))
+        options = textcad_engine.CompileOptions(indent=2)
+        self.assertEqual("union(){\n  cube(size=[1, 2, 3]);\n}\n",
+                         compiled(tree, options))
+
+    def test_reports(self):
+        options = textcad_engine.CompileOptions(
+            simplify=True, resolution=textcad_engine.ResolutionPolicy())
+        reports = textcad_engine.compileTree(model(0), io.StringIO(),
+                                             options)
+        self.assertEqual(["SimplifyPass", "ResolutionPolicy"],
+                         list(reports))
+        self.assertIn("1 subtrahends", reports['SimplifyPass'])
+
+    def test_engine_state(self):
+        eng = textcad_engine.OpenSCADEngine()
+        eng.parseJSON(model(1))
+        self.assertEqual(0, eng.level)
+
+    def test_concurrent(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest("NumPy is not installed")
+        tmp = tempfile.TemporaryDirectory()
+        cache = textcad_engine.CompileCache(os.path.join(tmp.name,
+                                                         "cache.sqlite"))
+        shared = [textcad_engine.CompileOptions(
+                      indent=indent, simplify=True, foldTransforms=True,
+                      dedup=True, dedupMinNodes=3,
+                      resolution=textcad_engine.ResolutionPolicy(
+                          "draft", facetBudget=2000))
+                  for indent in (2, 4)]
+        shared.append(textcad_engine.CompileOptions(cache=cache))
+        trees = [model(seed) for seed in range(8)]
+        originals = [json.dumps(tree, sort_keys=True) for tree in trees]
+        jobs = [(tree, options) for tree in trees for options in shared]
+        expect = [compiled(tree, options) for tree, options in jobs]
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda job: compiled(*job),
+                                        jobs * 25))
+        self.assertEqual(expect * 25, results)
+        self.assertEqual(originals,
+                         [json.dumps(tree, sort_keys=True) for tree in trees])
+        cache.close()
+        tmp.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
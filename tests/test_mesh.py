@@ -0,0 +1,148 @@
+#!/usr/bin/python3.3
+import textcad_engine
+import unittest
+import io
+import os
+import json
+import struct
+import subprocess
+import sys
+import tempfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def element(name, **fields):
+    return dict({"category": "element", "name": name,
+                 "center": [True, True, False]}, **fields)
+
+
+def volume(facets):
+    """Signed volume enclosed by facets, positive when they face out"""
+    return numpy.einsum('ij,ij->i', facets[:, 0],
+                        numpy.cross(facets[:, 1], facets[:, 2])).sum() / 6
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class TestMeshExport(unittest.TestCase):
+
+    def setUp(self):
+        self.eng = textcad_engine.OpenSCADEngine()
+        self.mesh = textcad_engine.MeshExport()
+
+    def test_primitives(self):
+        cube = self.mesh.triangles(self.eng, element("cube", size=[1, 2, 3]))
+        self.assertEqual(12, len(cube))
+        self.assertAlmostEqual(6, volume(cube))
+        numpy.testing.assert_allclose([[-0.5, -1, 0], [0.5, 1, 3]],
+                                      [cube.reshape(-1, 3).min(axis=0),
+                                       cube.reshape(-1, 3).max(axis=0)])
+        # $fn=20 for a radius of 1: twenty sides and two caps
+        cylinder = self.mesh.triangles(self.eng, element(
+            "cylinder", radius=1, height=2))
+        self.assertEqual(20 * 2 + 18 * 2, len(cylinder))
+        self.assertAlmostEqual(2 * 10 * numpy.sin(numpy.pi / 10),
+                               volume(cylinder))
+        # A hole of apothem 1 is a square
+        hole = self.mesh.triangles(self.eng, element("hole", radius=1,
+                                                     height=1))
+        self.assertAlmostEqual(4, volume(hole))
+        cone = self.mesh.triangles(self.eng, element(
+            "cone", topRadius=0, bottomRadius=1, height=3, fragments=8))
+        self.assertEqual(8 + 6, len(cone))
+
+    def test_sphere(self):
+        sphere = self.mesh.triangles(self.eng, dict(element(
+            "sphere", radius=2, fragments=10), center=[True, True, True]))
+        # Five rings of ten points, as OpenSCAD makes
+        points = numpy.unique(sphere.reshape(-1, 3).round(9), axis=0)
+        self.assertEqual(50, len(points))
+        self.assertEqual(5, len(numpy.unique(points[:, 2])))
+        self.assertGreater(volume(sphere), 0)
+        self.assertLess(volume(sphere), 4 / 3 * numpy.pi * 8)
+
+    def test_transforms(self):
+        part = element("ntube", apothem=1, sides=6, height=1,
+                       location=[0, 0, 5], rotation={"angle": 90,
+                                                     "axis": [1, 0, 0]})
+        tree = {"category": "operation", "name": "mirror", "axis": [1, 0, 0],
+                "elements": [{"category": "operation", "name": "linearArray",
+                              "count": 3, "step": [10, 0, 0],
+                              "elements": [part]}]}
+        facets = self.mesh.triangles(self.eng, tree)
+        self.assertEqual(3 * 20, len(facets))
+        # Mirrored copies still face outwards
+        self.assertAlmostEqual(3 * 2 * 3 ** 0.5, volume(facets))
+        self.assertAlmostEqual(-20 - 2 / 3 ** 0.5,
+                               facets.reshape(-1, 3)[:, 0].min())
+        # Folded or hoisted, the tree makes the same facets
+        for optimizer in (textcad_engine.TransformFoldPass(),
+                          textcad_engine.DeduplicatePass(minNodes=1)):
+            tree = {"category": "operation", "name": "union",
+                    "elements": [part, dict(part, location=[0, 0, -5])]}
+            optimized = optimizer.run(self.eng, tree)
+            numpy.testing.assert_allclose(
+                numpy.sort(self.mesh.triangles(self.eng, tree), axis=0),
+                numpy.sort(self.mesh.triangles(self.eng, optimized), axis=0),
+                atol=1e-9)
+
+    def test_blocker(self):
+        tree = {"category": "operation", "name": "union", "elements": [
+            element("cube", size=[1, 1, 1]),
+            {"category": "element", "name": "bracket", "construction": {
+                "category": "operation", "name": "difference",
+                "elements": [element("cube", size=[1, 1, 1])]}}]}
+        self.assertEqual("difference at tree.elements[1].construction",
+                         self.mesh.blocker(self.eng, tree))
+        self.assertIsNone(self.mesh.blocker(self.eng, tree['elements'][0]))
+
+    def test_write(self):
+        stream = io.BytesIO()
+        count = self.mesh.write(self.eng, element("cube", size=[1, 1, 1]),
+                                stream)
+        data = stream.getvalue()
+        self.assertEqual(12, count)
+        self.assertEqual(84 + 50 * 12, len(data))
+        self.assertFalse(data.startswith(b"solid"))
+        self.assertEqual(12, struct.unpack("<I", data[80:84])[0])
+        normal = struct.unpack("<3f", data[84:96])
+        self.assertEqual((0, 0, -1), normal)
+
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            union = os.path.join(tmp, "union.json")
+            with open(union, 'w') as f:
+                json.dump({"category": "operation", "name": "union",
+                           "elements": [element("cube", size=[1, 1, 1]),
+                                        element("cylinder", radius=1,
+                                                height=1)]}, f)
+            result = subprocess.run(
+                [sys.executable, textcad_engine.__file__, union, "-o",
+                 os.path.join(tmp, "union.scad"), "--stl",
+                 os.path.join(tmp, "union.stl")],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True)
+            self.assertEqual(0, result.returncode)
+            self.assertIn("wrote 88 facets", result.stderr)
+            self.assertEqual(84 + 50 * 88,
+                             os.path.getsize(os.path.join(tmp, "union.stl")))
+            difference = os.path.join(tmp, "difference.json")
+            with open(difference, 'w') as f:
+                json.dump({"category": "operation", "name": "difference",
+                           "elements": []}, f)
+            # Falls back to openscad, which need not be installed here
+            result = subprocess.run(
+                [sys.executable, textcad_engine.__file__, difference, "-o",
+                 os.path.join(tmp, "difference.scad"), "--stl",
+                 os.path.join(tmp, "difference.stl")],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True, env=dict(os.environ, PATH=tmp))
+        self.assertIn("difference at tree needs OpenSCAD", result.stderr)
+        self.assertIn("openscad not found", result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,331 @@
+#!/usr/bin/python3.3
+import textcad_engine
+from helpers import cube, union
+import unittest
+import io
+
+
+class TestDeduplicate(unittest.TestCase):
+
+    def setUp(self):
+        self.eng = textcad_engine.OpenSCADEngine()
+
+    def test_hoist(self):
+        part = lambda loc: union([cube([1, 1, 1]), cube([2, 2, 2])], loc)
+        tree = union([part([0, 0, 0]), part([5, 0, 0])])
+        dedup = textcad_engine.DeduplicatePass(minNodes=3)
+        self.eng.passes.append(dedup)
+        output = self.eng.parseJSON(tree)
+        self.assertEqual(1, len(dedup.hoisted))
+        name, size, count = dedup.hoisted[0]
+        self.assertEqual((3, 2), (size, count))
+        expect = "module " + name + "(){\n" \
+            "    union(){\n" \
+            "        cube(size=[1, 1, 1]);\n" \
+            "        cube(size=[2, 2, 2]);\n" \
+            "    }\n" \
+            "\n" \
+            "}\n" \
+            "union(){\n" \
+            "    " + name + "();\n" \
+            "    translate(v=[5, 0, 0])" + name + "();\n" \
+            "}\n"
+        self.assertEqual(expect, output)
+
+    def test_threshold(self):
+        tree = union([cube([1, 1, 1], [i, 0, 0]) for i in range(4)])
+        self.eng.passes.append(textcad_engine.DeduplicatePass(minNodes=2))
+        self.assertEqual(textcad_engine.OpenSCADEngine().parseJSON(tree),
+                         self.eng.parseJSON(tree))
+        self.eng.passes = [textcad_engine.DeduplicatePass(minNodes=1,
+                                                          minCount=5)]
+        self.assertNotIn("module", self.eng.parseJSON(tree))
+
+    def test_nested(self):
+        inner = lambda loc: union([cube([1, 1, 1]), cube([1, 2, 1])], loc)
+        outer = lambda loc: union([inner([0, 0, 0]), cube([3, 3, 3])], loc)
+        tree = union([outer([0, 0, i]) for i in range(3)])
+        dedup = textcad_engine.DeduplicatePass(minNodes=3)
+        self.eng.passes.append(dedup)
+        output = self.eng.parseJSON(tree)
+        self.assertEqual(1, len(dedup.hoisted))
+        self.assertEqual(1, output.count("cube(size=[1, 2, 1])"))
+
+    def test_existing_modules(self):
+        part = lambda loc: union([cube([1, 1, 1]), cube([2, 2, 2])], loc)
+        tree = union([part([0, 0, 0]), part([5, 0, 0])])
+        dedup = textcad_engine.DeduplicatePass(minNodes=3)
+        name = dedup.run(self.eng, tree)['modules'][0]['name']
+        # A module of the same name is kept, and copies inside it count
+        tree = union([part([0, 0, 0]),
+                      {"category": "call", "name": name}])
+        tree['modules'] = [{"name": name,
+                            "body": union([part([0, 0, 1]),
+                                           cube([3, 3, 3])])}]
+        result = dedup.run(self.eng, tree)
+        names = [module['name'] for module in result['modules']]
+        self.assertEqual(2, len(set(names)))
+        self.assertEqual(name, names[0])
+        self.assertEqual((3, 2), dedup.hoisted[0][1:])
+        self.assertEqual(names[1], result['modules'][0]['body']
+                         ['elements'][0]['name'])
+        self.eng.passes.append(dedup)
+        output = self.eng.parseJSON(tree)
+        self.assertEqual(1, output.count("cube(size=[2, 2, 2])"))
+        self.assertEqual(1, output.count("cube(size=[3, 3, 3])"))
+
+    def test_translate_location_kept(self):
+        part = lambda: {"category": "operation", "name": "translate",
+                        "location": [1, 2, 3],
+                        "elements": [cube([1, 1, 1]), cube([2, 2, 2])]}
+        tree = union([part(), part()])
+        self.eng.passes.append(textcad_engine.DeduplicatePass(minNodes=3))
+        output = self.eng.parseJSON(tree)
+        self.assertEqual(1, output.count("translate(v=[1, 2, 3]){"))
+
+@unittest.skipIf(textcad_engine.numpy is None, "requires NumPy")
+class TestTransformFold(unittest.TestCase):
+
+    def setUp(self):
+        self.eng = textcad_engine.OpenSCADEngine()
+        self.fold = textcad_engine.TransformFoldPass()
+        self.eng.passes.append(self.fold)
+
+    def test_translate_chain(self):
+        tree = {"category": "operation", "name": "translate",
+                "location": [1, 2, 3],
+                "elements": [{"category": "element", "name": "cube",
+                              "size": [2, 2, 2],
+                              "center": [True, True, True]}]}
+        expect = "multmatrix(m=[[1.0, 0.0, 0.0, 1.0], [0.0, 1.0, 0.0, 3.0], " \
+            "[0.0, 0.0, 1.0, 5.0], [0.0, 0.0, 0.0, 1.0]])" \
+            "cube(size=[2, 2, 2]);"
+        self.assertEqual(expect, self.eng.parseJSON(tree))
+        self.assertEqual(1, self.fold.removed)
+
+    def test_equivalence(self):
+        leaf = cube([1, 1, 1], [1, 0, 0])
+        leaf['rotation'] = {'angle': 30, 'axis': [1, 0, 0]}
+        tree = {"category": "operation", "name": "rotate", "angle": 90,
+                "axis": [0, 0, 1],
+                "elements": [{"category": "operation", "name": "scale",
+                              "multiplier": [2, 2, 2],
+                              "elements": [leaf]}]}
+        folded = self.fold.run(self.eng, tree)
+        self.assertEqual(["category", "name", "size", "center", "matrix"],
+                         list(folded.keys()))
+        matrix = textcad_engine.numpy.array(folded['matrix'])
+        # The cube's origin corner lands at rotate(scale([1, 0, 0]))
+        point = matrix @ [0, 0, 0, 1]
+        for expect, actual in zip([0, 2, 0, 1], point):
+            self.assertAlmostEqual(expect, actual)
+
+    def test_scalar_scale(self):
+        leaf = cube([1, 1, 1])
+        leaf['scale'] = 3
+        tree = {"category": "operation", "name": "scale", "multiplier": 2,
+                "elements": [leaf]}
+        folded = self.fold.run(self.eng, tree)
+        self.assertEqual([[6.0, 0.0, 0.0, 0.0], [0.0, 6.0, 0.0, 0.0],
+                          [0.0, 0.0, 6.0, 0.0], [0.0, 0.0, 0.0, 1.0]],
+                         folded['matrix'])
+        tree['multiplier'] = [2]
+        self.assertEqual(folded, self.fold.run(self.eng, tree))
+        # Bounds, clashes and meshes share the same matrices
+        low, high = textcad_engine.BoundsAnalysis().analyze(
+            self.eng, tree)[id(tree)]
+        self.assertEqual([0, 0, 0, 6, 6, 6], list(low) + list(high))
+
+    def test_group(self):
+        tree = union([cube([1, 1, 1]), cube([2, 2, 2], [0, 0, 0])],
+                     [4, 0, 0])
+        output = self.eng.parseJSON(tree)
+        self.assertTrue(output.startswith("multmatrix(m=[[1.0, 0.0, 0.0, 4.0]"))
+        self.assertEqual(1, output.count("multmatrix"))
+
+class TestResolution(unittest.TestCase):
+
+    def setUp(self):
+        self.eng = textcad_engine.OpenSCADEngine()
+
+    def sphere(self, radius):
+        return {"category": "element", "name": "sphere", "radius": radius,
+                "center": [True, True, True]}
+
+    def test_default(self):
+        datas = {'topRadius': 1.5, 'bottomRadius': 1, 'height': 2,
+                 'center': [True, True, False]}
+        expect = "cylinder(r1=1, r2=1.5, h=2, $fn=30);"
+        self.assertEqual(expect, self.eng.cone(datas))
+
+    def test_chord_error(self):
+        policy = textcad_engine.ResolutionPolicy(chordError=0.1,
+                                                 maxFragments=1000)
+        self.eng.resolution = policy
+        self.assertEqual("sphere(r=50, $fn=50);",
+                         self.eng.parseJSON(self.sphere(50)))
+        self.assertEqual(50, policy.chordFragments(50))
+
+    def test_limits(self):
+        policy = textcad_engine.ResolutionPolicy(
+            mode="preview", limits={"sphere": (40, 48)})
+        self.eng.resolution = policy
+        self.assertEqual("sphere(r=1, $fn=40);",
+                         self.eng.parseJSON(self.sphere(1)))
+        self.assertEqual("sphere(r=1000, $fn=48);",
+                         self.eng.parseJSON(self.sphere(1000)))
+
+    def test_budget(self):
+        tree = {"category": "operation", "name": "union",
+                "elements": [self.sphere(radius) for radius in (1, 10, 50)]}
+        policy = textcad_engine.ResolutionPolicy(facetBudget=3000)
+        self.eng.resolution = policy
+        output = self.eng.parseJSON(tree)
+        self.assertTrue(policy.after <= 3000 < policy.before)
+        self.assertIn("sphere(r=1, $fn=16);", output)
+        self.assertNotIn("$fn=1000", output)
+
+@unittest.skipIf(textcad_engine.numpy is None, "requires NumPy")
+class TestSimplify(unittest.TestCase):
+
+    def setUp(self):
+        self.eng = textcad_engine.OpenSCADEngine()
+        self.simplify = textcad_engine.SimplifyPass()
+        self.eng.passes.append(self.simplify)
+
+    def test_subtrahends(self):
+        tree = {"category": "operation", "name": "difference",
+                "elements": [cube([10, 10, 10]),
+                             cube([1, 1, 20], [2, 2, -5]),
+                             cube([1, 1, 1], [50, 0, 0]),
+                             cube([1, 1, 1], [10, 0, 0])]}
+        output = self.eng.parseJSON(tree)
+        self.assertNotIn("[50, 0, 0]", output)
+        self.assertIn("[10, 0, 0]", output)
+        self.assertEqual(1, self.simplify.removed['subtrahends'])
+
+    def test_empty_intersection(self):
+        tree = union([cube([1, 1, 1], [5, 0, 0]),
+                      {"category": "operation", "name": "intersection",
+                       "elements": [cube([1, 1, 1]),
+                                    cube([1, 1, 1], [0, 3, 0])]}])
+        expect = "translate(v=[5, 0, 0])cube(size=[1, 1, 1]);"
+        self.assertEqual(expect, self.eng.parseJSON(tree))
+        self.assertEqual(1, self.simplify.removed['intersections'])
+        self.assertEqual(1, self.simplify.removed['unwrapped'])
+
+    def test_flatten(self):
+        tree = union([cube([1, 1, 1]),
+                      union([cube([2, 2, 2]), cube([3, 3, 3])]),
+                      union([cube([4, 4, 4])], [1, 1, 1])])
+        expect = "union(){\n" \
+            "    cube(size=[1, 1, 1]);\n" \
+            "    cube(size=[2, 2, 2]);\n" \
+            "    cube(size=[3, 3, 3]);\n" \
+            "    translate(v=[1, 1, 1])cube(size=[4, 4, 4]);\n" \
+            "}\n"
+        self.assertEqual(expect, self.eng.parseJSON(tree))
+        self.assertEqual(1, self.simplify.removed['flattened'])
+
+    def test_analyze(self):
+        tree = union([cube([2, 2, 2], [1, 0, 0])], [0, 0, 3])
+        tree['rotation'] = {'angle': 90, 'axis': [0, 0, 1]}
+        boxes = self.simplify.analyze(self.eng, tree)
+        low, high = boxes[id(tree)]
+        for expect, actual in zip([-2, 1, 3, 0, 3, 5],
+                                  list(low) + list(high)):
+            self.assertAlmostEqual(expect, actual)
+
+
+class TestHullRewrite(unittest.TestCase):
+
+    def setUp(self):
+        self.eng = textcad_engine.OpenSCADEngine()
+        self.rewrite = textcad_engine.HullRewritePass()
+        self.eng.passes.append(self.rewrite)
+
+    def minkowski(self, elements, **fields):
+        return dict({"category": "operation", "name": "minkowski",
+                     "elements": elements}, **fields)
+
+    def test_minkowski(self):
+        rounded = cube([10, 20, 5], [1, 2, 3])
+        rounded['center'] = [True, True, False]
+        tree = self.minkowski(
+            [{"category": "element", "name": "cylinder", "radius": 1,
+              "height": 2, "center": [True, True, False],
+              "location": [0, 0, -1]}, rounded], color=[1, 0, 0])
+        output = self.eng.parseJSON(tree)
+        self.assertTrue(output.startswith("color([1, 0, 0])hull(){\n"))
+        self.assertNotIn("minkowski", output)
+        self.assertIn("translate(v=[-4.0, -8.0, 2])cylinder(r=1, h=2", output)
+        self.assertIn("translate(v=[6.0, 12.0, 7])cylinder(r=1, h=2", output)
+        self.assertEqual(8, output.count("cylinder"))
+        self.assertEqual(1, self.rewrite.rewritten['minkowski'])
+        self.assertLess(self.rewrite.after, self.rewrite.before)
+        # Nothing to rewrite leaves the tree as it was
+        plain = union([cube([1, 1, 1])])
+        self.assertIs(plain, self.rewrite.run(self.eng, plain))
+        self.assertEqual("", self.rewrite.report())
+
+    def test_kept(self):
+        sphere = {"category": "element", "name": "sphere", "radius": 1,
+                  "center": [True, True, True]}
+        trees = [self.minkowski([sphere, dict(sphere, radius=2)]),
+                 self.minkowski([cube([1, 1, 1]), union([sphere])]),
+                 self.minkowski([cube([1, 1, 1]),
+                                 dict(sphere, highlight=True)])]
+        for tree in trees:
+            self.assertEqual(self.eng.parseJSON(tree),
+                             textcad_engine.OpenSCADEngine().parseJSON(tree))
+
+    @unittest.skipIf(textcad_engine.numpy is None, "requires NumPy")
+    def test_placed_cube(self):
+        turned = cube([2, 4, 6], [5, 0, 0])
+        turned['rotation'] = {"angle": 90, "axis": [0, 0, 1]}
+        turned['scale'] = [2, 1, 1]
+        tree = self.minkowski([turned, {"category": "element",
+                                        "name": "sphere", "radius": 1,
+                                        "center": [True, True, True]}])
+        rewritten = self.rewrite.run(self.eng, tree)
+        self.assertEqual("hull", rewritten['name'])
+        bounds = textcad_engine.BoundsAnalysis()
+        for expect, actual in zip(bounds.analyze(self.eng, tree)[id(tree)],
+                                  bounds.analyze(self.eng, rewritten)
+                                  [id(rewritten)]):
+            textcad_engine.numpy.testing.assert_allclose(expect, actual)
+
+    def test_flatten(self):
+        tree = {"category": "operation", "name": "hull", "elements": [
+            cube([1, 1, 1]),
+            {"category": "operation", "name": "hull", "elements": [
+                cube([2, 2, 2]), union([cube([3, 3, 3])])]},
+            union([cube([4, 4, 4])], [1, 1, 1])]}
+        expect = "hull(){\n" \
+            "    cube(size=[1, 1, 1]);\n" \
+            "    cube(size=[2, 2, 2]);\n" \
+            "    cube(size=[3, 3, 3]);\n" \
+            "    translate(v=[1, 1, 1])union(){\n" \
+            "        cube(size=[4, 4, 4]);\n" \
+            "    }\n\n" \
+            "}\n"
+        self.assertEqual(expect, self.eng.parseJSON(tree))
+        self.assertEqual({"minkowski": 0, "hulls": 1, "unions": 1},
+                         self.rewrite.rewritten)
+        self.assertIn("flattened 1 hulls and 1 unions",
+                      self.rewrite.report())
+
+    def test_options(self):
+        tree = self.minkowski([cube([1, 1, 1]), cube([2, 2, 2])])
+        sink = io.StringIO()
+        reports = textcad_engine.compileTree(tree, sink)
+        self.assertTrue(sink.getvalue().startswith("hull()"))
+        self.assertIn('HullRewritePass', reports)
+        sink = io.StringIO()
+        textcad_engine.compileTree(tree, sink, textcad_engine.CompileOptions(
+            hullRewrite=False))
+        self.assertTrue(sink.getvalue().startswith("minkowski()"))
+
+
+if __name__ == '__main__':
+    unittest.main()
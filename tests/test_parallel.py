@@ -0,0 +1,126 @@
+#!/usr/bin/python3.3
+import textcad_engine
+import unittest
+import io
+import os
+import json
+import subprocess
+import sys
+import tempfile
+
+
+def part(idx):
+    location = [idx, idx % 3, 0]
+    if idx % 4 == 0:
+        return {"category": "element", "name": "bolt", "location": location,
+                "construction": {"category": "element", "name": "hole",
+                                 "radius": 1, "height": 4,
+                                 "center": [True, True, False]}}
+    if idx % 4 == 1:
+        return {"category": "operation", "name": "linearArray", "count": 3,
+                "step": [0, 2, 0], "location": location,
+                "elements": [{"category": "element", "name": "sphere",
+                              "radius": 1, "center": [True, True, True]}]}
+    if idx % 4 == 2:
+        return {"category": "call", "name": "peg", "location": location}
+    return {"category": "operation", "name": "difference",
+            "color": [1, 0, 0], "location": location,
+            "elements": [{"category": "element", "name": "cube",
+                          "size": [2, 2, 2], "center": [True, True, True]},
+                         {"category": "element", "name": "cylinder",
+                          "radius": 0.5, "height": 3,
+                          "center": [True, True, True]}]}
+
+
+def model(width):
+    inner = {"category": "operation", "name": "intersection",
+             "elements": [part(idx) for idx in range(width)]}
+    return {"category": "operation", "name": "union",
+            "modules": [{"name": "peg",
+                         "body": {"category": "element", "name": "cube",
+                                  "size": [1, 1, 3],
+                                  "center": [False, False, False]}}],
+            "elements": [part(idx) for idx in range(width)]
+            + [{"category": "operation", "name": "translate",
+                "location": [0, 0, 9], "elements": [inner]}]}
+
+
+class TestParallelEmitter(unittest.TestCase):
+
+    def setUp(self):
+        self.serial = textcad_engine.OpenSCADEngine()
+        self.emitter = textcad_engine.ParallelEmitter(2, threshold=10)
+        self.eng = textcad_engine.OpenSCADEngine()
+        self.eng.parallel = self.emitter
+
+    def test_identical(self):
+        for width in (9, 10, 37):
+            tree = model(width)
+            self.assertEqual(self.serial.parseJSON(tree),
+                             self.eng.parseJSON(tree))
+        # A wide operation below a narrow one fans out in its place
+        tree = model(30)['elements'][-1]
+        self.assertEqual(self.serial.parseJSON(tree),
+                         self.eng.parseJSON(tree))
+        # Workers emit nested wide operations serially
+        self.assertEqual(4, self.emitter.fanouts)
+
+    def test_threshold(self):
+        tree = model(8)
+        self.assertEqual(self.serial.parseJSON(tree),
+                         self.eng.parseJSON(tree))
+        self.assertEqual(0, self.emitter.fanouts)
+        self.eng.parallel = textcad_engine.ParallelEmitter(1, threshold=1)
+        self.assertEqual(self.serial.parseJSON(tree),
+                         self.eng.parseJSON(tree))
+        self.assertEqual(0, self.eng.parallel.fanouts)
+
+    def test_options(self):
+        tree = model(40)
+        options = textcad_engine.CompileOptions(
+            indent=2, dedup=True, resolution=textcad_engine.ResolutionPolicy(
+                "draft", facetBudget=5000), parallel=self.emitter)
+        expect = textcad_engine.CompileOptions(
+            indent=2, dedup=True, resolution=textcad_engine.ResolutionPolicy(
+                "draft", facetBudget=5000))
+        texts = []
+        for settings in (expect, options):
+            sink = io.StringIO()
+            textcad_engine.compileTree(tree, sink, settings)
+            texts.append(sink.getvalue())
+        self.assertEqual(texts[0], texts[1])
+        self.assertEqual(1, self.emitter.fanouts)
+
+    def test_cli(self):
+        """Workers neither lose nor repeat anything logged"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "wide.json")
+            output = os.path.join(tmp, "wide.scad")
+            with open(path, 'w') as f:
+                json.dump(model(50), f)
+            result = subprocess.run(
+                [sys.executable, textcad_engine.__file__, path, "-o", output,
+                 "--emit-workers", "3", "--emit-threshold", "20",
+                 "--verbose"],
+                stderr=subprocess.PIPE, universal_newlines=True)
+            self.assertEqual(0, result.returncode)
+            with open(output) as f:
+                self.assertEqual(self.serial.parseJSON(model(50)), f.read())
+        self.assertEqual(26, result.stderr.count("Found element 'bolt'"))
+
+    def test_flag_before_input(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "wide.json")
+            with open(path, 'w') as f:
+                json.dump(model(50), f)
+            result = subprocess.run(
+                [sys.executable, textcad_engine.__file__, "--emit-threshold",
+                 "20", "--emit-workers", "0", path],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True)
+        self.assertEqual(0, result.returncode, result.stderr)
+        self.assertEqual(self.serial.parseJSON(model(50)), result.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/python3.3
+import textcad_engine
+from helpers import instance
+import unittest
+import io
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def expr(text):
+    return {"expression": text}
+
+
+TEMPLATE = {
+    "category": "operation", "name": "difference",
+    "parameters": {"width": 40, "wall": 2, "inner": "width - 2 * wall",
+                   "bolt": 1.5, "bolts": "max(3, floor(inner / 8))"},
+    "elements": [
+        {"category": "element", "name": "cube",
+         "size": [expr("width"), expr("width"), 5],
+         "center": [True, True, False]},
+        {"category": "operation", "name": "polarArray",
+         "count": {"parameter": "bolts"}, "radius": expr("inner / 2"),
+         "elements": [{"category": "element", "name": "hole",
+                       "radius": expr("bolt"), "height": 10,
+                       "center": [True, True, False]}]},
+        {"category": "element", "name": "cylinder",
+         "radius": expr("sqrt(2) * 4"), "height": 6,
+         "center": [True, True, False], "location": [0, 0, expr("wall")]}]}
+
+
+class TestExpression(unittest.TestCase):
+
+    def test_folding(self):
+        folded = textcad_engine.Expression("2 * pi * (3 + 1)")
+        self.assertTrue(folded.constant)
+        self.assertEqual(8 * math.pi, folded.value)
+        mixed = textcad_engine.Expression("-radius * 2 + sqrt(16) // 3")
+        self.assertEqual({"radius"}, mixed.names)
+        self.assertEqual(-5, mixed.evaluate({"radius": 3}))
+        self.assertEqual(5.5, textcad_engine.Expression(
+            "hypot(a, 4) + a % 2 / 2").evaluate({"a": 3}))
+
+    def test_unsafe(self):
+        for text in ("__import__('os')", "a.real", "(lambda: 1)()",
+                     "'text'", "a < b", "[1, 2]", "max(*a)", "1 / 0",
+                     "2 ** 100000", "abs(a, key=1)", "a +"):
+            with self.assertRaises(ValueError):
+                textcad_engine.Expression(text)
+        with self.assertRaises(ValueError):
+            textcad_engine.Expression("a ** 5000").evaluate({"a": 2})
+        # Each exponent is small, but the nested result is not
+        with self.assertRaises(ValueError):
+            textcad_engine.Expression("(10 ** 1000) ** 1000")
+        with self.assertRaises(ValueError):
+            textcad_engine.Expression("(a ** 1000) ** 1000").evaluate(
+                {"a": 10})
+        self.assertEqual(10 ** 1000,
+                         textcad_engine.Expression("(10 ** 10) ** 100").value)
+        # A negative base to a fractional exponent has no real value
+        with self.assertRaisesRegex(ValueError, "not a real number"):
+            textcad_engine.Expression("(-8) ** (1 / 3)")
+        with self.assertRaisesRegex(ValueError, "not a real number"):
+            textcad_engine.Expression("a ** (1 / 3)").evaluate({"a": -8})
+        self.assertEqual(-8, textcad_engine.Expression("(-2) ** 3").value)
+
+
+class TestParameters(unittest.TestCase):
+
+    def test_graph(self):
+        parameters = textcad_engine.Parameters(
+            {"d": "b + c", "b": "a * 2", "c": 3, "a": 1, "e": "c"})
+        order = parameters.order
+        self.assertLess(order.index("a"), order.index("b"))
+        self.assertLess(order.index("b"), order.index("d"))
+        self.assertEqual({"a": 1, "b": 2, "c": 3, "d": 5, "e": 3},
+                         parameters.evaluate())
+        self.assertEqual({"a", "b", "d"}, parameters.downstream(["a"]))
+        values = parameters.evaluate()
+        changed = parameters.redefine("a", 2)
+        self.assertEqual(({"a": 2, "b": 4, "c": 3, "d": 7, "e": 3},
+                          {"a", "b", "d"}),
+                         changed.update(values, ["a"]))
+        self.assertEqual(1, parameters.definitions['a'])
+
+    def test_errors(self):
+        with self.assertRaisesRegex(textcad_engine.SchemaError,
+                                    r"tree.parameters.a: cycle a -> b -> "
+                                    "c -> a"):
+            textcad_engine.Parameters({"a": "b", "b": "c + 1", "c": "a"})
+        with self.assertRaisesRegex(textcad_engine.SchemaError,
+                                    "tree.parameters.b: unknown parameter "
+                                    "'x'"):
+            textcad_engine.Parameters({"b": "x + 1"}).evaluate()
+        with self.assertRaisesRegex(textcad_engine.SchemaError,
+                                    "expected a number or an expression"):
+            textcad_engine.Parameters({"b": [1]})
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class TestParametricModel(unittest.TestCase):
+
+    def setUp(self):
+        self.eng = textcad_engine.OpenSCADEngine()
+        self.model = textcad_engine.ParametricModel(self.eng, TEMPLATE)
+
+    def expected(self):
+        return self.eng.parseJSON(instance(TEMPLATE, self.model.values))
+
+    def test_set(self):
+        self.assertEqual(self.expected(), self.model.text())
+        self.assertEqual({"bolt"}, self.model.set("bolt", 2))
+        self.assertEqual(1, self.model.rendered)
+        self.assertEqual(self.expected(), self.model.text())
+        self.assertEqual({"wall", "inner"}, self.model.set("wall", 3))
+        self.assertEqual(2, self.model.rendered)
+        self.assertEqual(self.expected(), self.model.text())
+        self.assertEqual(set(), self.model.set("width", 40))
+        self.assertEqual(0, self.model.rendered)
+        self.model.set("bolts", "floor(width / 5)")
+        self.assertEqual(8, self.model.values['bolts'])
+        sink = io.StringIO()
+        self.model.write(sink, flushSize=1)
+        self.assertEqual(self.expected(), sink.getvalue())
+
+    def test_invalid_set(self):
+        before = self.model.text()
+        cases = [("wall", "inner", "cycle wall -> inner -> wall"),
+                 ("bolts", "inner / 8", "expected a positive integer"),
+                 ("wall", "width / 0", "division by zero"),
+                 ("bolt", "os.system", "is not allowed")]
+        for name, value, message in cases:
+            with self.assertRaisesRegex(textcad_engine.SchemaError, message):
+                self.model.set(name, value)
+        self.assertEqual(before, self.model.text())
+        self.assertEqual(2, self.model.values['wall'])
+
+    def test_sweep(self):
+        rows = [[30, 1], [60, 3]]
+        texts = list(textcad_engine.Sweep(self.eng, TEMPLATE).texts(
+            ["width", "wall"], rows))
+        for row, text in zip(rows, texts):
+            values = textcad_engine.Parameters(
+                TEMPLATE['parameters']).evaluate(zip(["width", "wall"], row))
+            self.assertEqual(self.eng.parseJSON(instance(TEMPLATE, values)),
+                             text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/python3.3
+import textcad_engine
+import unittest
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# Stands in for openscad: writes a fake STL named after the text it
+# was given, or misbehaves when the text asks it to
+STUB = """#!{python}
+import sys, time, hashlib
+args = sys.argv[1:]
+output = args[args.index("-o") + 1]
+text = open(args[-1]).read()
+with open({log!r}, "a") as log:
+    log.write(text + "\\n")
+if "sleep" in text:
+    time.sleep(30)
+if "fail" in text:
+    sys.stderr.write("ERROR: Parser error in line 1\\n")
+    sys.exit(1)
+if "nothing" in text:
+    sys.exit(0)
+sys.stderr.write("Rendering Polygon Mesh using CGAL...\\n")
+with open(output, "w") as out:
+    out.write("solid " + hashlib.sha256(text.encode()).hexdigest()[:8] + "\\n")
+"""
+
+
+class TestRenderPool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        binDir = os.path.join(self.root, "bin")
+        os.makedirs(binDir)
+        self.log = os.path.join(self.root, "calls.log")
+        stub = os.path.join(binDir, "openscad")
+        with open(stub, 'w') as f:
+            f.write(STUB.format(python=sys.executable, log=self.log))
+        os.chmod(stub, 0o755)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = binDir + os.pathsep + self.path
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        self.tmp.cleanup()
+
+    def output(self, name):
+        return os.path.join(self.root, name)
+
+    def calls(self):
+        if not os.path.exists(self.log):
+            return 0
+        with open(self.log) as log:
+            return len(log.read().splitlines())
+
+    def test_render(self):
+        pool = textcad_engine.RenderPool()
+        result = pool.render("cube(size=[1, 2, 3]);", self.output("a.stl"))
+        self.assertTrue(result.ok, result.error)
+        self.assertEqual(0, result.returncode)
+        self.assertIn("CGAL", result.stderr)
+        self.assertGreater(result.wallTime, 0)
+        if hasattr(os, "wait4"):
+            self.assertGreater(result.peakMemory, 1000000)
+        with open(self.output("a.stl")) as stl:
+            self.assertTrue(stl.read().startswith("solid "))
+        self.assertIn("a.stl: rendered in", result.describe())
+
+    def test_failures(self):
+        pool = textcad_engine.RenderPool(timeout=0.5)
+        cases = [("fail();", "exited with 1: ERROR: Parser error"),
+                 ("nothing();", "wrote no output"),
+                 ("sleep();", "timed out after 0.5s")]
+        for text, message in cases:
+            result = pool.render(text, self.output("bad.stl"))
+            self.assertFalse(result.ok)
+            self.assertIn(message, result.error)
+            self.assertFalse(os.path.exists(self.output("bad.stl")))
+        self.assertLess(result.wallTime, 10)
+        self.assertIsNone(result.returncode)
+        missing = textcad_engine.RenderPool(executable="no-such-openscad")
+        self.assertIn("not found on PATH",
+                      missing.render("cube();", self.output("c.stl")).error)
+
+    def test_cache(self):
+        cacheDir = self.output("cache")
+        texts = ["cube();", "sphere();", "fail();"]
+        jobs = [(texts[idx % 3], self.output(str(idx) + ".stl"))
+                for idx in range(9)]
+        pool = textcad_engine.RenderPool(workers=4, cacheDir=cacheDir)
+        results = pool.renderAll(jobs)
+        self.assertEqual([idx % 3 != 2 for idx in range(9)],
+                         [result.ok for result in results])
+        self.assertEqual(2 + 3, pool.renders)
+        self.assertEqual(4, pool.hits)
+        with open(self.output("0.stl")) as first, \
+                open(self.output("3.stl")) as second:
+            self.assertEqual(first.read(), second.read())
+        again = textcad_engine.RenderPool(cacheDir=cacheDir)
+        self.assertTrue(again.render("cube();", self.output("x.stl")).cached)
+        self.assertEqual(0, again.renders)
+        result = again.render("cube();", self.output("x.3mf"))
+        self.assertFalse(result.cached)
+        self.assertEqual(6, self.calls())
+
+    def test_command_line(self):
+        source = self.output("part.json")
+        with open(source, 'w') as f:
+            json.dump({"category": "element", "name": "cube",
+                       "size": [1, 1, 1], "center": [False, False, False]},
+                      f)
+        script = os.path.join(os.path.dirname(__file__), "..",
+                              "textcad_engine.py")
+        run = subprocess.run([sys.executable, script, "--render",
+                              self.output("part.stl"), "-o",
+                              self.output("part.scad"), source],
+                             stderr=subprocess.PIPE, universal_newlines=True)
+        self.assertEqual(0, run.returncode, run.stderr)
+        self.assertIn("part.stl: rendered in", run.stderr)
+        with open(self.output("part.scad")) as scad:
+            self.assertEqual("cube(size=[1, 1, 1]);", scad.read())
+        self.assertTrue(os.path.exists(self.output("part.stl")))
+
+    def test_render_cache_flag(self):
+        source = self.output("part.json")
+        with open(source, 'w') as f:
+            json.dump({"category": "element", "name": "cube",
+                       "size": [1, 1, 1], "center": [False, False, False]},
+                      f)
+        for name in ("first.stl", "second.stl"):
+            run = subprocess.run([sys.executable, textcad_engine.__file__,
+                                  "--render", self.output(name),
+                                  "--render-cache", self.output("renders"),
+                                  source],
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE,
+                                 universal_newlines=True)
+            self.assertEqual(0, run.returncode, run.stderr)
+            self.assertEqual("cube(size=[1, 1, 1]);", run.stdout)
+        self.assertEqual(1, self.calls())
+        self.assertTrue(os.path.isdir(self.output("renders")))
+
+
+if __name__ == '__main__':
+    unittest.main()
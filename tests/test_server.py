@@ -0,0 +1,184 @@
+#!/usr/bin/python3.3
+import textcad_engine
+from helpers import compiled
+import textcad_client
+import unittest
+import asyncio
+import os
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import concurrent.futures
+
+TREE = {"category": "operation", "name": "union",
+        "elements": [{"category": "element", "name": "cylinder",
+                      "radius": 2, "height": 5,
+                      "center": [True, True, False]},
+                     {"category": "element", "name": "cube",
+                      "size": [1, 2, 3], "location": [4, 0, 0],
+                      "center": [False, False, False]}]}
+
+
+class TestCompileServer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.socket = os.path.join(self.tmp.name, "textcad.sock")
+        self.cache = textcad_engine.CompileCache(
+            os.path.join(self.tmp.name, "cache.sqlite"))
+        self.server = textcad_engine.CompileServer(self.cache, workers=4)
+        self.thread = threading.Thread(
+            target=asyncio.run, args=(self.server.serveUnix(self.socket),))
+        self.thread.start()
+        deadline = time.time() + 10
+        while not os.path.exists(self.socket) and time.time() < deadline:
+            time.sleep(0.01)
+
+    def tearDown(self):
+        textcad_client.request({"op": "shutdown"}, self.socket)
+        self.thread.join(10)
+        self.assertFalse(os.path.exists(self.socket))
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def request(self, message):
+        return textcad_client.request(message, self.socket)
+
+    def test_compile(self):
+        response = self.request({"id": 7, "tree": TREE})
+        self.assertEqual({"id": 7, "ok": True, "output": compiled(TREE),
+                          "reports": {}}, response)
+        path = os.path.join(self.tmp.name, "part.json")
+        with open(path, 'w') as f:
+            json.dump(TREE, f)
+        options = {"indent": 2, "resolution": "draft"}
+        response = self.request({"op": "compile", "path": path,
+                                 "options": options})
+        expect = textcad_engine.CompileOptions(
+            indent=2, resolution=textcad_engine.ResolutionPolicy("draft"))
+        self.assertEqual(compiled(TREE, expect), response['output'])
+        self.assertIn("ResolutionPolicy", response['reports'])
+
+    def test_parameters(self):
+        template = {"category": "element", "name": "sphere",
+                    "parameters": {"r": 3}, "radius": {"parameter": "r"},
+                    "center": [True, True, True]}
+        response = self.request({"tree": template})
+        del template['parameters']
+        self.assertEqual(compiled(dict(template, radius=3)),
+                         response['output'])
+
+    def test_errors(self):
+        bad = dict(TREE, elements=[dict(TREE['elements'][0], radius="2")])
+        cases = [({"tree": bad}, "SchemaError: tree.elements[0].radius"),
+                 ({"path": os.path.join(self.tmp.name, "missing.json")},
+                  "FileNotFoundError"),
+                 ({"tree": TREE, "options": {"indent": "x"}},
+                  "ValueError: bad option"),
+                 ({"op": "render"}, "ValueError: unknown op"),
+                 ({}, "ValueError: a compile needs a tree or a path")]
+        for message, error in cases:
+            response = self.request(dict(message, id=1))
+            self.assertFalse(response['ok'])
+            self.assertEqual(1, response['id'])
+            self.assertTrue(response['error'].startswith(error),
+                            response['error'])
+        stats = self.request({"op": "stats"})['stats']
+        self.assertEqual(len(cases), stats['errors'])
+
+    def test_concurrent(self):
+        trees = [dict(TREE, location=[idx, 0, 0]) for idx in range(16)]
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            responses = list(executor.map(
+                lambda tree: self.request({"tree": tree}), trees * 4))
+        self.assertEqual([compiled(tree) for tree in trees] * 4,
+                         [response['output'] for response in responses])
+        stats = self.request({"op": "stats"})['stats']
+        self.assertEqual(64, stats['compiles'])
+        self.assertEqual(64, stats['cache']['misses']
+                         + stats['cache']['hits'])
+        self.assertGreater(stats['cache']['hits'], 0)
+
+    def test_pipelined(self):
+        """Several requests on one connection are all answered"""
+        import socket
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(self.socket)
+        lines = [json.dumps({"id": idx, "tree": TREE}) for idx in range(5)]
+        client.sendall(("\n".join(lines) + "\n").encode())
+        client.shutdown(socket.SHUT_WR)
+        data = b""
+        while True:
+            chunk = client.recv(1 << 16)
+            if not chunk:
+                break
+            data += chunk
+        client.close()
+        responses = [json.loads(line) for line in data.splitlines()]
+        self.assertEqual(list(range(5)),
+                         sorted(response['id'] for response in responses))
+
+    def test_client(self):
+        client = os.path.join(os.path.dirname(textcad_client.__file__),
+                              "textcad_client.py")
+        result = subprocess.run([sys.executable, client, "-s", self.socket],
+                                input=json.dumps(TREE),
+                                stdout=subprocess.PIPE, universal_newlines=True)
+        self.assertEqual(0, result.returncode)
+        self.assertEqual(compiled(TREE), result.stdout)
+        result = subprocess.run([sys.executable, client, "-s", self.socket,
+                                 os.path.join(self.tmp.name, "missing.json")],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        self.assertEqual(1, result.returncode)
+        self.assertIn("missing.json: FileNotFoundError", result.stderr)
+        result = subprocess.run([sys.executable, client, "--prot", "9000",
+                                 "-s", self.socket],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        self.assertEqual(2, result.returncode)
+        self.assertIn("unrecognized arguments: --prot", result.stderr)
+        self.assertEqual("", result.stdout)
+
+
+class TestServeFlag(unittest.TestCase):
+
+    def test_flag_before_input(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "part.json")
+            with open(path, 'w') as f:
+                json.dump(TREE, f)
+            socket = os.path.join(tmp, "textcad.sock")
+            args = textcad_engine.argumentParser().parse_args(
+                ["--serve", socket, path])
+            args.input.close()
+        self.assertEqual(socket, args.serve)
+        self.assertEqual(path, args.input.name)
+
+
+class TestStdioServer(unittest.TestCase):
+
+    def test_stdio(self):
+        engine = textcad_engine.__file__
+        lines = [{"id": 1, "tree": TREE}, {"id": 2, "op": "ping"},
+                 {"id": 3, "tree": {"category": "element", "name": "bolt",
+                                    "construction": TREE['elements'][1]}}]
+        result = subprocess.run(
+            [sys.executable, engine, "--stdio-server"],
+            input="".join(json.dumps(line) + "\n" for line in lines),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True, timeout=60)
+        responses = {response['id']: response for response in
+                     map(json.loads, result.stdout.splitlines())}
+        self.assertEqual(compiled(TREE), responses[1]['output'])
+        self.assertTrue(responses[2]['ok'])
+        self.assertTrue(responses[3]['ok'])
+
+
+if __name__ == '__main__':
+    unittest.main()
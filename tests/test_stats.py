@@ -0,0 +1,136 @@
+#!/usr/bin/python3.3
+import textcad_engine
+import unittest
+import io
+import os
+import json
+import subprocess
+import sys
+import tempfile
+
+TREE = {"category": "operation", "name": "difference",
+        "elements": [
+            {"category": "element", "name": "cube", "size": [40, 40, 5],
+             "center": [True, True, False]},
+            {"category": "operation", "name": "linearArray", "count": 4,
+             "step": [8, 0, 0],
+             "elements": [{"category": "element", "name": "hole",
+                           "radius": 1, "height": 10,
+                           "center": [True, True, False]}]},
+            {"category": "operation", "name": "hull",
+             "location": [0, 0, 5],
+             "elements": [{"category": "element", "name": "sphere",
+                           "radius": 2, "center": [True, True, True]},
+                          {"category": "element", "name": "bolt",
+                           "construction": {
+                               "category": "element", "name": "cylinder",
+                               "radius": 1, "height": 3,
+                               "center": [True, True, False]}}]}]}
+
+
+class TestCompileStats(unittest.TestCase):
+
+    def setUp(self):
+        self.eng = textcad_engine.OpenSCADEngine()
+        self.stats = textcad_engine.CompileStats()
+        self.sink = io.StringIO()
+        self.stats.compile(self.eng, TREE, self.sink)
+
+    def test_output(self):
+        self.assertEqual(self.eng.parseJSON(TREE), self.sink.getvalue())
+        self.assertEqual(len(self.sink.getvalue()), self.stats.outputBytes)
+        emitters = textcad_engine.OpenSCADEngine().nodeEmitters
+        self.assertEqual(emitters.keys(), self.eng.nodeEmitters.keys())
+        self.assertNotIn("run", [emitter.__name__ for emitter
+                                 in self.eng.nodeEmitters.values()])
+
+    def test_counts(self):
+        report = self.stats.report()
+        self.assertEqual({"operation difference": 1,
+                          "operation linearArray": 1, "operation hull": 1,
+                          "element cube": 1, "element hole": 1,
+                          "element sphere": 1, "element bolt": 1,
+                          "element cylinder": 1}, report['nodes'])
+        self.assertEqual(4, report['depth'])
+        self.assertEqual(1, report['emitters']['Hole']['calls'])
+        self.assertEqual(1, report['emitters']['placement location']
+                         ['calls'])
+        self.assertNotIn("translate", report['emitters'])
+        self.assertEqual(["tree.elements[2]", "tree.elements[1]",
+                          "tree.elements[0]"],
+                         [subtree['path']
+                          for subtree in report['largestSubtrees']])
+        json.dumps(report)
+
+    def test_single_pass(self):
+        self.eng.passes.append(textcad_engine.DeduplicatePass(minNodes=1))
+        tree = dict(TREE, location=[1, 2, 3],
+                    elements=TREE['elements'] + [TREE['elements'][1]])
+        stats = textcad_engine.CompileStats()
+        sink = io.StringIO()
+        with self.assertLogs("textcad", "DEBUG") as logs:
+            stats.compile(self.eng, tree, sink)
+        self.assertEqual(self.eng.parseJSON(tree), sink.getvalue())
+        self.assertIn("module", sink.getvalue())
+        self.assertEqual(1, len(logs.records))
+        leaf = TREE['elements'][0]
+        sink = io.StringIO()
+        stats.compile(self.eng, leaf, sink)
+        self.assertEqual(self.eng.parseJSON(leaf), sink.getvalue())
+        self.assertEqual([{"path": "tree", "bytes": len(sink.getvalue())}],
+                         stats.subtrees)
+
+    def test_render_cost(self):
+        cost = self.stats.report()['renderCost']
+        # Four holes of four sides, a sphere of 40 and a cylinder of 20
+        self.assertEqual(4 * 4 + 40 + 20, cost['fragments'])
+        self.assertEqual(7, cost['primitives'])
+        self.assertEqual(1, cost['booleans'])
+        self.assertEqual(1, cost['hull'])
+        self.assertEqual(0, cost['minkowski'])
+        stats = textcad_engine.CompileStats()
+        self.eng.resolution = textcad_engine.ResolutionPolicy("preview")
+        stats.compile(self.eng, TREE, io.StringIO())
+        self.assertIn("optimize", stats.stages)
+        self.assertLess(stats.cost['facets'], self.stats.cost['facets'])
+
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "part.json")
+            with open(path, 'w') as f:
+                json.dump(TREE, f)
+            result = subprocess.run(
+                [sys.executable, textcad_engine.__file__, path, "-o",
+                 os.path.join(tmp, "part.scad"), "--stats",
+                 "--stats-format", "json", "--verbose"],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True)
+            with open(os.path.join(tmp, "part.scad")) as f:
+                self.assertEqual(self.eng.parseJSON(TREE), f.read())
+        report = json.loads(result.stderr.splitlines()[-1])
+        self.assertEqual(8, sum(report['nodes'].values()))
+        # The custom element is logged once, not again when measured
+        self.assertEqual(1, result.stderr.count("Found element"))
+        self.assertEqual("", result.stdout)
+
+    def test_flags_before_input(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "part.json")
+            with open(path, 'w') as f:
+                json.dump(TREE, f)
+            profile = os.path.join(tmp, "part.prof")
+            result = subprocess.run(
+                [sys.executable, textcad_engine.__file__, "--stats",
+                 "--profile", profile, path],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True)
+            with open(path) as f:
+                self.assertEqual(TREE, json.load(f))
+            self.assertTrue(os.path.getsize(profile))
+        self.assertEqual(0, result.returncode)
+        self.assertEqual(self.eng.parseJSON(TREE), result.stdout)
+        self.assertIn("stages: ", result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/python3.3
+import textcad_engine
+import unittest
+import io
+import json
+import tempfile
+
+
+def part(idx):
+    return {"category": "operation", "name": "translate",
+            "location": [idx * 1.25, 0, -idx],
+            "elements": [{"category": "element", "name": "hole",
+                          "radius": 2 + idx, "height": 8,
+                          "center": [True, True, False]},
+                         {"category": "element", "name": "bolt",
+                          "construction": {"category": "element",
+                                           "name": "cube",
+                                           "size": [1, 2, 3],
+                                           "center": [True, True, True]}}]}
+
+
+TREE = {"category": "operation", "name": "difference",
+        "color": [0.5, 0.5, 0.5],
+        "modules": [{"name": "peg",
+                     "body": {"category": "element", "name": "cube",
+                              "size": [1, 1, 1],
+                              "center": [False, False, False]}}],
+        "elements": [part(idx) for idx in range(5)]
+        + [{"category": "call", "name": "peg", "location": [3, 3, 3]}]}
+
+
+def chunked(text, size):
+    return [text[idx:idx + size] for idx in range(0, len(text), size)]
+
+
+class TestJSONStream(unittest.TestCase):
+
+    def test_values(self):
+        text = ' {"a" : [1, 23.5e1, "x,]y", {"b": [true]}], "c": 456}  '
+        for size in (1, 2, 5, len(text)):
+            reader = textcad_engine.JSONStream(chunked(text, size))
+            reader.expect("{")
+            self.assertEqual("a", reader.value())
+            reader.expect(":")
+            self.assertEqual([1, 235.0, "x,]y", {"b": [True]}],
+                             list(reader.items()))
+            reader.expect(",")
+            self.assertEqual("c", reader.value())
+            reader.expect(":")
+            self.assertEqual(456, reader.value())
+            reader.expect("}")
+            self.assertEqual("", reader.peek())
+
+    def test_truncated(self):
+        reader = textcad_engine.JSONStream(chunked('[1, {"a": ', 3))
+        with self.assertRaises(ValueError):
+            list(reader.items())
+
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.eng = textcad_engine.OpenSCADEngine()
+        self.expect = self.eng.parseJSON(TREE)
+
+    def streamed(self, source, lines=False):
+        sink = io.StringIO()
+        self.eng.writeStream(source, sink, lines=lines)
+        return sink.getvalue()
+
+    def test_chunks(self):
+        text = json.dumps(TREE, indent=1)
+        for size in (1, 7, 64, len(text)):
+            sink = io.StringIO()
+            writer = textcad_engine.ScadWriter(sink)
+            self.eng.streamJSON(
+                textcad_engine.JSONStream(chunked(text, size)), writer)
+            writer.flush()
+            self.assertEqual(self.expect, sink.getvalue())
+
+    def test_mapped_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix=".json") as source:
+            json.dump(TREE, source)
+            source.flush()
+            self.assertEqual(self.expect, self.streamed(source.name))
+            with open(source.name) as text:
+                self.assertEqual(self.expect, self.streamed(text))
+            chunks = list(textcad_engine.readChunks(source.name, size=50))
+            self.assertEqual(json.dumps(TREE), "".join(chunks))
+
+    def test_unstreamable_root(self):
+        tree = dict(TREE, name="bracket",
+                    construction={"category": "element", "name": "cube",
+                                  "size": [1, 1, 1],
+                                  "center": [False, False, False]})
+        self.assertEqual(self.eng.parseJSON(tree),
+                         self.streamed(io.StringIO(json.dumps(tree))))
+
+    def test_head_after_elements(self):
+        tree = {"category": "operation", "name": "union",
+                "elements": [part(0)], "location": [1, 1, 1]}
+        with self.assertRaisesRegex(ValueError, "'location' before"):
+            self.streamed(io.StringIO(json.dumps(tree)))
+
+    def test_error_path(self):
+        tree = json.loads(json.dumps(TREE))
+        tree['elements'][3]['elements'][0]['radius'] = None
+        with self.assertRaises(textcad_engine.SchemaError) as caught:
+            self.streamed(io.StringIO(json.dumps(tree)))
+        self.assertEqual("tree.elements[3].elements[0].radius",
+                         caught.exception.path)
+
+    def test_json_lines(self):
+        text = "\n".join(json.dumps(part(idx)) for idx in range(3)) \
+            + "\n\n" + json.dumps({"category": "element", "name": "cube",
+                                   "size": [1, 1, 1]})
+        with self.assertRaises(textcad_engine.SchemaError) as caught:
+            self.streamed(io.StringIO(text), lines=True)
+        self.assertEqual("line 5", caught.exception.path)
+        text = text[:text.rindex("\n")]
+        expect = "".join(self.eng.parseJSON(part(idx)) + "\n"
+                         for idx in range(3))
+        self.assertEqual(expect, self.streamed(io.StringIO(text), True))
+
+    def test_passes(self):
+        self.eng.passes.append(textcad_engine.DeduplicatePass())
+        with self.assertRaises(ValueError):
+            self.streamed(io.StringIO(json.dumps(TREE)))
+        self.eng.passes = []
+        self.eng.resolution = textcad_engine.ResolutionPolicy("draft")
+        self.assertEqual(self.eng.parseJSON(TREE),
+                         self.streamed(io.StringIO(json.dumps(TREE))))
+
+
+if __name__ == '__main__':
+    unittest.main()
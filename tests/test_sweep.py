@@ -0,0 +1,154 @@
+#!/usr/bin/python3.3
+import textcad_engine
+from helpers import instance
+import unittest
+import io
+import os
+import random
+import tempfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def ref(name):
+    return {"parameter": name}
+
+
+TEMPLATE = {
+    "category": "operation", "name": "difference", "parameters": {"h": 8},
+    "modules": [{"name": "peg",
+                 "body": {"category": "element", "name": "cylinder",
+                          "radius": ref("r"), "height": ref("h"),
+                          "center": [True, True, False]}}],
+    "elements": [
+        {"category": "element", "name": "cube", "size": [ref("w"), 20, 5],
+         "center": [True, True, False], "color": [0.5, 0.5, 0.5]},
+        {"category": "operation", "name": "translate",
+         "location": [ref("x"), 0, 0],
+         "elements": [
+             {"category": "element", "name": "hole", "radius": ref("r"),
+              "height": 10, "center": [True, True, False],
+              "tolerance": ref("tol")},
+             {"category": "element", "name": "ntube", "apothem": ref("a"),
+              "sides": ref("n"), "height": 2, "center": [True, True, True]},
+             {"category": "element", "name": "sphere", "radius": ref("r"),
+              "center": [False, False, True], "location": [1, ref("x"), 3]},
+             {"category": "element", "name": "cone", "topRadius": 1,
+              "bottomRadius": ref("r"), "height": ref("h"),
+              "center": [True, True, True]}]},
+        {"category": "operation", "name": "polarArray", "count": ref("n"),
+         "radius": ref("w"),
+         "elements": [{"category": "call", "name": "peg"}]},
+        {"category": "element", "name": "cube", "size": [1, 1, 1],
+         "center": [False, False, False]}]}
+
+NAMES = ["w", "r", "x", "a", "n", "tol"]
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.eng = textcad_engine.OpenSCADEngine()
+
+    def test_variants(self):
+        rand = random.Random(0)
+        rows = [[rand.choice([10, 12.5]), rand.uniform(0.5, 5),
+                 rand.randint(0, 9), rand.uniform(1, 4), rand.randint(3, 12),
+                 rand.choice([0, 0.1])] for _ in range(50)]
+        sweep = textcad_engine.Sweep(self.eng, TEMPLATE)
+        self.assertEqual(8, len(sweep.slots))
+        for row, text in zip(rows, sweep.texts(NAMES, rows)):
+            values = dict(TEMPLATE['parameters'], **dict(zip(NAMES, row)))
+            self.assertEqual(self.eng.parseJSON(instance(TEMPLATE, values)),
+                             text)
+
+    def test_tables(self):
+        names, rows = textcad_engine.parameterTable(
+            io.StringIO("w, r\n10,2.5\n\n12.0,3\n"))
+        self.assertEqual(["w", "r"], names)
+        self.assertEqual([[10, 2.5], [12.0, 3]], rows)
+        array = numpy.array([(10, 2.5)], dtype=[("w", int), ("r", float)])
+        self.assertEqual((["w", "r"], [(10, 2.5)]),
+                         textcad_engine.parameterTable(array))
+        self.assertEqual((["w", "r"], [[1.0, 2.0]]),
+                         textcad_engine.parameterTable(
+                             numpy.array([[1.0, 2.0]]), ["w", "r"]))
+        with self.assertRaisesRegex(ValueError, "line 3: expected 2"):
+            textcad_engine.parameterTable(io.StringIO("w,r\n1,2\n3\n"))
+
+    def test_errors(self):
+        sweep = textcad_engine.Sweep(self.eng, TEMPLATE)
+        row = [10, 2, 0, 1, 6, 0]
+        with self.assertRaises(textcad_engine.SchemaError) as caught:
+            list(sweep.texts(NAMES[:-1], [row[:-1]]))
+        self.assertEqual("tree.elements[1].elements[0].tolerance",
+                         caught.exception.path)
+        self.assertIn("unknown parameter 'tol'", str(caught.exception))
+        with self.assertRaisesRegex(textcad_engine.SchemaError,
+                                    r"elements\[2\].count: variant 1: "
+                                    "expected a positive integer"):
+            list(sweep.texts(NAMES, [row, row[:4] + [0, 0]]))
+        template = dict(TEMPLATE, elements=[
+            {"category": "element", "name": "cube", "size": [1, 1, 1],
+             "center": [ref("w"), False, False]}])
+        with self.assertRaisesRegex(textcad_engine.SchemaError,
+                                    "booleans cannot be parameters"):
+            textcad_engine.Sweep(self.eng, template)
+        template['elements'][0]['size'] = ref("w")
+        with self.assertRaisesRegex(textcad_engine.SchemaError,
+                                    "expected a list of 3 numbers"):
+            textcad_engine.Sweep(self.eng, template)
+        self.eng.passes.append(textcad_engine.DeduplicatePass())
+        with self.assertRaises(ValueError):
+            textcad_engine.Sweep(self.eng, TEMPLATE)
+
+    def test_hull_rewrite(self):
+        self.eng.passes.append(textcad_engine.HullRewritePass())
+        sphere = {"category": "element", "name": "sphere", "radius": 1,
+                  "center": [True, True, True]}
+        template = {
+            "category": "operation", "name": "union",
+            "parameters": {"w": 10, "r": 1},
+            "elements": [
+                {"category": "operation", "name": "minkowski",
+                 "elements": [{"category": "element", "name": "cube",
+                               "size": [ref("w"), 4, 2],
+                               "center": [True, True, False]},
+                              dict(sphere, radius=ref("r"))]},
+                {"category": "operation", "name": "hull",
+                 "elements": [{"category": "operation", "name": "hull",
+                               "elements": [sphere, dict(
+                                   sphere, location=[5, 0, 0])]}]}]}
+        sweep = textcad_engine.Sweep(self.eng, template)
+        self.assertEqual(1, len(sweep.slots))
+        rows = [[10, 1], [20, 2]]
+        for row, text in zip(rows, sweep.texts(["w", "r"], rows)):
+            self.assertNotIn("minkowski", text)
+            self.assertEqual(2, text.count("hull()"))
+            self.assertEqual(self.eng.parseJSON(instance(
+                template, dict(zip(["w", "r"], row)))), text)
+        model = textcad_engine.ParametricModel(self.eng, template)
+        model.set("r", 3)
+        self.assertEqual(self.eng.parseJSON(instance(
+            template, {"w": 10, "r": 3})), model.text())
+
+    def test_write(self):
+        tmp = tempfile.TemporaryDirectory()
+        rows = [[10 + idx, 2, idx, 1, 6, 0] for idx in range(12)]
+        paths = textcad_engine.compileSweep(TEMPLATE, NAMES, rows, tmp.name,
+                                            prefix="plate")
+        self.assertEqual(12, len(paths))
+        self.assertEqual(os.path.join(tmp.name, "plate-07.scad"), paths[7])
+        values = dict(TEMPLATE['parameters'], **dict(zip(NAMES, rows[7])))
+        with open(paths[7]) as output:
+            self.assertEqual(self.eng.parseJSON(instance(TEMPLATE, values)),
+                             output.read())
+        tmp.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#! /usr/bin/python3
+"""
+Thin client for a textcad engine started with --serve. It imports nothing
+from the engine, so each call costs only the interpreter's start and one
+round trip on the socket.
+
+usage: textcad_client.py [-s SOCKET] [-o OUTPUT] [input]
+       textcad_client.py [-s SOCKET] --stats | --shutdown
+
+input is sent as a path for the server to read; without it, the tree is
+read from stdin and sent inline.
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+
+
+def defaultSocket():
+    root = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(root, "textcad-" + str(os.getuid()) + ".sock")
+
+
+def request(message, path=None):
+    """Sends one request to the server at path and returns its response"""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path or defaultSocket())
+        client.sendall((json.dumps(message) + "\n").encode())
+        client.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = client.recv(1 << 16)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        client.close()
+    return json.loads(b"".join(chunks).decode())
+
+
+def argumentParser():
+    """Returns the parser for the client command line"""
+    parser = argparse.ArgumentParser(prog="textcad_client.py",
+                                     description="Thin client for a textcad "
+                                                 "engine started with --serve."
+                                     )
+    parser.add_argument("-s", "--socket",
+                        metavar="SOCKET",
+                        help="the server's Unix socket (default: "
+                             + defaultSocket() + ")"
+                        )
+    parser.add_argument("-o", "--output",
+                        help="Output file, defaults to stdout"
+                        )
+    parser.add_argument("input", nargs='?',
+                        help="sent as a path for the server to read; "
+                             "without it, the tree is read from stdin"
+                        )
+    requests = parser.add_mutually_exclusive_group()
+    requests.add_argument("--stats",
+                          action='store_true',
+                          default=False,
+                          help="print the server's statistics"
+                          )
+    requests.add_argument("--shutdown",
+                          action='store_true',
+                          default=False,
+                          help="stop the server"
+                          )
+    return parser
+
+
+def main(argv):
+    args = argumentParser().parse_args(argv)
+    path = args.socket
+    output = args.output
+    source = args.input
+    if args.stats:
+        message = {"op": "stats"}
+    elif args.shutdown:
+        message = {"op": "shutdown"}
+    else:
+        message = {"op": "compile"}
+    if message['op'] == "compile":
+        if source:
+            message['path'] = os.path.abspath(source)
+        else:
+            message['tree'] = json.load(sys.stdin)
+    try:
+        response = request(message, path)
+    except OSError as error:
+        sys.stderr.write("textcad_client: " + str(error) + "\n")
+        return 1
+    if not response['ok']:
+        sys.stderr.write((source or "input") + ": " + response['error']
+                         + "\n")
+        return 1
+    if message['op'] == "stats":
+        sys.stdout.write(json.dumps(response['stats']) + "\n")
+    elif message['op'] == "compile":
+        if output:
+            with open(output, 'w') as sink:
+                sink.write(response['output'])
+        else:
+            sys.stdout.write(response['output'])
+        for report in response['reports'].values():
+            sys.stderr.write(report + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
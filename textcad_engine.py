@@ -5,6 +5,480 @@ import json
 import os
 import subprocess
 import math
+import io
+import hashlib
+import glob
+import time
+import sqlite3
+import threading
+import copy
+import concurrent.futures
+import numbers
+import gc
+import mmap
+import codecs
+import stat
+import re
+import itertools
+import csv
+import ast
+import operator
+import shutil
+import tempfile
+import asyncio
+import multiprocessing
+import atexit
+import logging
+import collections
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__version__ = "0.0.1-dev"
+
+# Traversal and component library messages, shown by --verbose
+logger = logging.getLogger("textcad")
+
+
+class ScadWriter:
+    """
+    Buffered sink for emitted OpenSCAD fragments.
+    Fragments are collected and handed to the underlying file-like
+    object in a single write once flushSize characters are pending.
+    """
+    def __init__(self, stream, flushSize=65536):
+        self.stream = stream
+        self.flushSize = flushSize
+        self.buffer = []
+        self.pending = 0
+
+    def write(self, fragment):
+        self.buffer.append(fragment)
+        self.pending += len(fragment)
+        if self.pending >= self.flushSize:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.stream.write("".join(self.buffer))
+            self.buffer = []
+            self.pending = 0
+
+
+class CompactFormat:
+    """
+    Rewrites emitted OpenSCAD text to be smaller without changing the
+    model: floats are rounded to precision decimals (None keeps them
+    exact) and written in their shortest round-trip form, integral ones
+    as integers; wrappers left doing nothing, such as a zero translate,
+    a unit scale, a zero rotation or an empty color, are dropped unless
+    a modifier such as # applies to them; and
+    with minify, indentation, newlines and the spaces after commas go
+    too. Quoted strings are left alone. Works on any text made of whole
+    emitted fragments, as ScadWriter flushes.
+    """
+    token = re.compile(r"""('[^']*'|"[^"]*")"""
+                       r"|(?<![\w.$])(-?\d+\.\d*(?:[eE][-+]?\d+)?"
+                       r"|-?\d+[eE][-+]?\d+)(?![\w.])")
+    noop = re.compile(r"(?<![#%!*])(?:translate\(v=\[0, 0, 0\]\)"
+                      r"|scale\(v=(?:\[1, 1, 1\]|1)\)"
+                      r"|rotate\(a=0, v=\[[^\]]*\]\)"
+                      r"|color\(\[\]\)|mirror\(\[0, 0, 0\]\)"
+                      r"|multmatrix\(m=\[\[1, 0, 0, 0\], \[0, 1, 0, 0\], "
+                      r"\[0, 0, 1, 0\], \[0, 0, 0, 1\]\]\))")
+    spacing = re.compile(r"""('[^']*'|"[^"]*")|\n|(?<!module) +""")
+
+    def __init__(self, precision=6, minify=False):
+        self.precision = precision
+        self.minify = minify
+
+    def number(self, match):
+        if match.group(1):
+            return match.group(1)
+        value = float(match.group(2))
+        if self.precision is not None:
+            value = round(value, self.precision)
+        if value.is_integer() and abs(value) < 1e15:
+            return str(int(value))
+        return repr(value)
+
+    def unspace(self, match):
+        return match.group(1) or ""
+
+    def text(self, text):
+        text = self.noop.sub("", self.token.sub(self.number, text))
+        if self.minify:
+            text = self.spacing.sub(self.unspace, text)
+        return text
+
+
+class CompactStream:
+    """
+    File-like wrapper writing OpenSCAD text through a CompactFormat,
+    counting the bytes given to it and written on, for the size report
+    """
+    def __init__(self, stream, compact):
+        self.stream = stream
+        self.compact = compact
+        self.before = 0
+        self.after = 0
+
+    def write(self, text):
+        compacted = self.compact.text(text)
+        self.before += len(text.encode())
+        self.after += len(compacted.encode())
+        self.stream.write(compacted)
+
+    def flush(self):
+        self.stream.flush()
+
+    def report(self):
+        return "output %d -> %d bytes (%.0f%%)" % (
+            self.before, self.after, 100.0 * self.after / max(self.before, 1))
+
+
+def iterNodes(data):
+    """Yields every node of a tree, module bodies and constructions included"""
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.get('elements', [])))
+        if 'construction' in node:
+            stack.append(node['construction'])
+        for module in node.get('modules', []):
+            stack.append(module['body'])
+
+
+def copyTree(data):
+    """Returns a copy of a tree that shares no node dicts or lists with it"""
+    root = dict(data)
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if 'elements' in node:
+            node['elements'] = [dict(child) for child in node['elements']]
+            stack.extend(node['elements'])
+        if 'construction' in node:
+            node['construction'] = dict(node['construction'])
+            stack.append(node['construction'])
+        if 'modules' in node:
+            node['modules'] = [dict(module) for module in node['modules']]
+            for module in node['modules']:
+                module['body'] = dict(module['body'])
+                stack.append(module['body'])
+    return root
+
+
+def readChunks(source, size=1 << 20):
+    """
+    Yields the text of a file-like source or a path in chunks of about
+    size characters. Regular files are memory-mapped and each consumed
+    range is released from memory once decoded, so resident memory stays
+    near one chunk however large the file is.
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as binary:
+            yield from readChunks(binary, size)
+        return
+    try:
+        info = os.fstat(source.fileno())
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        info = None
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    if info is None or not stat.S_ISREG(info.st_mode) or not info.st_size:
+        while True:
+            chunk = source.read(size)
+            if not chunk:
+                return
+            yield decoder.decode(chunk) if isinstance(chunk, bytes) \
+                else chunk
+    with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        start = 0
+        released = 0
+        while start < len(mapped):
+            end = min(start + size, len(mapped))
+            yield decoder.decode(mapped[start:end], end == len(mapped))
+            # madvise takes whole pages
+            page = end - end % mmap.PAGESIZE
+            if hasattr(mapped, 'madvise') and page > released:
+                mapped.madvise(mmap.MADV_DONTNEED, released, page - released)
+                released = page
+            start = end
+
+
+class JSONStream:
+    """
+    Reads JSON incrementally from text chunks. Values are decoded one at
+    a time with raw_decode from a window of buffered text, refilled when
+    a value runs past its end, so only the value being read and about
+    one chunk are held at once.
+    """
+    space = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = ""
+        self.pos = 0
+        self.done = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self):
+        """
+        Drops consumed text and at least doubles what is left with new
+        chunks, so a value spanning many chunks is decoded only a few
+        times. Returns False at the end of the input.
+        """
+        if self.done:
+            return False
+        buffer = [self.buffer[self.pos:]]
+        want = max(len(buffer[0]), 1)
+        added = 0
+        while added < want:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.done = True
+                break
+            buffer.append(chunk)
+            added += len(chunk)
+        self.buffer = "".join(buffer)
+        self.pos = 0
+        return added > 0
+
+    def peek(self):
+        """Returns the next character past whitespace, or "" at the end"""
+        while True:
+            self.pos = self.space.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars):
+        """Consumes the next character, which must be one of chars"""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError("expected " + " or ".join(map(repr, chars))
+                             + ", found " + (repr(char) if char
+                                             else "end of input"))
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decodes and returns the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # A number cut off by the end of the buffer goes on in the
+            # next chunk
+            if (end == len(self.buffer)
+                    or value.__class__ in (int, float)
+                    and self.buffer[end] in "0123456789.eE+-") \
+                    and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def items(self):
+        """Yields the values of the array that comes next, one by one"""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(",]") == "]":
+                return
+
+
+class SchemaError(ValueError):
+    """
+    A textcad tree that does not fit the schema. path locates the
+    offending node or value, e.g. tree.elements[2].size.
+    """
+    def __init__(self, path, message):
+        super().__init__(path + ": " + message)
+        self.path = path
+        self.message = message
+
+    def within(self, path):
+        """Returns this error for a tree found at path in a larger one"""
+        return SchemaError(path + self.path[len("tree"):], self.message)
+
+
+def isNumber(value):
+    return value.__class__ in (int, float) \
+        or isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+
+def isInteger(value):
+    return value.__class__ is int \
+        or isinstance(value, numbers.Integral) and not isinstance(value, bool)
+
+
+def isVector(value):
+    return value.__class__ is list and len(value) == 3 \
+        and (value[0].__class__ in (int, float)
+             and value[1].__class__ in (int, float)
+             and value[2].__class__ in (int, float)
+             or all(map(isNumber, value)))
+
+
+def isFlag(value):
+    return value.__class__ is bool or isNumber(value)
+
+
+def isFlags(value):
+    return value.__class__ is list and len(value) == 3 \
+        and (value[0].__class__ in (bool, int, float)
+             and value[1].__class__ in (bool, int, float)
+             and value[2].__class__ in (bool, int, float)
+             or all(map(isFlag, value)))
+
+
+# Value kinds a node field may hold: a check and its description.
+# A kind ending in "?" also accepts any false value, which the emitters
+# treat as absent.
+fieldKinds = {
+    "number": (isNumber, "a number"),
+    "integer": (isInteger, "an integer"),
+    "vector": (isVector, "a list of 3 numbers"),
+    "flags": (isFlags, "a list of 3 booleans"),
+    "auto": (lambda value: isinstance(value, bool) or isFlags(value),
+             "a boolean or a list of 3 booleans"),
+    "color": (lambda value: isinstance(value, str)
+              or isinstance(value, list) and len(value) in (3, 4)
+              and all(map(isNumber, value)),
+              "a color name or a list of 3 or 4 numbers"),
+    "matrix": (lambda value: isinstance(value, list)
+               and all(isinstance(row, list) and all(map(isNumber, row))
+                       for row in value),
+               "a list of rows of numbers"),
+    "rotation": (lambda value: isinstance(value, dict)
+                 and isFlags(value.get('axis'))
+                 and isNumber(value.get('angle')),
+                 "an object with a 3 boolean axis and a numeric angle"),
+    "scale": (lambda value: isNumber(value) or isVector(value),
+              "a number or a list of 3 numbers"),
+    "count": (lambda value: isInteger(value) and value > 0,
+              "a positive integer"),
+    "counts": (lambda value: isinstance(value, list) and len(value) in (2, 3)
+               and all(isInteger(v) and v > 0 for v in value),
+               "a list of 2 or 3 positive integers"),
+    "points": (lambda value: isinstance(value, list)
+               and all(map(isVector, value)),
+               "a list of lists of 3 numbers"),
+    "any": (lambda value: True, "anything"),
+}
+
+
+class Node:
+    """
+    Base of the typed tree OpenSCADEngine.load builds from textcad JSON.
+    placement holds the (property, value) pairs parseProperties would
+    emit, in emission order. Subclasses declare their fields as
+    (key, kind, required) triples, stored in slots named by the key.
+    """
+    __slots__ = ("name", "placement")
+    fields = ()
+
+
+class Cube(Node):
+    __slots__ = ("size", "center")
+    fields = (("size", "vector", True), ("center", "flags", True))
+
+
+class Sphere(Node):
+    __slots__ = ("radius", "center", "fragments")
+    fields = (("radius", "number", True), ("center", "flags", True),
+              ("fragments", "integer", False))
+
+
+class Cylinder(Node):
+    __slots__ = ("radius", "height", "center", "fragments")
+    fields = (("radius", "number", True), ("height", "number", True),
+              ("center", "flags", True), ("fragments", "integer", False))
+
+
+class Cone(Node):
+    __slots__ = ("topRadius", "bottomRadius", "height", "center",
+                 "fragments")
+    fields = (("topRadius", "number", True),
+              ("bottomRadius", "number", True),
+              ("height", "number", True), ("center", "flags", True),
+              ("fragments", "integer", False))
+
+
+class NTube(Node):
+    __slots__ = ("apothem", "sides", "height", "center")
+    fields = (("apothem", "number", True), ("sides", "integer", True),
+              ("height", "number", True), ("center", "flags", True))
+
+
+class Hole(Node):
+    __slots__ = ("radius", "height", "center", "tolerance")
+    fields = (("radius", "number", True), ("height", "number", True),
+              ("center", "flags", True), ("tolerance", "number", False))
+
+
+class Operation(Node):
+    """
+    A built-in operation. argument is what its emitter takes: the value
+    of its one field, or a dict of its fields when it has several.
+    """
+    __slots__ = ("argument", "elements")
+    arguments = {"translate": (("location", "vector", True),),
+                 "rotate": (("axis", "flags", True),
+                            ("angle", "number", True)),
+                 "mirror": (("axis", "flags?", True),),
+                 "scale": (("multiplier", "scale?", True),),
+                 "resize": (("newsize", "vector", True),
+                            ("auto", "auto", True)),
+                 "linearArray": (("count", "count", True),
+                                 ("step", "vector", True)),
+                 "gridArray": (("counts", "counts", True),
+                               ("spacing", "vector", True)),
+                 "polarArray": (("count", "count", True),
+                                ("radius", "number", False),
+                                ("angle", "number", False)),
+                 "pointArray": (("points", "points", True),)}
+
+
+class CustomElement(Node):
+    __slots__ = ("construction",)
+
+
+class CustomOperation(Node):
+    __slots__ = ("construction",)
+
+
+class Component(Node):
+    """A custom element whose construction is in the engine's library"""
+    __slots__ = ()
+
+
+class Call(Node):
+    __slots__ = ()
+
+
+class Empty(Node):
+    """A node without a category, which emits nothing"""
+    __slots__ = ()
+
+
+class Model:
+    """A loaded tree: its root node and its (name, body) module pairs"""
+    __slots__ = ("root", "modules")
+
+    def __init__(self, root, modules):
+        self.root = root
+        self.modules = modules
 
 
 class OpenSCADEngine:
@@ -14,76 +488,586 @@ class OpenSCADEngine:
     required elements, parameters,
     parameter operations, elements, element operations
     """
-    def __init__(self):
+    def __init__(self, indent=4):
         self.level = 0
+        self.indent = indent
         self.output = ""
         self.operations = ["union", "difference", "intersection", "hull",
                            "translate", "rotate", "minkowski", "mirror",
-                           "resize", "scale"]
+                           "resize", "scale", "linearArray", "gridArray",
+                           "polarArray", "pointArray"]
+        self.arrays = ["linearArray", "gridArray", "polarArray",
+                       "pointArray"]
         self.elements = ["cube", "cylinder", "sphere", "cone", "ntube", "hole"]
+        self.properties = ["highlight", "color", "matrix", "location",
+                           "rotation", "scale"]
+        # Emitters by name, and the key holding the single argument of
+        # operations that take one rather than the whole node
+        self.elementEmitters = {"cube": self.cube, "sphere": self.sphere,
+                                "cylinder": self.cylinder,
+                                "ntube": self.ntube, "cone": self.cone,
+                                "hole": self.hole}
+        self.operationEmitters = {
+            "translate": self.translate, "rotate": self.rotate,
+            "mirror": self.mirror, "scale": self.scale,
+            "resize": self.resize, "linearArray": self.linearArray,
+            "gridArray": self.gridArray, "polarArray": self.polarArray,
+            "pointArray": self.pointArray,
+            "union": lambda argument: self.union(),
+            "difference": lambda argument: self.difference(),
+            "intersection": lambda argument: self.intersection(),
+            "hull": lambda argument: self.hull(),
+            "minkowski": lambda argument: self.minkowski()}
+        self.operationArguments = {"translate": "location", "mirror": "axis",
+                                   "scale": "multiplier",
+                                   "pointArray": "points"}
+        self.primitives = {"cube": Cube, "sphere": Sphere,
+                           "cylinder": Cylinder, "cone": Cone,
+                           "ntube": NTube, "hole": Hole}
+        self.placementKinds = {"highlight": "any", "color": "color?",
+                               "matrix": "matrix?", "location": "vector",
+                               "rotation": "rotation", "scale": "scale?"}
+        self.specs = {kind: self.fieldSpecs(kind.fields)
+                      for kind in self.primitives.values()}
+        self.specs.update((name, self.fieldSpecs(fields)) for name, fields
+                          in Operation.arguments.items())
+        self.placementSpecs = {spec[0]: spec for spec in self.fieldSpecs(
+            (key, self.placementKinds[key], True)
+            for key in self.properties)}
+        self.wrappers = {"highlight": lambda value: self.highlight(),
+                         "color": self.color, "matrix": self.multmatrix,
+                         "location": self.translate,
+                         "rotation": self.rotate, "scale": self.scale}
+        self.nodeEmitters = {
+            Cube: lambda node: self.cubeText(node.size, node.center),
+            Sphere: lambda node: self.sphereText(node.radius, node.center,
+                                                 node.fragments),
+            Cylinder: lambda node: self.cylinderText(
+                node.radius, node.height, node.center, node.fragments),
+            Cone: lambda node: self.coneText(
+                node.topRadius, node.bottomRadius, node.height,
+                node.center, node.fragments),
+            NTube: lambda node: self.ntubeText(node.apothem, node.sides,
+                                               node.height, node.center),
+            Hole: lambda node: self.holeText(node.radius, node.height,
+                                             node.center, node.tolerance),
+            Call: lambda node: node.name + "();"}
+        self.passes = []
+        self.resolution = None
+        self.cache = None
+        self.memo = None
+        self.parallel = None
+        self.compact = None
+        self.library = None
+
+    def options(self):
+        """Returns the settings that shape the emitted text, as JSON data"""
+        return {"indent": self.indent,
+                "passes": [[type(optimizer).__name__, optimizer.options()]
+                           for optimizer in self.passes],
+                "resolution": self.resolution and self.resolution.options(),
+                "library": self.library and self.library.options()}
+
+    def wholeTreePasses(self):
+        """Returns the passes that are not local to each subtree"""
+        return [job for job in self.passes if not getattr(job, 'local',
+                                                          False)]
+
+    def optimize(self, data, reports=None):
+        """
+        Runs the tree through each pass in self.passes, in order, then
+        through the resolution policy if one is set. Library components
+        are expanded first when a pass reads the whole tree or a policy
+        is set, so these reach into them as well.
+        Each pass runs on a shallow copy of itself, so passes shared by
+        concurrent compiles never share working state; the copy's
+        counters are handed back to the pass afterwards and, given a
+        reports dict, its report() is stored there by pass name.
+        """
+        if self.library is not None \
+                and (self.wholeTreePasses() or self.resolution):
+            data = self.library.expand(data)
+        for optimizer in self.passes + [self.resolution]:
+            if not optimizer:
+                continue
+            job = copy.copy(optimizer)
+            data = job.run(self, data)
+            optimizer.__dict__.update(job.__dict__)
+            if reports is not None and hasattr(job, 'report') \
+                    and job.report():
+                reports[type(job).__name__] = job.report()
+        return data
 
     def parseJSON(self, data):
-        output = ""
-        if data['category']:
-            if data['category'] == "operation":
-                if data['name'] in self.operations:
-                    scadOperation = self.parseOperation(data) + "{\n"
-                    output += " " * self.level * args.indent + scadOperation
-                    for types in data['elements']:
-                        self.level += 1
-                        output += self.parseJSON(types)
-                        output += "\n"
-                        self.level -= 1
-                    output += " " * self.level * args.indent + "}\n"
-                    return output
+        """Returns the OpenSCAD text for a textcad tree as a string"""
+        sink = io.StringIO()
+        self.writeJSON(data, sink)
+        return sink.getvalue()
+
+    def writeJSON(self, data, stream, flushSize=65536):
+        """
+        Writes the OpenSCAD text for a textcad tree to a file-like stream
+        through a ScadWriter, so the full output is never held in memory.
+        With a cache set, the text comes from it or is collected to be
+        stored in it. With a CompactFormat set as compact, the text is
+        written through it and its size report is added to the reports
+        of the passes that ran, which are returned.
+        """
+        reports = {}
+        if self.compact:
+            stream = CompactStream(stream, self.compact)
+        if self.cache:
+            key = self.cache.key(data, self.options())
+            output = self.cache.get(key)
+            if output is None:
+                sink = io.StringIO()
+                writer = ScadWriter(sink, flushSize)
+                self.emitModel(self.loadOptimized(data, reports), writer)
+                writer.flush()
+                output = sink.getvalue()
+                self.cache.put(key, output)
+            stream.write(output)
+        else:
+            writer = ScadWriter(stream, flushSize)
+            if self.memo:
+                if self.passes or self.resolution:
+                    # Passes read the whole tree, so all of it is checked
+                    self.load(data)
+                self.memo.emit(self, self.optimize(data, reports), writer)
+            else:
+                self.emitModel(self.loadOptimized(data, reports), writer)
+            writer.flush()
+        if self.compact:
+            reports['CompactFormat'] = stream.report()
+        return reports
+
+    def writeStream(self, source, stream, flushSize=65536, lines=False):
+        """
+        Writes the OpenSCAD text for a textcad file, path or file-like
+        object, while reading it. The elements of a root operation are
+        each emitted as soon as they have been read, so neither the input
+        text nor the whole tree is held in memory. With lines set, the
+        input is JSON lines, one independent part per line, each emitted
+        as a top-level statement. Parts are compiled on their own, so
+        only passes that are local to each subtree can be used.
+        """
+        if self.wholeTreePasses() or self.resolution \
+                and self.resolution.facetBudget is not None:
+            raise ValueError("streaming compiles each part on its own; "
+                             "only local passes and a resolution policy "
+                             "without a facet budget can be used")
+        if self.compact:
+            stream = CompactStream(stream, self.compact)
+        writer = ScadWriter(stream, flushSize)
+        if lines:
+            self.streamLines(readChunks(source), writer)
+        else:
+            self.streamJSON(JSONStream(readChunks(source)), writer)
+        writer.flush()
+
+    def emitPart(self, data, writer, level, path):
+        """Validates, optimizes and emits one streamed part at level"""
+        try:
+            self.emitModel(self.loadOptimized(data), writer, level)
+        except SchemaError as error:
+            raise error.within(path)
+
+    def streamJSON(self, reader, writer):
+        """
+        Emits the tree a JSONStream holds. Keys of the root before its
+        elements give the head written before them; a key after them
+        that would change that head is refused, since the elements are
+        already written.
+        """
+        reader.expect("{")
+        root = {}
+        streamed = False
+        level = self.level
+        while reader.peek() != "}":
+            if root or streamed:
+                reader.expect(",")
+            key = reader.value()
+            reader.expect(":")
+            if streamed and (key in ('category', 'name', 'modules')
+                             or key in self.properties):
+                raise ValueError("streaming needs the root's '" + key
+                                 + "' before its elements")
+            if key != 'elements' or streamed \
+                    or root.get('category') != "operation" \
+                    or root.get('name') not in self.operations:
+                root[key] = reader.value()
+                continue
+            head = dict(root, elements=[])
+            modules = head.pop('modules', [])
+            model = self.load(dict(head, modules=modules))
+            pad = " " * level * self.indent
+            for name, body in model.modules:
+                writer.write(pad + "module " + name + "(){\n")
+                self.emitModel(Model(body, []), writer, level + 1)
+                writer.write("\n" + pad + "}\n")
+            parts, children, separator, tail = self.nodeParts(head, level)
+            writer.write(parts)
+            for idx, element in enumerate(reader.items()):
+                self.emitPart(element, writer, level + 1,
+                              "tree.elements[" + str(idx) + "]")
+                writer.write(separator)
+            streamed = True
+        reader.expect("}")
+        if reader.peek():
+            raise ValueError("unexpected text after the root object")
+        if streamed:
+            writer.write(tail)
+        else:
+            self.emitPart(root, writer, level, "tree")
+
+    def streamLines(self, chunks, writer):
+        """Emits each non-blank line of JSON-lines text as its own part"""
+        number = 0
+        rest = ""
+        for chunk in itertools.chain(chunks, ["\n"]):
+            lines = (rest + chunk).split("\n")
+            rest = lines.pop()
+            for line in lines:
+                number += 1
+                if not line.strip():
+                    continue
+                try:
+                    data = json.loads(line)
+                except ValueError as error:
+                    raise ValueError("line " + str(number) + ": "
+                                     + str(error))
+                self.emitPart(data, writer, self.level,
+                              "line " + str(number))
+                writer.write("\n")
+
+    def loadOptimized(self, data, reports=None):
+        """
+        Returns the Model of a tree after optimization, validating the
+        input before any pass reads it
+        """
+        model = self.load(data)
+        if self.passes or self.resolution:
+            optimized = self.optimize(data, reports)
+            if optimized is not data:
+                model = self.load(optimized)
+        return model
+
+    def fail(self, path, message):
+        """
+        Raises a SchemaError for the node at path, a linked list of
+        (parent path, key, index) steps, with index None for plain keys
+        """
+        steps = []
+        while path:
+            path, key, idx = path
+            steps.append("." + key if idx is None
+                         else "." + key + "[" + str(idx) + "]")
+        raise SchemaError("tree" + "".join(reversed(steps)), message)
+
+    def fieldSpecs(self, fields):
+        """
+        Returns (key, check, falseOk, required, description) for each
+        (key, kind, required) field, resolving the kind once
+        """
+        return tuple((key,) + (fieldKinds[kind.rstrip("?")][0],
+                               kind.endswith("?"), required,
+                               fieldKinds[kind.rstrip("?")][1])
+                     for key, kind, required in fields)
+
+    def checkFields(self, data, specs, path):
+        """
+        Returns the values of a node's fields, None where an optional
+        one is absent, failing on the first malformed or missing one
+        """
+        values = []
+        for key, check, falseOk, required, description in specs:
+            if key in data:
+                value = data[key]
+                if not check(value) and not (falseOk and not value):
+                    self.fail((path, key, None), "expected " + description
+                              + ", got " + json.dumps(value, default=repr))
+                values.append(value)
+            elif required:
+                self.fail(path, "missing '" + key + "'")
+            else:
+                values.append(None)
+        return values
+
+    def load(self, data):
+        """
+        Validates a textcad tree and returns it as a Model of typed
+        nodes for emitModel. Raises a SchemaError naming the path of the
+        first malformed node or value, before anything is emitted.
+        """
+        if data.__class__ is not dict:
+            self.fail(None, "expected an object")
+        return self.loadNodes(data)
+
+    def loadNodes(self, data):
+        """
+        Builds the Model for load with an explicit stack. Each entry is
+        a JSON node, its path, and the list or node with the index or
+        attribute its typed node goes in.
+        """
+        root = [None]
+        modules = []
+        stack = [(data, None, root, 0)]
+        for idx, module in enumerate(data.get('modules', [])):
+            path = (None, "modules", idx)
+            if not isinstance(module, dict) or 'name' not in module:
+                self.fail(path, "expected an object with a name and a body")
+            modules.append([module['name'], None])
+            stack.append((module.get('body'), (path, "body", None),
+                          modules[-1], 1))
+        specs = self.specs
+        primitives = self.primitives
+        operations = set(self.operations)
+        properties = self.properties
+        placementSpecs = self.placementSpecs
+        checkFields = self.checkFields
+        while stack:
+            data, path, container, slot = stack.pop()
+            if data.__class__ is not dict:
+                self.fail(path, "expected an object, got "
+                          + json.dumps(data, default=repr))
+            category = data.get('category')
+            name = data.get('name')
+            if not category:
+                node = Empty()
+            elif name.__class__ is not str:
+                self.fail(path, "expected a name")
+            elif category == "element":
+                kind = primitives.get(name)
+                if kind:
+                    node = kind()
+                    for spec in specs[kind]:
+                        key = spec[0]
+                        if key in data:
+                            value = data[key]
+                            if not spec[1](value) \
+                                    and not (spec[2] and not value):
+                                checkFields(data, (spec,), path)
+                        elif spec[3]:
+                            checkFields(data, (spec,), path)
+                        else:
+                            value = None
+                        setattr(node, key, value)
                 else:
-                    a = "echo("+data['name']+");"
-                    self.output += a
-                    self.parseJSON(data['construction'])
-            if data['category'] == "element":
-                props = self.parseProperties(data)
-                output += " " * self.level * args.indent + props
-                if data['name'] in self.elements:
-                    output += self.parseElement(data)
-                    return output
-                elif self.level == 0:
-                    print("Found element '" + data['name'] + "' at top level")
-                    print("Traversing to construction")
-                    output += self.parseJSON(data['construction'])
-                    return output
+                    node = CustomElement()
+            elif category == "operation":
+                if name in operations:
+                    node = Operation()
+                    fields = Operation.arguments.get(name)
+                    if fields:
+                        values = checkFields(data, specs[name], path)
+                        node.argument = values[0] if len(values) == 1 \
+                            else {field[0]: value
+                                  for field, value in zip(fields, values)}
+                    else:
+                        node.argument = None
+                    elements = data.get('elements')
+                    if elements.__class__ is not list:
+                        self.fail(path, name + " needs a list of elements")
+                    node.elements = [None] * len(elements)
+                    for idx in range(len(elements) - 1, -1, -1):
+                        stack.append((elements[idx],
+                                      (path, "elements", idx),
+                                      node.elements, idx))
                 else:
-                    print("Found element '" + data['name']
-                          + "' at level " + str(self.level))
-                    print("Traversing to construction.")
-                    output += self.parseJSON(data['construction'])
-                    return output
+                    node = CustomOperation()
+            elif category == "call":
+                node = Call()
+            else:
+                self.fail(path, "unknown category "
+                          + json.dumps(category, default=repr))
+            if node.__class__ is CustomElement \
+                    and 'construction' not in data \
+                    and self.library is not None and name in self.library:
+                try:
+                    self.library.entry(name)
+                except ValueError as error:
+                    self.fail(path, "component '" + name + "': "
+                              + str(error))
+                node = Component()
+            elif node.__class__ is CustomElement \
+                    or node.__class__ is CustomOperation:
+                if 'construction' not in data:
+                    self.fail(path, "custom " + category + " '" + name
+                              + "' needs a construction")
+                stack.append((data['construction'],
+                              (path, "construction", None), node,
+                              'construction'))
+            node.name = name
+            placement = ()
+            if node.__class__ is not Empty \
+                    and node.__class__ is not CustomOperation:
+                for key in properties:
+                    if key in data:
+                        value = data[key]
+                        spec = placementSpecs[key]
+                        if not spec[1](value) and not (spec[2] and not value):
+                            checkFields(data, (spec,), path)
+                        placement += ((key, value),)
+            node.placement = placement
+            if slot.__class__ is str:
+                setattr(container, slot, node)
+            else:
+                container[slot] = node
+        return Model(root[0], [tuple(module) for module in modules])
+
+    def emit(self, data, writer):
+        """
+        Walks the tree with an explicit stack rather than recursion, so
+        nesting depth is not bounded by the interpreter's recursion limit.
+        The stack holds (node, level) pairs, where the node is either a
+        pending subtree or literal text, such as the text closing an
+        operation body. All traversal state is local, so one engine can
+        emit several trees at once from different threads.
+        """
+        write = writer.write
+        startLevel = self.level
+        stack = [(data, startLevel)]
+        push = stack.append
+        pop = stack.pop
+        pad = " " * startLevel * self.indent
+        for module in reversed(data.get('modules', [])):
+            push(("\n" + pad + "}\n", startLevel))
+            push((module['body'], startLevel + 1))
+            push((pad + "module " + module['name'] + "(){\n", startLevel))
+        while stack:
+            data, level = pop()
+            if data.__class__ is str:
+                write(data)
+                continue
+            head, children, separator, tail = self.nodeParts(data, level)
+            write(head)
+            if tail:
+                push((tail, level))
+            for child in reversed(children):
+                if separator:
+                    push((separator, level))
+                push(child)
+
+    def emitModel(self, model, writer, level=None):
+        """
+        Writes a Model like emit writes a tree, starting at level or at
+        self.level. Nodes are already validated, so each is dispatched
+        by its class through nodeEmitters, or wraps its children,
+        without looking up keys. With a ParallelEmitter set as parallel,
+        the children of wide operations are emitted by its workers.
+        """
+        write = writer.write
+        startLevel = self.level if level is None else level
+        stack = [(model.root, startLevel)]
+        push = stack.append
+        pop = stack.pop
+        pad = " " * startLevel * self.indent
+        for name, body in reversed(model.modules):
+            push(("\n" + pad + "}\n", startLevel))
+            push((body, startLevel + 1))
+            push((pad + "module " + name + "(){\n", startLevel))
+        indent = self.indent
+        wrappers = self.wrappers
+        emitters = self.nodeEmitters
+        operations = self.operationEmitters
+        parallel = self.parallel
+        while stack:
+            node, level = pop()
+            kind = node.__class__
+            if kind is str:
+                write(node)
+                continue
+            if kind is Empty:
+                continue
+            if kind is CustomOperation:
+                push((node.construction, level))
+                continue
+            pad = " " * level * indent
+            if node.placement:
+                pad += "".join([wrappers[key](value)
+                                for key, value in node.placement])
+            if kind is Operation:
+                write(pad + operations[node.name](node.argument) + "{\n")
+                push((" " * level * indent + "}\n", level))
+                level += 1
+                if parallel and len(node.elements) >= parallel.threshold \
+                        and parallel.workers > 1:
+                    for text in parallel.emit(self, node.elements, level):
+                        write(text)
+                    continue
+                for child in reversed(node.elements):
+                    push(("\n", level))
+                    push((child, level))
+            elif kind is CustomElement:
+                write(pad)
+                self.found(node.name, level)
+                push((node.construction, level))
+            elif kind is Component:
+                self.found(node.name, level, component=True)
+                write(pad + self.library.text(node.name, self, level))
+            else:
+                write(pad + emitters[kind](node))
+
+    def found(self, name, level, component=False):
+        """Logs reaching a custom element, under --verbose"""
+        logger.debug("Found element '%s' at %s, %s", name,
+                     "top level" if level == 0 else "level " + str(level),
+                     "using the library component" if component
+                     else "traversing to construction",
+                     extra={"element": name, "level": level,
+                            "component": component})
+
+    def nodeChildren(self, data, level):
+        """Returns the (node, level) pairs nodeParts would return"""
+        if data['category'] == "operation":
+            if data['name'] in self.operations:
+                return [(types, level + 1) for types in data['elements']]
+            return [(data['construction'], level)]
+        elif data['category'] == "element" \
+                and data['name'] not in self.elements \
+                and 'construction' in data:
+            return [(data['construction'], level)]
+        return []
+
+    def nodeParts(self, data, level):
+        """
+        Returns the text written before a node's children, the children
+        as (node, level) pairs, the text following each child and the
+        text written after them all
+        """
+        category = data['category']
+        if not category:
+            return "", [], "", ""
+        pad = " " * level * self.indent
+        if category == "operation":
+            if data['name'] in self.operations:
+                return pad + self.parseOperation(data) + "{\n", \
+                    [(types, level + 1) for types in data['elements']], \
+                    "\n", pad + "}\n"
+            return "", [(data['construction'], level)], "", ""
+        elif category == "element":
+            props = pad + self.parseProperties(data)
+            if data['name'] in self.elements:
+                return props + self.parseElement(data), [], "", ""
+            if 'construction' not in data:
+                self.found(data['name'], level, component=True)
+                return props + self.library.text(data['name'], self,
+                                                 level), [], "", ""
+            self.found(data['name'], level)
+            return props, [(data['construction'], level)], "", ""
+        elif category == "call":
+            return pad + self.parseProperties(data) + data['name'] + "();", \
+                [], "", ""
+        return "", [], "", ""
 
     def parseOperation(self, data):
         """
         Parse an operation and return an OpenSCAD equivalent
         """
-        tempStr = self.parseProperties(data)
-        if data['name'] == "translate":
-            tempStr += self.translate(data['location'])
-        elif data['name'] == "rotate":
-            tempStr += self.rotate(data)
-        elif data['name'] == "union":
-            tempStr += self.union()
-        elif data['name'] == "difference":
-            tempStr += self.difference()
-        elif data['name'] == "intersection":
-            tempStr += self.intersection()
-        elif data['name'] == "mirror":
-            tempStr += self.mirror(data['axis'])
-        elif data['name'] == "scale":
-            tempStr += self.scale(data['multiplier'])
-        elif data['name'] == "resize":
-            tempStr += self.resize(data)
-        elif data['name'] == "hull":
-            tempStr += self.hull()
-        elif data['name'] == "minkowski":
-            tempStr += self.minkowski()
-        return tempStr
+        name = data['name']
+        key = self.operationArguments.get(name)
+        return self.parseProperties(data) \
+            + self.operationEmitters[name](data[key] if key else data)
 
     def parseProperties(self, data):
         tempStr = ""
@@ -91,6 +1075,8 @@ class OpenSCADEngine:
             tempStr += self.highlight()
         if 'color' in data:
             tempStr += self.color(data['color'])
+        if 'matrix' in data:
+            tempStr += self.multmatrix(data['matrix'])
         if 'location' in data:
             tempStr += self.translate(data['location'])
         if 'rotation' in data:
@@ -99,21 +1085,20 @@ class OpenSCADEngine:
             tempStr += self.scale(data['scale'])
         return tempStr
 
+    def placementKeys(self, data):
+        """
+        Returns the keys of data that parseProperties emits as wrappers,
+        leaving out the location a translate operation also uses itself
+        """
+        keys = [key for key in self.properties if key in data]
+        if data['category'] == "operation" and data['name'] == "translate" \
+                and 'location' in keys:
+            keys.remove('location')
+        return keys
+
     def parseElement(self, data):
-        tempStr = ""
-        if data['name'] == "cube":
-            tempStr += self.cube(data)
-        elif data['name'] == "sphere":
-            tempStr += self.sphere(data)
-        elif data['name'] == "cylinder":
-            tempStr += self.cylinder(data)
-        elif data['name'] == "ntube":
-            tempStr += self.ntube(data)
-        elif data['name'] == "cone":
-            tempStr += self.cone(data)
-        elif data['name'] == "hole":
-            tempStr += self.hole(data)
-        return tempStr
+        emitter = self.elementEmitters.get(data['name'])
+        return emitter(data) if emitter else ""
 
     def makeBool(self, pyBool):
         """
@@ -123,7 +1108,7 @@ class OpenSCADEngine:
         return str(pyBool).lower()
 
     def isAllZeros(self, vector):
-        return all(v == 0 for v in vector)
+        return not any(vector)
 
     def makeBinaryList(self, vector):
         """If a value is true/false in a list make it 1/0"""
@@ -135,13 +1120,51 @@ class OpenSCADEngine:
                        default=[False, False, False]
                        ):
         """Returns a translationg statement to apply centering by axis"""
+        return self.translate(self.centeringOffset(centering, extrema,
+                                                   default))
+
+    def centeringOffset(self,
+                        centering,
+                        extrema,
+                        default=[False, False, False]
+                        ):
+        """Returns the translation vector applyCentering emits"""
         vect = [0, 0, 0]
         for idx, val in enumerate(centering):
             if val and not default[idx]:
                 vect[idx] = -extrema[idx]/2
             elif not val and default[idx]:
                 vect[idx] = extrema[idx]/2
-        return self.translate(vect)
+        return vect
+
+    def extrema(self, name, data):
+        """
+        Returns the extrema and default centering the named primitive
+        passes to applyCentering
+        """
+        if name == "cube":
+            return data['size'], [False, False, False]
+        elif name == "sphere":
+            return [data['radius']]*3, [True, True, True]
+        elif name == "cylinder":
+            radius = data['radius']
+        elif name == "cone":
+            radius = max([data['topRadius'], data['bottomRadius']])
+        elif name == "ntube":
+            radius = self.radiusFromApothem(apothem=data['apothem'],
+                                            sides=data['sides'])
+        elif name == "hole":
+            radius = self.holeRadius(data)
+        return [radius, radius, data['height']], [True, True, False]
+
+    def fragmentCount(self, fragments, radius):
+        """
+        Returns $fn for a round primitive: the count a resolution policy
+        stored, or twenty fragments per unit of radius when it is None
+        """
+        if fragments is not None:
+            return fragments
+        return int(round(radius*20))
 
     def holeSides(self, radius):
         return max([math.floor(4*radius), 3])
@@ -152,30 +1175,42 @@ class OpenSCADEngine:
     def radiusFromApothem(self, apothem, sides):
         return apothem / math.cos(math.pi / sides)
 
-    def hole(self, data):
-        tempStr = ""
-        sides = self.holeSides(data['radius'])
+    def holeRadius(self, data):
+        """Returns the circumradius of a hole, tolerance included"""
         radius = self.radiusFromApothem(apothem=data['radius'],
-                                        sides=sides)
+                                        sides=self.holeSides(data['radius']))
         if 'tolerance' in data:
             radius += data['tolerance']
-        tempStr += self.applyCentering(centering=data['center'],
-                                       extrema=[radius, radius,
-                                                data['height']],
+        return radius
+
+    def hole(self, data):
+        return self.holeText(data['radius'], data['height'], data['center'],
+                             data.get('tolerance'))
+
+    def holeText(self, radius, height, center, tolerance=None):
+        tempStr = ""
+        sides = self.holeSides(radius)
+        outer = self.radiusFromApothem(apothem=radius, sides=sides)
+        if tolerance is not None:
+            outer += tolerance
+        tempStr += self.applyCentering(centering=center,
+                                       extrema=[outer, outer, height],
                                        default=[True, True, False])
-        tempStr += "cylinder(r=" + str(radius) + ", h=" + str(data['height']) \
+        tempStr += "cylinder(r=" + str(outer) + ", h=" + str(height) \
                    + ", $fn=" + str(sides)+");"
         return tempStr
 
     def ntube(self, data):
+        return self.ntubeText(data['apothem'], data['sides'], data['height'],
+                              data['center'])
+
+    def ntubeText(self, apothem, sides, height, center):
         tempStr = ""
-        sides = data['sides']
-        radius = self.radiusFromApothem(apothem=data['apothem'], sides=sides)
-        tempStr += self.applyCentering(centering=data['center'],
-                                       extrema=[radius, radius,
-                                                data['height']],
+        radius = self.radiusFromApothem(apothem=apothem, sides=sides)
+        tempStr += self.applyCentering(centering=center,
+                                       extrema=[radius, radius, height],
                                        default=[True, True, False])
-        tempStr += "cylinder(r="+str(radius) + ", h="+str(data['height']) \
+        tempStr += "cylinder(r="+str(radius) + ", h="+str(height) \
                    + ", $fn=" + str(sides)+");"
         return tempStr
 
@@ -183,54 +1218,69 @@ class OpenSCADEngine:
         """
         Returns an OpenSCAD cylinder string
         """
+        return self.coneText(data['topRadius'], data['bottomRadius'],
+                             data['height'], data['center'],
+                             data.get('fragments'))
+
+    def coneText(self, topRadius, bottomRadius, height, center,
+                 fragments=None):
         tempStr = ""
-        maxRadius = max([data['topRadius'], data['bottomRadius']])
-        tempStr += self.applyCentering(centering=data['center'],
-                                       extrema=[maxRadius,
-                                                maxRadius,
-                                                data['height']],
+        maxRadius = max([topRadius, bottomRadius])
+        tempStr += self.applyCentering(centering=center,
+                                       extrema=[maxRadius, maxRadius, height],
                                        default=[True, True, False])
-        tempStr += "cylinder(r1=" + str(data['bottomRadius']) + ", r2=" \
-                   + str(data['topRadius']) + ", h=" + str(data['height']) \
-                   + ", $fn=" + str(maxRadius*20) + ");"
+        tempStr += "cylinder(r1=" + str(bottomRadius) + ", r2=" \
+                   + str(topRadius) + ", h=" + str(height) \
+                   + ", $fn=" + str(self.fragmentCount(fragments, maxRadius)) \
+                   + ");"
         return tempStr
 
     def cube(self, data):
         """
         Returns an OpenSCAD cube string
         """
+        return self.cubeText(data['size'], data['center'])
+
+    def cubeText(self, size, center):
         tempStr = ""
-        tempStr += self.applyCentering(centering=data['center'],
-                                       extrema=data['size'],
+        tempStr += self.applyCentering(centering=center,
+                                       extrema=size,
                                        default=[False, False, False])
-        tempStr += "cube(size=" + str(data['size']) + ");"
+        tempStr += "cube(size=" + str(size) + ");"
         return tempStr
 
     def sphere(self, data):
         """
         Returns an OpenSCAD sphere string
         """
+        return self.sphereText(data['radius'], data['center'],
+                               data.get('fragments'))
+
+    def sphereText(self, radius, center, fragments=None):
         tempStr = ""
-        tempStr += self.applyCentering(centering=data['center'],
-                                       extrema=[data['radius']]*3,
+        tempStr += self.applyCentering(centering=center,
+                                       extrema=[radius]*3,
                                        default=[True, True, True])
-        tempStr += "sphere(r=" + str(data['radius']) \
-                   + ", $fn=" + str(data['radius']*20) + ");"
+        tempStr += "sphere(r=" + str(radius) \
+                   + ", $fn=" + str(self.fragmentCount(fragments, radius)) \
+                   + ");"
         return tempStr
 
     def cylinder(self, data):
         """
         Returns an OpenSCAD cylinder string
         """
+        return self.cylinderText(data['radius'], data['height'],
+                                 data['center'], data.get('fragments'))
+
+    def cylinderText(self, radius, height, center, fragments=None):
         tempStr = ""
-        tempStr += self.applyCentering(centering=data['center'],
-                                       extrema=[data['radius'],
-                                                data['radius'],
-                                                data['height']],
+        tempStr += self.applyCentering(centering=center,
+                                       extrema=[radius, radius, height],
                                        default=[True, True, False])
-        tempStr += "cylinder(r=" + str(data['radius']) + ", h=" \
-                   + str(data['height']) + ", $fn=" \
-                   + str((data['radius'])*20) + ");"
+        tempStr += "cylinder(r=" + str(radius) + ", h=" \
+                   + str(height) + ", $fn=" \
+                   + str(self.fragmentCount(fragments, radius)) + ");"
         return tempStr
 
     def rotate(self, rotation):
@@ -277,6 +1327,95 @@ class OpenSCADEngine:
         else:
             return ""
 
+    def linearArray(self, array):
+        """Copies along a line: copy i is moved by i times step"""
+        return "for(i=[0:" + str(array['count'] - 1) + "])translate(v=i*" \
+            + str(array['step']) + ")"
+
+    def gridArray(self, array):
+        """
+        Copies on a grid of counts, 2 or 3 of them, spaced by spacing
+        along x, y and z
+        """
+        names = "ijk"[:len(array['counts'])]
+        ranges = [name + "=[0:" + str(count - 1) + "]"
+                  for name, count in zip(names, array['counts'])]
+        offsets = [name + "*" + str(step)
+                   for name, step in zip(names, array['spacing'])]
+        return "for(" + ", ".join(ranges) + ")translate(v=[" \
+            + ", ".join(offsets + ["0"] * (3 - len(names))) + "])"
+
+    def polarStep(self, array):
+        """
+        Returns the angle between copies of a polar array: a whole turn
+        is split evenly, a partial sweep puts copies at both of its ends
+        """
+        angle = array.get('angle')
+        if angle is None:
+            angle = 360
+        if array['count'] > 1 and angle % 360:
+            return angle / (array['count'] - 1)
+        return angle / array['count']
+
+    def polarArray(self, array):
+        """Copies moved out by radius, then turned about z"""
+        return "for(i=[0:" + str(array['count'] - 1) + "])rotate(a=i*" \
+            + str(self.polarStep(array)) + ", v=[0, 0, 1])" \
+            + self.translate([array.get('radius') or 0, 0, 0])
+
+    def pointArray(self, points):
+        """A copy moved to each point"""
+        return "for(p=" + str(points) + ")translate(v=p)"
+
+    def arrayCount(self, data):
+        """Returns how many copies of its children an array makes"""
+        if data['name'] == "gridArray":
+            return math.prod(data['counts'])
+        if data['name'] == "pointArray":
+            return len(data['points'])
+        return data['count']
+
+    def arrayCopies(self, data):
+        """
+        Returns the (angle, offset) of each copy an array makes: the copy
+        is moved by offset, then turned by angle about z
+        """
+        name = data['name']
+        if name == "linearArray":
+            return [(0, [idx * step for step in data['step']])
+                    for idx in range(data['count'])]
+        elif name == "gridArray":
+            counts = list(data['counts']) + [1] * (3 - len(data['counts']))
+            return [(0, [idx * step for idx, step
+                         in zip(cell, data['spacing'])])
+                    for cell in itertools.product(*map(range, counts))]
+        elif name == "polarArray":
+            step = self.polarStep(data)
+            return [(idx * step, [data.get('radius') or 0, 0, 0])
+                    for idx in range(data['count'])]
+        return [(0, point) for point in data['points']]
+
+    def nodeCopies(self, data):
+        """
+        Yields each node of a tree, module bodies and constructions
+        included, with the number of copies the arrays above it make
+        """
+        stack = [(data, 1)]
+        while stack:
+            node, copies = stack.pop()
+            yield node, copies
+            if node.get('category') == "operation" \
+                    and node.get('name') in self.arrays:
+                inner = copies * self.arrayCount(node)
+            else:
+                inner = copies
+            stack.extend((child, inner)
+                         for child in reversed(node.get('elements', [])))
+            if 'construction' in node:
+                stack.append((node['construction'], copies))
+            for module in node.get('modules', []):
+                stack.append((module['body'], copies))
+
     def minkowski(self):
         return "minkowski()"
 
@@ -295,51 +1434,4018 @@ class OpenSCADEngine:
     def highlight(self):
         return "#"
 
-if __name__ == "__main__":
-    #Setup Command line arguments
-    parser = argparse.ArgumentParser(prog="textcad",
-                                     usage="%(prog)s [options] input...",
-                                     description="The textcad engine."
-                                     )
-    parser.add_argument("-o", "--output", nargs='?',
-                        type=argparse.FileType('w'),
-                        default=sys.stdout,
-                        help="Output file, defaults to stdout"
-                        )
-    parser.add_argument("input", nargs='?',
-                        type=argparse.FileType('r'),
-                        default=sys.stdin,
-                        help="input file, defaults to stdin"
-                        )
-    parser.add_argument("-v", "--verbose",
-                        type=bool,
-                        help="verbose output while traversing textcad file"
-                        )
-    parser.add_argument("-s", "--show",
-                        action='store_true',
-                        default=False,
-                        help="launch OpenSCAD with the file when finished"
-                        )
-    parser.add_argument("-i", "--indent",
-                        type=int,
-                        default=4,
-                        help="number of spaces for indentation (default: 4)"
-                        )
-    parser.add_argument('--version',
-                        action='version',
-                        version="%(prog)s 0.0.1-dev"
-                        )
+class DeduplicatePass:
+    """
+    Hoists repeated subtrees into OpenSCAD modules.
+    Subtrees are hashed structurally with their placement properties left
+    out, so one sub-assembly used at several locations becomes a single
+    module and each occurrence a call under its own placement. A subtree
+    is hoisted when it has at least minNodes nodes and still occurs at
+    least minCount times outside larger hoisted subtrees.
+    """
+    def __init__(self, minNodes=4, minCount=2):
+        self.minNodes = minNodes
+        self.minCount = minCount
+        self.hoisted = []
 
-    #Always output help by default
-    if len(sys.argv) == 1:
-        parser.print_help()
-        sys.exit(0)  # Exit after help display
+    def options(self):
+        return {"minNodes": self.minNodes, "minCount": self.minCount}
 
-    args = parser.parse_args()
+    def flatten(self, data):
+        """
+        Returns the nodes in pre-order with their parent index and slot.
+        The bodies of modules already on the root follow the root subtree,
+        each as its own subtree with the slot ('module', index).
+        """
+        nodes, parents, slots = [], [], []
+        stack = [(module['body'], -1, ('module', idx))
+                 for idx, module in reversed(list(enumerate(
+                     data.get('modules', []))))]
+        stack.append((data, -1, None))
+        while stack:
+            node, parent, slot = stack.pop()
+            index = len(nodes)
+            nodes.append(node)
+            parents.append(parent)
+            slots.append(slot)
+            if 'construction' in node:
+                stack.append((node['construction'], index, 'construction'))
+            elements = node.get('elements', [])
+            for idx in range(len(elements) - 1, -1, -1):
+                stack.append((elements[idx], index, idx))
+        return nodes, parents, slots
 
-    j = json.loads(args.input.read())
-    c = OpenSCADEngine()
-    c.output = c.parseJSON(j)
-    args.output.write(c.output)
+    def hashNodes(self, engine, nodes, parents):
+        """
+        Returns the size and placement-free digest of every subtree,
+        computed bottom-up from the pre-order list
+        """
+        count = len(nodes)
+        sizes = [1] * count
+        bodies = [None] * count
+        children = [[] for idx in range(count)]
+        for idx in range(count - 1, -1, -1):
+            node = nodes[idx]
+            placement = engine.placementKeys(node)
+            own = {key: val for key, val in node.items()
+                   if key not in placement
+                   and key not in ('elements', 'construction', 'modules')}
+            digest = hashlib.sha1(json.dumps(own, sort_keys=True).encode())
+            for child in reversed(children[idx]):
+                digest.update(child.encode())
+            bodies[idx] = digest.hexdigest()
+            full = hashlib.sha1(bodies[idx].encode())
+            full.update(json.dumps([node[key] for key in placement])
+                        .encode())
+            if parents[idx] >= 0:
+                sizes[parents[idx]] += sizes[idx]
+                children[parents[idx]].append(full.hexdigest())
+        return sizes, bodies
+
+    def run(self, engine, data):
+        nodes, parents, slots = self.flatten(data)
+        sizes, bodies = self.hashNodes(engine, nodes, parents)
+        groups = {}
+        for idx, size in enumerate(sizes):
+            if size >= self.minNodes:
+                groups.setdefault(bodies[idx], []).append(idx)
+        candidates = sorted((group for group in groups.values()
+                             if len(group) >= self.minCount),
+                            key=lambda group: -sizes[group[0]])
+        # Larger subtrees go first; copies after the first occurrence of a
+        # hoisted subtree are never emitted, so nothing inside them counts.
+        skipped = bytearray(len(nodes))
+        calls = {}
+        modules = []
+        self.hoisted = []
+        existing = data.get('modules', [])
+        taken = set(module['name'] for module in existing)
+        for group in candidates:
+            live = [idx for idx in group if not skipped[idx]]
+            if len(live) < self.minCount:
+                continue
+            prefix = name = "part_" + bodies[live[0]][:10]
+            suffix = 1
+            while name in taken:
+                name = "%s_%d" % (prefix, suffix)
+                suffix += 1
+            taken.add(name)
+            for idx in live[1:]:
+                end = idx + sizes[idx]
+                skipped[idx + 1:end] = b"\x01" * (end - idx - 1)
+            for idx in live:
+                calls[idx] = name
+            modules.append((name, live[0]))
+            self.hoisted.append((name, sizes[live[0]], len(live)))
+        if not calls:
+            return data
+
+        copies = [None] * len(nodes)
+        root = [None]
+        moduleBodies = [module['body'] for module in existing]
+        for idx, node in enumerate(nodes):
+            if skipped[idx]:
+                continue
+            placement = engine.placementKeys(node)
+            copy = dict(node)
+            if 'elements' in node:
+                copy['elements'] = [None] * len(node['elements'])
+            if idx in calls:
+                for key in placement:
+                    del copy[key]
+                attached = {"category": "call", "name": calls[idx]}
+                for key in placement:
+                    attached[key] = node[key]
+            else:
+                attached = copy
+            copies[idx] = copy
+            if slots[idx] is not None and parents[idx] < 0:
+                moduleBodies[slots[idx][1]] = attached
+            elif parents[idx] < 0:
+                root[0] = attached
+            elif slots[idx] == 'construction':
+                copies[parents[idx]]['construction'] = attached
+            else:
+                copies[parents[idx]]['elements'][slots[idx]] = attached
+        result = dict(root[0])
+        # Existing bodies may now call hoisted modules, which come after
+        # them as hoisted bodies come after the bodies that call them
+        result['modules'] = [dict(module, body=body) for module, body
+                             in zip(existing, moduleBodies)]
+        result['modules'].extend({"name": name, "body": copies[idx]}
+                                 for name, idx in modules)
+        return result
+
+
+class TransformFoldPass:
+    """
+    Folds chains of affine transforms into a single multmatrix.
+    The location/rotation/scale properties, the centering translate of a
+    primitive and translate/rotate/mirror/scale operations are composed
+    along each path with NumPy 4x4 matrices. Each primitive, call and
+    non-transform operation then carries one 'matrix' property; transform
+    operations disappear into their only child, or become a union with the
+    matrix when they have several children or a color/highlight. Matrix
+    entries are rounded to decimals places and snapped to zero within
+    tolerance. The number of operations folded away is kept in removed.
+    """
+    transforms = ["translate", "rotate", "mirror", "scale"]
+
+    def __init__(self, tolerance=1e-9, decimals=10):
+        if numpy is None:
+            raise ImportError("transform folding requires NumPy")
+        self.tolerance = tolerance
+        self.decimals = decimals
+        self.removed = 0
+
+    def options(self):
+        return {"tolerance": self.tolerance, "decimals": self.decimals}
+
+    def translation(self, vector):
+        matrix = numpy.identity(4)
+        matrix[:3, 3] = vector
+        return matrix
+
+    def rotation(self, engine, rotation):
+        """Rotation about an axis through the origin, as OpenSCAD rotate"""
+        axis = numpy.array(engine.makeBinaryList(rotation['axis']), float)
+        matrix = numpy.identity(4)
+        if not axis.any():
+            return matrix
+        x, y, z = axis / numpy.linalg.norm(axis)
+        angle = math.radians(rotation['angle'])
+        cos, sin = math.cos(angle), math.sin(angle)
+        cross = numpy.array([[0, -z, y], [z, 0, -x], [-y, x, 0]])
+        matrix[:3, :3] = cos * numpy.identity(3) + sin * cross \
+            + (1 - cos) * numpy.outer([x, y, z], [x, y, z])
+        return matrix
+
+    def scaling(self, multiplier):
+        matrix = numpy.identity(4)
+        if multiplier:
+            # A scalar or one-element multiplier scales every axis
+            matrix[:3, :3] = numpy.diag(numpy.broadcast_to(
+                numpy.asarray(multiplier, float), 3))
+        return matrix
+
+    def mirroring(self, engine, axis):
+        matrix = numpy.identity(4)
+        normal = numpy.array(engine.makeBinaryList(axis or [0, 0, 0]), float)
+        if normal.any():
+            matrix[:3, :3] -= 2 * numpy.outer(normal, normal) \
+                / normal.dot(normal)
+        return matrix
+
+    def inner(self, engine, data):
+        """
+        Returns the matrix an operation or a primitive's centering applies
+        inside the node's own property wrappers
+        """
+        if data['category'] == "operation":
+            if data['name'] == "translate":
+                return self.translation(data['location'])
+            elif data['name'] == "rotate":
+                return self.rotation(engine, data)
+            elif data['name'] == "mirror":
+                return self.mirroring(engine, data['axis'])
+            elif data['name'] == "scale":
+                return self.scaling(data['multiplier'])
+        elif data['category'] == "element" and data['name'] in engine.elements:
+            extrema, default = engine.extrema(data['name'], data)
+            return self.translation(
+                engine.centeringOffset(data['center'], extrema, default))
+        return numpy.identity(4)
+
+    def locals(self, engine, nodes):
+        """
+        Returns, as one (n, 4, 4) array, the matrix of the wrappers emitted
+        around each node's own geometry: matrix, location, rotation and
+        scale from parseProperties, then the operation or centering. Custom operations
+        emit no wrappers of their own.
+        """
+        count = len(nodes)
+        identity = numpy.identity(4)
+        locations = numpy.zeros((count, 3))
+        scales = numpy.ones((count, 3))
+        rotations = numpy.tile(identity, (count, 1, 1))
+        inners = numpy.tile(identity, (count, 1, 1))
+        for idx, data in enumerate(nodes):
+            if data['category'] == "operation" \
+                    and data['name'] not in engine.operations:
+                continue
+            if 'location' in data:
+                locations[idx] = data['location']
+            if 'rotation' in data:
+                rotations[idx] = self.rotation(engine, data['rotation'])
+            if data.get('scale'):
+                scales[idx] = data['scale']
+            inners[idx] = self.inner(engine, data)
+        matrices = numpy.tile(identity, (count, 1, 1))
+        matrices[:, :3, 3] = locations
+        diagonal = numpy.arange(3)
+        scaling = numpy.tile(identity, (count, 1, 1))
+        scaling[:, diagonal, diagonal] = scales
+        for idx, data in enumerate(nodes):
+            if 'matrix' in data:
+                matrices[idx] = numpy.array(data['matrix']) @ matrices[idx]
+        return matrices @ rotations @ scaling @ inners
+
+    def local(self, engine, data):
+        return self.locals(engine, [data])[0]
+
+    def frames(self, engine, data, matrix):
+        """
+        Returns the world matrix of the frame a node's children are
+        placed in, given its parent's, one per copy for arrays, with the
+        copy's label
+        """
+        return self.copies(engine, data, matrix @ self.local(engine, data))
+
+    def copies(self, engine, data, inner):
+        """
+        Returns frames as frames() does, given the world matrix of the
+        node itself
+        """
+        if data['category'] == "operation" and data['name'] in engine.arrays:
+            return [(inner @ self.rotation(
+                engine, {"angle": angle, "axis": [0, 0, 1]})
+                @ self.translation(offset), " (copy " + str(idx) + ")")
+                for idx, (angle, offset)
+                in enumerate(engine.arrayCopies(data))]
+        return [(inner, "")]
+
+    def clean(self, matrix):
+        matrix = numpy.round(matrix, self.decimals)
+        matrix[numpy.abs(matrix) < self.tolerance] = 0
+        return (matrix + 0.0).tolist()
+
+    def strip(self, data, matrix):
+        """Returns a copy of data with its transforms replaced by matrix"""
+        copy = {key: val for key, val in data.items()
+                if key not in ('location', 'rotation', 'scale', 'matrix')}
+        if not numpy.allclose(matrix, numpy.identity(4),
+                              atol=self.tolerance):
+            copy['matrix'] = self.clean(matrix)
+        return copy
+
+    def run(self, engine, data):
+        self.removed = 0
+        holder = {}
+        stack = [(data, self.local(engine, data), holder, 'root')]
+        while stack:
+            node, matrix, container, slot = stack.pop()
+            category = node['category']
+            children = node.get('elements', [])
+            if category == "operation" and node['name'] in self.transforms \
+                    and len(children) == 1 and 'color' not in node \
+                    and 'highlight' not in node and 'modules' not in node:
+                self.removed += 1
+                child = children[0]
+                stack.append((child, matrix @ self.local(engine, child),
+                              container, slot))
+                continue
+            if 'construction' in node:
+                copy = self.strip(node, numpy.identity(4))
+                construction = node['construction']
+                stack.append((construction,
+                              matrix @ self.local(engine, construction),
+                              copy, 'construction'))
+            else:
+                copy = self.strip(node, matrix)
+            if category == "element" and node['name'] in engine.elements:
+                copy['center'] = engine.extrema(node['name'], node)[1]
+            elif category == "operation" and 'elements' in node:
+                if node['name'] in self.transforms:
+                    copy['name'] = "union"
+                copy['elements'] = [None] * len(children)
+                if children:
+                    for idx, composed in enumerate(
+                            self.locals(engine, children)):
+                        stack.append((children[idx], composed,
+                                      copy['elements'], idx))
+            if 'modules' in node:
+                copy['modules'] = [dict(module) for module in node['modules']]
+                for module in copy['modules']:
+                    stack.append((module['body'],
+                                  self.local(engine, module['body']),
+                                  module, 'body'))
+            container[slot] = copy
+        return holder['root']
+
+
+class ResolutionPolicy:
+    """
+    Chooses $fn for the round primitives (cylinder, sphere, cone).
+    The fragment count of each primitive keeps the chord error, the gap
+    between the true circle and its polygon, under chordError, clamped
+    to [minFragments, maxFragments] or to a per-primitive range in
+    limits. With a facetBudget, counts are then lowered so the estimated
+    facets of the whole model fit it, each primitive getting a share
+    proportional to its surface area. Primitives inside arrays count once
+    per copy. Holes and ntubes keep the sides their emitters derive. The
+    estimated facet totals with the default twenty fragments per unit of
+    radius and with this policy are kept in before and after.
+    """
+    modes = {"preview": (0.5, 8, 32),
+             "draft": (0.1, 12, 90),
+             "production": (0.01, 16, 360)}
+    rounded = ["cylinder", "sphere", "cone"]
+
+    def __init__(self, mode="production", chordError=None, minFragments=None,
+                 maxFragments=None, limits={}, facetBudget=None):
+        if mode not in self.modes:
+            raise ValueError("unknown resolution mode '" + mode + "'")
+        defaults = self.modes[mode]
+        self.mode = mode
+        self.chordError = chordError or defaults[0]
+        self.minFragments = minFragments or defaults[1]
+        self.maxFragments = maxFragments or defaults[2]
+        self.limits = limits
+        self.facetBudget = facetBudget
+        self.before = 0
+        self.after = 0
+        self.copies = {}
+
+    def options(self):
+        return {"chordError": self.chordError,
+                "minFragments": self.minFragments,
+                "maxFragments": self.maxFragments,
+                "limits": sorted(self.limits.items()),
+                "facetBudget": self.facetBudget}
+
+    def radius(self, data):
+        if data['name'] == "cone":
+            return max([data['topRadius'], data['bottomRadius']])
+        return data['radius']
+
+    def area(self, data):
+        radius = self.radius(data)
+        if data['name'] == "sphere":
+            return 4 * math.pi * radius ** 2
+        return 2 * math.pi * radius * (radius + data['height'])
+
+    def chordFragments(self, radius):
+        """Fewest fragments keeping the chord error under chordError"""
+        if radius <= self.chordError / 2:
+            return 3
+        return math.ceil(math.pi / math.acos(1 - self.chordError / radius))
+
+    def clamp(self, name, fragments):
+        low, high = self.limits.get(name, (self.minFragments,
+                                           self.maxFragments))
+        return int(min(max(fragments, low, 3), high))
+
+    def facets(self, name, fragments):
+        """Estimated triangle count of a primitive at a fragment count"""
+        if name == "cube":
+            return 12
+        if name == "sphere":
+            rings = (fragments + 1) // 2
+            return 2 * fragments * (rings - 1) + 2 * (fragments - 2)
+        return 4 * fragments - 4
+
+    def fit(self, name, share, fragments):
+        """Largest count up to fragments whose facets fit in share"""
+        low = self.clamp(name, 0)
+        while fragments > low and self.facets(name, fragments) > share:
+            fragments = max(low, min(fragments - 1,
+                                     int(fragments * 0.9)))
+        return fragments
+
+    def cost(self, node, fragments):
+        """Estimated facets of every copy of a primitive"""
+        return self.copies[id(node)] * self.facets(node['name'], fragments)
+
+    def run(self, engine, data):
+        data = copyTree(data)
+        fixed = 0
+        self.before = 0
+        self.copies = {}
+        primitives = []
+        for node, copies in engine.nodeCopies(data):
+            name = node['name']
+            if node['category'] != "element" or name not in engine.elements:
+                continue
+            self.copies[id(node)] = copies
+            if name in self.rounded:
+                radius = self.radius(node)
+                self.before += self.cost(node, engine.fragmentCount(
+                    node.get('fragments'), radius))
+                node['fragments'] = self.clamp(
+                    name, self.chordFragments(radius))
+                primitives.append(node)
+            else:
+                if name == "hole":
+                    sides = engine.holeSides(node['radius'])
+                else:
+                    sides = node.get('sides', 0)
+                fixed += self.cost(node, sides)
+        self.before += fixed
+        total = fixed + sum(self.cost(node, node['fragments'])
+                            for node in primitives)
+        if self.facetBudget and total > self.facetBudget:
+            self.distribute(primitives, self.facetBudget - fixed)
+        self.after = fixed + sum(self.cost(node, node['fragments'])
+                                 for node in primitives)
+        self.copies = {}
+        return data
+
+    def distribute(self, primitives, budget):
+        """
+        Water-fills the budget by area share: a primitive whose share
+        covers its chord-error count keeps it, one whose share is below
+        its minimum count is held at the minimum, and what either leaves
+        over is shared again among the rest
+        """
+        area = lambda node: self.copies[id(node)] * self.area(node)
+        pending = list(primitives)
+        while pending:
+            weight = sum(map(area, pending))
+            settled = []
+            for node in pending:
+                share = budget * area(node) / weight
+                least = self.clamp(node['name'], 0)
+                if self.cost(node, node['fragments']) <= share:
+                    settled.append(node)
+                elif self.cost(node, least) >= share:
+                    node['fragments'] = least
+                    settled.append(node)
+            if not settled:
+                break
+            for node in settled:
+                budget -= self.cost(node, node['fragments'])
+                pending.remove(node)
+        for node in pending:
+            share = budget * area(node) / weight
+            node['fragments'] = self.fit(node['name'],
+                                         share / self.copies[id(node)],
+                                         node['fragments'])
+
+    def report(self):
+        return "estimated facets: " + str(self.before) + " -> " \
+            + str(self.after) + " (" + self.mode + ")"
+
+
+class BoundsAnalysis:
+    """
+    Axis-aligned bounding boxes of textcad nodes.
+    Arrays cover the box of every copy they make.
+    A box is a (low, high) pair of NumPy vectors, None for geometry that
+    is provably empty, or infinite where it cannot be bounded (resize).
+    The inner box of a node covers its own geometry before its wrappers;
+    outer() maps it through them into the parent's frame. Primitive boxes
+    follow the same extrema applyCentering uses.
+    """
+    def __init__(self, tolerance=1e-9):
+        self.fold = TransformFoldPass(tolerance=tolerance)
+        self.tolerance = tolerance
+        self.unbounded = (numpy.full(3, -numpy.inf), numpy.full(3, numpy.inf))
+        self.inner = {}
+        self.modules = {}
+
+    def primitive(self, engine, data):
+        extrema, default = engine.extrema(data['name'], data)
+        if data['name'] == "cube":
+            return numpy.zeros(3), numpy.array(extrema, float)
+        radius = extrema[0]
+        if data['name'] == "sphere":
+            return numpy.full(3, -radius), numpy.full(3, radius)
+        return numpy.array([-radius, -radius, 0.0]), \
+            numpy.array([radius, radius, extrema[2]], float)
+
+    def transform(self, matrix, box):
+        if box is None:
+            return None
+        low, high = box
+        if numpy.isinf(low).any() or numpy.isinf(high).any():
+            return self.unbounded
+        corners = numpy.array([[(low, high)[(idx >> axis) & 1][axis]
+                                for axis in range(3)] for idx in range(8)])
+        corners = corners @ matrix[:3, :3].T + matrix[:3, 3]
+        return corners.min(axis=0), corners.max(axis=0)
+
+    def outer(self, engine, data):
+        return self.transform(self.fold.local(engine, data),
+                              self.inner[id(data)])
+
+    def merge(self, boxes):
+        boxes = [box for box in boxes if box is not None]
+        if not boxes:
+            return None
+        return numpy.min([box[0] for box in boxes], axis=0), \
+            numpy.max([box[1] for box in boxes], axis=0)
+
+    def intersect(self, boxes):
+        if not boxes or any(box is None for box in boxes):
+            return None
+        low = numpy.max([box[0] for box in boxes], axis=0)
+        high = numpy.min([box[1] for box in boxes], axis=0)
+        if (low - high > self.tolerance).any():
+            return None
+        return low, high
+
+    def overlaps(self, first, second):
+        return self.intersect([first, second]) is not None
+
+    def combine(self, engine, data):
+        """Returns the inner box of an operation from its children"""
+        boxes = [self.outer(engine, child) for child in data['elements']]
+        if data['name'] == "difference":
+            return boxes[0] if boxes else None
+        elif data['name'] == "intersection":
+            return self.intersect(boxes)
+        elif data['name'] == "minkowski":
+            if not boxes or any(box is None for box in boxes):
+                return None
+            return sum(box[0] for box in boxes), sum(box[1] for box in boxes)
+        elif data['name'] == "resize":
+            return self.unbounded if self.merge(boxes) else None
+        elif data['name'] in engine.arrays:
+            return self.copies(engine, data, self.merge(boxes))
+        return self.merge(boxes)
+
+    def copies(self, engine, data, box):
+        """Returns the box covering every copy an array makes of box"""
+        copies = engine.arrayCopies(data)
+        if box is None or not copies:
+            return None
+        if all(angle == 0 for angle, offset in copies):
+            offsets = numpy.array([offset for angle, offset in copies],
+                                  float)
+            return box[0] + offsets.min(axis=0), box[1] + offsets.max(axis=0)
+        return self.merge([self.transform(
+            self.fold.rotation(engine, {"angle": angle, "axis": [0, 0, 1]})
+            @ self.fold.translation(offset), box)
+            for angle, offset in copies])
+
+    def measure(self, engine, data):
+        """Stores the inner box of a node whose children are measured"""
+        if data['category'] == "element" and data['name'] in engine.elements:
+            box = self.primitive(engine, data)
+        elif data['category'] == "call":
+            box = self.modules.get(data['name'], self.unbounded)
+        elif 'construction' in data:
+            box = self.outer(engine, data['construction'])
+        elif data['category'] == "operation" and 'elements' in data:
+            box = self.combine(engine, data)
+        else:
+            box = self.unbounded
+        self.inner[id(data)] = box
+        return box
+
+    def postorder(self, data):
+        """Yields the nodes of a tree, each after all of its children"""
+        stack = [(data, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                yield node
+                continue
+            stack.append((node, True))
+            if 'construction' in node:
+                stack.append((node['construction'], False))
+            for child in reversed(node.get('elements', [])):
+                stack.append((child, False))
+
+    def measureModules(self, engine, data):
+        # Bodies only call modules hoisted after them, so go backwards
+        for module in reversed(data.get('modules', [])):
+            for node in self.postorder(module['body']):
+                self.visit(engine, node)
+            self.modules[module['name']] = self.outer(engine, module['body'])
+
+    def visit(self, engine, data):
+        self.measure(engine, data)
+
+    def measured(self, engine, data):
+        """Returns a copy of the analysis holding every node's inner box"""
+        job = copy.copy(self)
+        job.inner = {}
+        job.modules = {}
+        job.measureModules(engine, data)
+        for node in job.postorder(data):
+            job.visit(engine, node)
+        return job
+
+    def analyze(self, engine, data):
+        """
+        Returns the box of every node of a tree in its parent's frame,
+        keyed by id() of the node
+        """
+        job = self.measured(engine, data)
+        return {key: job.outer(engine, node)
+                for key, node in ((id(node), node)
+                                  for node in iterNodes(data))}
+
+
+class SimplifyPass(BoundsAnalysis):
+    """
+    Rewrites boolean operations using bounding boxes:
+    difference subtrahends that cannot touch the minuend are dropped,
+    provably empty intersections are removed, unions nested directly in
+    unions are flattened and boolean wrappers left with a single child
+    are replaced by it. Highlighted nodes are never removed. Counts of
+    each rewrite are kept in removed.
+    """
+    booleans = ["union", "difference", "intersection"]
+
+    def __init__(self, tolerance=1e-9):
+        super().__init__(tolerance=tolerance)
+        self.removed = {}
+
+    def options(self):
+        return {"tolerance": self.tolerance}
+
+    def hasProperties(self, engine, data):
+        return any(key in data for key in engine.properties)
+
+    def unwrap(self, engine, data):
+        """Returns the child a single-child boolean wrapper can become"""
+        while data['category'] == "operation" \
+                and data['name'] in self.booleans \
+                and len(data['elements']) == 1 and 'highlight' not in data:
+            child = data['elements'][0]
+            if self.hasProperties(engine, data):
+                # The wrapper's properties move onto the child, which must
+                # have none of its own and must emit the ones it gets
+                if self.hasProperties(engine, child) \
+                        or child['category'] == "operation" \
+                        and (child['name'] == "translate"
+                             or child['name'] not in engine.operations):
+                    break
+                for key in engine.properties:
+                    if key in data:
+                        child[key] = data[key]
+            self.removed['unwrapped'] += 1
+            data = child
+        return data
+
+    def visit(self, engine, data):
+        if data['category'] == "operation" and 'elements' in data:
+            self.simplify(engine, data)
+        self.measure(engine, data)
+
+    def simplify(self, engine, data):
+        name = data['name']
+        children = []
+        empty = False
+        for idx, child in enumerate(data['elements']):
+            child = self.unwrap(engine, child)
+            if self.outer(engine, child) is None \
+                    and 'highlight' not in child:
+                if name in ("intersection", "minkowski") \
+                        or name == "difference" and idx == 0:
+                    empty = True
+                if child['category'] == "operation" \
+                        and child['name'] == "intersection":
+                    self.removed['intersections'] += 1
+                continue
+            if name == "union" and child['category'] == "operation" \
+                    and child['name'] == "union" \
+                    and not self.hasProperties(engine, child):
+                self.removed['flattened'] += 1
+                children.extend(child['elements'])
+                continue
+            children.append(child)
+        if name == "difference" and children and not empty:
+            minuend = self.outer(engine, children[0])
+            kept = [child for child in children[1:]
+                    if 'highlight' in child
+                    or self.overlaps(minuend, self.outer(engine, child))]
+            self.removed['subtrahends'] += len(children) - 1 - len(kept)
+            children = children[:1] + kept
+        data['elements'] = [] if empty else children
+
+    def run(self, engine, data):
+        self.removed = {"subtrahends": 0, "intersections": 0,
+                        "flattened": 0, "unwrapped": 0}
+        self.inner = {}
+        self.modules = {}
+        data = copyTree(data)
+        self.measureModules(engine, data)
+        for node in self.postorder(data):
+            self.visit(engine, node)
+        modules = data.get('modules')
+        data = self.unwrap(engine, data)
+        if self.outer(engine, data) is None and 'highlight' not in data:
+            if data['category'] == "operation" \
+                    and data['name'] == "intersection":
+                self.removed['intersections'] += 1
+            data = {"category": "operation", "name": "union", "elements": []}
+        if modules:
+            data['modules'] = modules
+        self.inner = {}
+        self.modules = {}
+        return data
+
+    def report(self):
+        return "simplified: " + ", ".join(
+            str(count) + " " + kind for kind, count in self.removed.items())
+
+
+class HullRewritePass:
+    """
+    Rewrites minkowski sums and hulls into cheaper equivalents. A
+    minkowski sum of a cube and one other primitive becomes the hull of
+    copies of that primitive moved to the cube's corners, the same
+    solid as every primitive is convex. Hulls and unions directly inside
+    a hull are flattened into it, as the hull of their parts is the
+    same. Children with properties of their own are left in place.
+    Cubes placed with more than a location need NumPy to find their
+    corners. Each rewrite only looks at the subtree it replaces, so
+    streamed parts can use the pass.
+    The cost model estimates CGAL's work: a minkowski sum as the hull of
+    every pairwise sum of its operands' vertices, weighted by nefWeight
+    for its Nef polyhedra, a union as its vertices weighted the same,
+    and a hull as n log n in its vertices. The estimate for what each
+    rewrite replaced and what replaced it is kept in before and after.
+    operations names the operations whose subtrees the pass rewrites.
+    """
+    local = True
+    operations = ("hull", "minkowski")
+    nefWeight = 10
+
+    def __init__(self):
+        self.fold = TransformFoldPass() if numpy is not None else None
+        self.rewritten = {}
+        self.before = 0
+        self.after = 0
+
+    def options(self):
+        return {}
+
+    def vertices(self, engine, data):
+        """Vertices of a primitive as OpenSCAD tessellates it"""
+        name = data['name']
+        if name == "cube":
+            return 8
+        radius = engine.extrema(name, data)[0][0]
+        if name == "ntube":
+            fragments = data['sides']
+        elif name == "hole":
+            fragments = engine.holeSides(data['radius'])
+        else:
+            fragments = engine.fragmentCount(data.get('fragments'), radius)
+        fragments = max(fragments, 3)
+        if name == "sphere":
+            return fragments * ((fragments + 1) // 2)
+        return 2 * fragments
+
+    def points(self, engine, data):
+        """Vertices of every primitive in a tree, arrays counted per copy"""
+        return sum(copies * self.vertices(engine, node)
+                   for node, copies in engine.nodeCopies(data)
+                   if node.get('category') == "element"
+                   and node['name'] in engine.elements)
+
+    def hullCost(self, points):
+        return points * math.log2(max(points, 2))
+
+    def corners(self, engine, cube):
+        """
+        Returns the corners of a cube in its parent's frame, or None
+        where they need NumPy and it is not installed
+        """
+        size = cube['size']
+        corners = [[(idx >> axis & 1) * size[axis] for axis in range(3)]
+                   for idx in range(8)]
+        if not any(key in cube for key in ('matrix', 'rotation', 'scale')):
+            extrema, default = engine.extrema("cube", cube)
+            offset = engine.centeringOffset(cube['center'], extrema, default)
+            location = cube.get('location') or [0, 0, 0]
+            return [[corner[axis] + offset[axis] + location[axis]
+                     for axis in range(3)] for corner in corners]
+        if self.fold is None:
+            return None
+        matrix = self.fold.local(engine, cube)
+        return (numpy.round(numpy.array(corners) @ matrix[:3, :3].T
+                            + matrix[:3, 3], 10) + 0.0).tolist()
+
+    def moved(self, data, offset):
+        """Returns a copy of a primitive moved by offset in its parent"""
+        copy = dict(data)
+        if 'matrix' in data:
+            copy['matrix'] = [list(row) for row in data['matrix']]
+            for axis in range(3):
+                copy['matrix'][axis][3] += offset[axis]
+        else:
+            location = data.get('location') or [0, 0, 0]
+            copy['location'] = [location[axis] + offset[axis]
+                                for axis in range(3)]
+        return copy
+
+    def minkowski(self, engine, data):
+        """Turns a minkowski sum of a cube and a primitive into a hull"""
+        children = data['elements']
+        if len(children) != 2 or any(
+                child.get('category') != "element"
+                or child['name'] not in engine.elements
+                or 'color' in child or 'highlight' in child
+                for child in children):
+            return
+        cube, other = children
+        if cube['name'] != "cube":
+            other, cube = children
+            if cube['name'] != "cube":
+                return
+        corners = self.corners(engine, cube)
+        if corners is None:
+            return
+        points = self.vertices(engine, other)
+        self.before += self.nefWeight * self.hullCost(8 * points)
+        self.after += self.hullCost(len(corners) * points)
+        self.rewritten['minkowski'] += 1
+        data['name'] = "hull"
+        data['elements'] = [self.moved(other, corner) for corner in corners]
+
+    def flatten(self, engine, data):
+        """Splices hulls and unions without properties into a hull"""
+        children = []
+        pending = list(reversed(data['elements']))
+        while pending:
+            child = pending.pop()
+            if child.get('category') == "operation" \
+                    and child['name'] in ("hull", "union") \
+                    and 'modules' not in child \
+                    and not engine.placementKeys(child):
+                points = self.points(engine, child)
+                if child['name'] == "hull":
+                    self.before += self.hullCost(points)
+                    self.rewritten['hulls'] += 1
+                else:
+                    self.before += self.nefWeight * points
+                    self.rewritten['unions'] += 1
+                pending.extend(reversed(child['elements']))
+                continue
+            children.append(child)
+        data['elements'] = children
+
+    def run(self, engine, data):
+        self.rewritten = {"minkowski": 0, "hulls": 0, "unions": 0}
+        self.before = 0
+        self.after = 0
+        if not any(node.get('category') == "operation"
+                   and node['name'] in ("hull", "minkowski")
+                   for node in iterNodes(data)):
+            return data
+        data = copyTree(data)
+        # Preorder reversed puts every node after its descendants
+        for node in reversed(list(iterNodes(data))):
+            if node.get('category') != "operation":
+                continue
+            if node['name'] == "minkowski":
+                self.minkowski(engine, node)
+            if node['name'] == "hull":
+                self.flatten(engine, node)
+        return data
+
+    def report(self):
+        if not any(self.rewritten.values()):
+            return ""
+        return "rewrote %(minkowski)d minkowski sums, flattened %(hulls)d " \
+            "hulls and %(unions)d unions" % self.rewritten \
+            + ", estimated cost %.3g -> %.3g" % (self.before, self.after)
+
+
+class BoundingVolumeHierarchy:
+    """
+    A tree of axis-aligned boxes over n item boxes, given as (n, 3)
+    arrays of low and high corners, for region and overlap queries that
+    visit O(log n) nodes per item found instead of scanning all n. Built
+    top down by splitting the items at the median center along the
+    longest axis, in O(n log n). Boxes overlap when they share more than
+    tolerance along every axis, so parts that merely touch do not.
+    """
+    def __init__(self, lows, highs, leafSize=4, tolerance=1e-9):
+        if numpy is None:
+            raise ImportError("bounding volume hierarchies require NumPy")
+        lows = numpy.asarray(lows, float).reshape(-1, 3)
+        highs = numpy.asarray(highs, float).reshape(-1, 3)
+        self.tolerance = tolerance
+        self.itemLows = [tuple(low) for low in lows.tolist()]
+        self.itemHighs = [tuple(high) for high in highs.tolist()]
+        self.lows = []
+        self.highs = []
+        self.children = []
+        self.items = []
+        if not len(lows):
+            return
+        centers = (lows + highs) / 2
+        order = numpy.arange(len(lows))
+        stack = [(0, len(lows), self.addNode())]
+        while stack:
+            start, stop, node = stack.pop()
+            items = order[start:stop]
+            self.lows[node] = tuple(lows[items].min(axis=0).tolist())
+            self.highs[node] = tuple(highs[items].max(axis=0).tolist())
+            if stop - start <= leafSize:
+                self.items[node] = items.tolist()
+                continue
+            spread = centers[items].max(axis=0) - centers[items].min(axis=0)
+            axis = int(spread.argmax())
+            middle = (stop - start) // 2
+            order[start:stop] = items[numpy.argpartition(
+                centers[items, axis], middle)]
+            left, right = self.addNode(), self.addNode()
+            self.children[node] = (left, right)
+            stack.append((start + middle, stop, right))
+            stack.append((start, start + middle, left))
+
+    def addNode(self):
+        self.lows.append(None)
+        self.highs.append(None)
+        self.children.append(None)
+        self.items.append(None)
+        return len(self.lows) - 1
+
+    def overlap(self, firstLow, firstHigh, secondLow, secondHigh):
+        tolerance = self.tolerance
+        return firstLow[0] < secondHigh[0] - tolerance \
+            and secondLow[0] < firstHigh[0] - tolerance \
+            and firstLow[1] < secondHigh[1] - tolerance \
+            and secondLow[1] < firstHigh[1] - tolerance \
+            and firstLow[2] < secondHigh[2] - tolerance \
+            and secondLow[2] < firstHigh[2] - tolerance
+
+    def query(self, low, high, contained=False):
+        """
+        Returns the sorted indices of the items overlapping the box from
+        low to high or, if contained, lying wholly inside it
+        """
+        low, high = tuple(low), tuple(high)
+        tolerance = self.tolerance
+        found = []
+        stack = [0] if self.lows else []
+        while stack:
+            node = stack.pop()
+            if not self.overlap(self.lows[node], self.highs[node], low,
+                                high):
+                continue
+            if self.children[node]:
+                stack.extend(self.children[node])
+                continue
+            for item in self.items[node]:
+                itemLow, itemHigh = self.itemLows[item], self.itemHighs[item]
+                if contained:
+                    if all(itemLow[axis] >= low[axis] - tolerance
+                           and itemHigh[axis] <= high[axis] + tolerance
+                           for axis in range(3)):
+                        found.append(item)
+                elif self.overlap(itemLow, itemHigh, low, high):
+                    found.append(item)
+        return sorted(found)
+
+    def pairs(self):
+        """Returns every (i, j), i < j, of overlapping items, sorted"""
+        found = []
+        lows, highs, children = self.lows, self.highs, self.children
+        itemLows, itemHighs = self.itemLows, self.itemHighs
+        overlap = self.overlap
+        stack = [(0, 0)] if lows else []
+        while stack:
+            first, second = stack.pop()
+            if first == second:
+                if children[first]:
+                    left, right = children[first]
+                    stack += [(left, left), (right, right), (left, right)]
+                    continue
+                items = self.items[first]
+                candidates = [(a, b) for idx, a in enumerate(items)
+                              for b in items[idx + 1:]]
+            else:
+                if not overlap(lows[first], highs[first], lows[second],
+                               highs[second]):
+                    continue
+                if children[first] or children[second]:
+                    # Descend into the bigger node, or the inner one
+                    if not children[second] or children[first] \
+                            and self.volume(first) >= self.volume(second):
+                        left, right = children[first]
+                        stack += [(left, second), (right, second)]
+                    else:
+                        left, right = children[second]
+                        stack += [(first, left), (first, right)]
+                    continue
+                candidates = [(a, b) for a in self.items[first]
+                              for b in self.items[second]]
+            for a, b in candidates:
+                if overlap(itemLows[a], itemHighs[a], itemLows[b],
+                           itemHighs[b]):
+                    found.append((a, b) if a < b else (b, a))
+        return sorted(found)
+
+    def volume(self, node):
+        low, high = self.lows[node], self.highs[node]
+        return (high[0] - low[0]) * (high[1] - low[1]) * (high[2] - low[2])
+
+
+class AssemblyIndex:
+    """
+    World-space boxes of the parts or primitives of a textcad tree, in
+    a BoundingVolumeHierarchy, for finding clashing parts and the parts
+    in a region before anything is sent to OpenSCAD. Boxes come from
+    BoundsAnalysis with the transforms of every node above applied.
+    With level "parts", the items are the children of the root union or
+    array, found below any custom constructions and transforms at the
+    root. With level "primitives", the items are the primitives and
+    calls, arrays expanded into their copies; difference subtrahends
+    are left out as they remove material, and intersections, hulls,
+    minkowski sums and resizes are each one item. Each item is named by
+    its path, as in SchemaError. Items without a finite box are skipped
+    and counted in unbounded.
+    """
+    levels = ["parts", "primitives"]
+    atomic = ["intersection", "hull", "minkowski", "resize"]
+
+    def __init__(self, engine, data, level="parts", tolerance=1e-9):
+        if level not in self.levels:
+            raise ValueError("unknown level '" + level + "'")
+        engine.load(data)
+        if engine.library is not None:
+            data = engine.library.expand(data)
+        analysis = BoundsAnalysis(tolerance=tolerance).measured(engine, data)
+        self.fold = analysis.fold
+        self.level = level
+        self.paths = []
+        self.unbounded = 0
+        lows, highs = [], []
+        for node, matrix, path in self.items(engine, data):
+            box = analysis.transform(matrix @ self.fold.local(engine, node),
+                                     analysis.inner[id(node)])
+            if box is None:
+                continue
+            if not (numpy.isfinite(box[0]).all()
+                    and numpy.isfinite(box[1]).all()):
+                self.unbounded += 1
+                continue
+            self.paths.append(path)
+            lows.append(box[0])
+            highs.append(box[1])
+        self.lows = numpy.array(lows, float).reshape(-1, 3)
+        self.highs = numpy.array(highs, float).reshape(-1, 3)
+        self.hierarchy = BoundingVolumeHierarchy(self.lows, self.highs,
+                                                 tolerance=tolerance)
+
+    def items(self, engine, data):
+        """Yields the (node, parent's world matrix, path) of each item"""
+        identity = numpy.identity(4)
+        if self.level == "parts":
+            node, matrix, path = data, identity, "tree"
+            while True:
+                if 'construction' in node:
+                    matrix = self.fold.frames(engine, node, matrix)[0][0]
+                    node, path = node['construction'], path + ".construction"
+                elif node.get('name') in TransformFoldPass.transforms \
+                        and len(node['elements']) == 1:
+                    matrix = self.fold.frames(engine, node, matrix)[0][0]
+                    node, path = node['elements'][0], path + ".elements[0]"
+                else:
+                    break
+            if node.get('category') == "operation" \
+                    and (node['name'] == "union"
+                         or node['name'] in engine.arrays):
+                for frame, label in self.fold.frames(engine, node, matrix):
+                    for idx, child in enumerate(node['elements']):
+                        yield child, frame, \
+                            path + ".elements[" + str(idx) + "]" + label
+            else:
+                yield node, matrix, path
+            return
+        stack = [(data, identity, "tree")]
+        while stack:
+            node, matrix, path = stack.pop()
+            category, name = node.get('category'), node.get('name')
+            if not category:
+                continue
+            if category == "call" or category == "element" \
+                    and name in engine.elements \
+                    or category == "operation" and name in self.atomic:
+                yield node, matrix, path
+            elif 'construction' in node:
+                stack.append((node['construction'],
+                              self.fold.frames(engine, node, matrix)[0][0],
+                              path + ".construction"))
+            elif category == "operation":
+                children = node['elements']
+                if name == "difference":
+                    children = children[:1]
+                for frame, label in reversed(
+                        self.fold.frames(engine, node, matrix)):
+                    for idx in reversed(range(len(children))):
+                        stack.append((children[idx], frame, path
+                                      + ".elements[" + str(idx) + "]"
+                                      + label))
+
+    def region(self, low, high, contained=False):
+        """
+        Returns the paths of the items overlapping the box from low to
+        high or, if contained, lying wholly inside it
+        """
+        return [self.paths[item]
+                for item in self.hierarchy.query(low, high, contained)]
+
+    def clashes(self):
+        """
+        Returns (path, path, volume) for each pair of items whose boxes
+        overlap, with the volume their boxes share. These are candidates:
+        the solids inside the boxes may still be apart.
+        """
+        found = []
+        for first, second in self.hierarchy.pairs():
+            shared = numpy.minimum(self.highs[first], self.highs[second]) \
+                - numpy.maximum(self.lows[first], self.lows[second])
+            found.append((self.paths[first], self.paths[second],
+                          float(numpy.prod(shared))))
+        return found
+
+    def describe(self, clashes=None):
+        """Returns the clash report for stderr"""
+        clashes = self.clashes() if clashes is None else clashes
+        lines = [str(len(self.paths)) + " " + self.level + ", "
+                 + str(len(clashes)) + " clash candidates"
+                 + (", " + str(self.unbounded) + " unbounded"
+                    if self.unbounded else "")]
+        lines += ["  " + first + " x " + second + "  %.6g shared" % volume
+                  for first, second, volume in clashes]
+        return "\n".join(lines)
+
+
+class MeshExport:
+    """
+    Writes binary STL straight from a textcad tree, tessellating the
+    primitives with NumPy instead of waiting on OpenSCAD, for trees whose
+    only booleans are unions: unions, transforms, arrays, constructions
+    and calls. blocker() names the first node that needs OpenSCAD.
+    Facets follow OpenSCAD's own: the $fn the emitters write, or its
+    $fa/$fs default where that is 0, the same centering and the same
+    rings for spheres. Primitives of one shape are tessellated once and
+    placed by a batched matrix multiply with every transform above them.
+    Overlapping solids are written as separate shells, not merged.
+    """
+    supported = ["union", "translate", "rotate", "mirror", "scale",
+                 "linearArray", "gridArray", "polarArray", "pointArray"]
+    header = b"textcad binary STL"
+    # OpenSCAD's defaults for $fa and $fs, and its smallest radius
+    angle = 12.0
+    size = 2.0
+    fine = 2.0 ** -20
+    # Corners of the unit cube are numbered x + 2y + 4z
+    faces = [(0, 2, 3, 1), (4, 5, 7, 6), (0, 1, 5, 4), (2, 6, 7, 3),
+             (0, 4, 6, 2), (1, 3, 7, 5)]
+
+    def __init__(self, tolerance=1e-9):
+        if numpy is None:
+            raise ImportError("mesh export requires NumPy")
+        self.fold = TransformFoldPass(tolerance=tolerance)
+        self.record = numpy.dtype([('normal', '<f4', (3,)),
+                                   ('vertices', '<f4', (3, 3)),
+                                   ('attribute', '<u2')])
+        self.templates = {}
+
+    def blocker(self, engine, data):
+        """
+        Returns why the tree needs OpenSCAD, naming the node by its path
+        as in SchemaError, or None if it can be exported
+        """
+        stack = [(data, "tree")]
+        while stack:
+            node, path = stack.pop()
+            if node.get('category') == "operation" \
+                    and node['name'] in engine.operations \
+                    and node['name'] not in self.supported:
+                return node['name'] + " at " + path
+            for idx, module in enumerate(node.get('modules', [])):
+                stack.append((module['body'],
+                              path + ".modules[" + str(idx) + "].body"))
+            if 'construction' in node:
+                stack.append((node['construction'], path + ".construction"))
+            for idx, child in enumerate(node.get('elements', [])):
+                stack.append((child, path + ".elements[" + str(idx) + "]"))
+        return None
+
+    def segments(self, fragments, radius):
+        """Returns the polygon sides OpenSCAD makes for a circle"""
+        if radius < self.fine:
+            return 3
+        if fragments > 0:
+            return max(fragments, 3)
+        return int(math.ceil(max(min(360.0 / self.angle,
+                                     radius * 2 * math.pi / self.size), 5)))
+
+    def shape(self, engine, data):
+        """
+        Returns the template key of a primitive and the scaling that
+        takes the template to it, in the primitive's own frame
+        """
+        name = data['name']
+        extrema = engine.extrema(name, data)[0]
+        if name == "cube":
+            return ("cube",), extrema
+        radius = extrema[0]
+        if name == "sphere":
+            fragments = engine.fragmentCount(data.get('fragments'), radius)
+            return ("sphere", self.segments(fragments, radius)), [radius] * 3
+        if name == "cone":
+            fragments = engine.fragmentCount(data.get('fragments'), radius)
+            ends = (data['bottomRadius'] / radius, data['topRadius'] / radius) \
+                if radius else (1, 1)
+        else:
+            ends = (1, 1)
+            if name == "cylinder":
+                fragments = engine.fragmentCount(data.get('fragments'),
+                                                 radius)
+            elif name == "ntube":
+                fragments = data['sides']
+            else:
+                fragments = engine.holeSides(data['radius'])
+        return ("tube", self.segments(fragments, radius)) + ends, extrema
+
+    def instances(self, engine, data):
+        """
+        Yields the template key and world matrix of every primitive,
+        arrays expanded into their copies
+        """
+        modules = {module['name']: module['body']
+                   for node in iterNodes(data)
+                   for module in node.get('modules', [])}
+        local = self.fold.local
+        stack = [(data, local(engine, data))]
+        while stack:
+            node, matrix = stack.pop()
+            category = node.get('category')
+            if category == "element" and node['name'] in engine.elements:
+                key, scaling = self.shape(engine, node)
+                yield key, matrix * (list(scaling) + [1])
+            elif category == "call":
+                body = modules[node['name']]
+                stack.append((body, matrix @ local(engine, body)))
+            elif 'construction' in node:
+                construction = node['construction']
+                stack.append((construction,
+                              matrix @ local(engine, construction)))
+            elif category == "operation" and node['elements']:
+                children = node['elements']
+                locals = self.fold.locals(engine, children)
+                for frame, label in self.fold.copies(engine, node, matrix):
+                    stack.extend(zip(children, frame @ locals))
+
+    def circle(self, sides):
+        angles = numpy.radians(360.0 * numpy.arange(sides) / sides)
+        return numpy.stack([numpy.cos(angles), numpy.sin(angles),
+                            numpy.zeros(sides)], axis=1)
+
+    def band(self, lower, upper):
+        """Triangles joining two rings of points, facing outwards"""
+        after = numpy.roll(numpy.arange(len(lower)), -1)
+        return numpy.concatenate([
+            numpy.stack([lower, lower[after], upper[after]], axis=1),
+            numpy.stack([lower, upper[after], upper], axis=1)])
+
+    def fan(self, ring, up):
+        """Triangles covering a ring, facing up or down"""
+        first, second = ring[1:-1], ring[2:]
+        if not up:
+            first, second = second, first
+        return numpy.stack([numpy.broadcast_to(ring[0], first.shape),
+                            first, second], axis=1)
+
+    def template(self, key):
+        """Returns the triangles of a template shape, as (n, 3, 3)"""
+        if key in self.templates:
+            return self.templates[key]
+        if key[0] == "cube":
+            corners = numpy.array([[idx & 1, idx >> 1 & 1, idx >> 2 & 1]
+                                   for idx in range(8)], float)
+            quads = numpy.array(self.faces)
+            triangles = corners[numpy.concatenate([quads[:, [0, 1, 2]],
+                                                   quads[:, [0, 2, 3]]])]
+        elif key[0] == "sphere":
+            sides = key[1]
+            rings = (sides + 1) // 2
+            phi = numpy.radians(180.0 * (numpy.arange(rings) + 0.5) / rings)
+            circle = self.circle(sides)
+            points = [circle * math.sin(angle) + [0, 0, math.cos(angle)]
+                      for angle in phi]
+            triangles = numpy.concatenate(
+                [self.fan(points[0], True), self.fan(points[-1], False)]
+                + [self.band(points[idx + 1], points[idx])
+                   for idx in range(rings - 1)])
+        else:
+            sides, bottom, top = key[1:]
+            circle = self.circle(sides)
+            lower, upper = circle * bottom, circle * top + [0, 0, 1]
+            triangles = [self.band(lower, upper)]
+            if bottom:
+                triangles.append(self.fan(lower, False))
+            if top:
+                triangles.append(self.fan(upper, True))
+            triangles = numpy.concatenate(triangles)
+        self.templates[key] = triangles
+        return triangles
+
+    def triangles(self, engine, data):
+        """Returns every facet of the tree in world space, as (n, 3, 3)"""
+        groups = {}
+        for key, matrix in self.instances(engine, data):
+            groups.setdefault(key, []).append(matrix)
+        facets = [numpy.zeros((0, 3, 3))]
+        for key, matrices in groups.items():
+            matrices = numpy.array(matrices)
+            determinants = numpy.linalg.det(matrices[:, :3, :3])
+            matrices = matrices[determinants != 0]
+            placed = numpy.einsum('mij,tvj->mtvi', matrices[:, :3, :3],
+                                  self.template(key)) \
+                + matrices[:, None, None, :3, 3]
+            # Mirrored copies would face inwards, so wind them back
+            mirrored = determinants[determinants != 0] < 0
+            placed[mirrored] = placed[mirrored][:, :, [0, 2, 1]]
+            facets.append(placed.reshape(-1, 3, 3))
+        facets = numpy.concatenate(facets)
+        normals = numpy.cross(facets[:, 1] - facets[:, 0],
+                              facets[:, 2] - facets[:, 0])
+        return facets[numpy.linalg.norm(normals, axis=1) > 0]
+
+    def write(self, engine, data, stream):
+        """
+        Writes the tree as binary STL to a binary stream and returns the
+        number of facets
+        """
+        facets = self.triangles(engine, data)
+        normals = numpy.cross(facets[:, 1] - facets[:, 0],
+                              facets[:, 2] - facets[:, 0])
+        records = numpy.zeros(len(facets), self.record)
+        records['normal'] = normals / numpy.linalg.norm(
+            normals, axis=1)[:, None]
+        records['vertices'] = facets
+        stream.write(self.header.ljust(80, b"\0"))
+        stream.write(numpy.array([len(facets)], '<u4').tobytes())
+        stream.write(records.tobytes())
+        return len(facets)
+
+
+class SubtreeMemo:
+    """
+    Memoizes emitted subtrees across runs of one engine.
+    Each run's tree is compared with the previous run's from the root
+    down: a subtree equal to the one in its place last time, by == on
+    the JSON data, keeps its entry, and is not validated, walked or
+    formatted again. Only nodes on the paths to edits are. Child lists
+    that changed length are matched from both ends, so an insertion or
+    removal only costs the nodes it touches. An entry is a node, its
+    level, its rope and its children's entries; the rope is the node's
+    own parts around the ropes of its children, so unchanged subtrees
+    are shared rather than copied. Subtrees under flatSize characters
+    are kept as plain strings instead. The previous tree is kept by
+    reference, so it must not be modified in place: load it again, or
+    copy the nodes on the path to an edit. The memo is reset if the
+    engine's options change. A memo serves one thread; concurrent
+    compiles should go through engines without one.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.options = None
+        self.flatSize = 4096
+        self.hits = 0
+        self.misses = 0
+
+    def check(self, engine, node, path, whole):
+        """
+        Validates a node, with its subtree when whole or else only its
+        own fields, raising a SchemaError found at path
+        """
+        shell = node
+        if node.__class__ is dict:
+            shell = {key: val for key, val in node.items()
+                     if key != 'modules'}
+            if not whole:
+                if shell.get('elements').__class__ is list:
+                    shell['elements'] = []
+                if 'construction' in shell:
+                    shell['construction'] = {}
+        try:
+            engine.load(shell)
+        except SchemaError as error:
+            raise error.within(path)
+
+    def match(self, children, old):
+        """Pairs each child with the old entry in its place, or None"""
+        if len(children) == len(old):
+            return old
+        count = min(len(children), len(old))
+        start = 0
+        while start < count and (children[start] is old[start][0]
+                                 or children[start] == old[start][0]):
+            start += 1
+        end = 0
+        while end < count - start \
+                and (children[-1 - end] is old[-1 - end][0]
+                     or children[-1 - end] == old[-1 - end][0]):
+            end += 1
+        return old[:start] + [None] * (len(children) - start - end) \
+            + old[len(old) - end:]
+
+    def rope(self, engine, node, level, entries):
+        head, pairs, separator, tail = engine.nodeParts(node, level)
+        children = [entry[2] for entry in entries]
+        if all(child.__class__ is str for child in children) \
+                and sum(map(len, children)) < self.flatSize:
+            return head + "".join(child + separator
+                                  for child in children) + tail
+        return (head, children, separator, tail)
+
+    def entry(self, engine, data, level, old, path):
+        """Returns the entry of a subtree, reusing old entries"""
+        results = []
+        stack = [(data, level, old, path, False, None)]
+        while stack:
+            node, level, old, path, checked, children = stack.pop()
+            if children is None:
+                if old is not None and old[1] == level \
+                        and (old[0] is node or old[0] == node):
+                    self.hits += 1
+                    results.append(old)
+                    continue
+                if not checked:
+                    checked = old is None
+                    self.check(engine, node, path, checked)
+                children = engine.nodeChildren(node, level)
+                olds = self.match([child for child, childLevel in children],
+                                  old[3] if old else [])
+                if node['category'] == "operation" \
+                        and node['name'] in engine.operations:
+                    paths = [path + ".elements[" + str(idx) + "]"
+                             for idx in range(len(children))]
+                else:
+                    paths = [path + ".construction"] * len(children)
+                stack.append((node, level, old, path, checked, children))
+                for idx in range(len(children) - 1, -1, -1):
+                    stack.append((children[idx][0], children[idx][1],
+                                  olds[idx] if olds else None, paths[idx],
+                                  checked, None))
+                continue
+            self.misses += 1
+            start = len(results) - len(children)
+            entries = results[start:]
+            del results[start:]
+            results.append((node, level,
+                            self.rope(engine, node, level, entries), entries))
+        return results[0]
+
+    def write(self, rope, writer):
+        stack = [rope]
+        while stack:
+            item = stack.pop()
+            if item.__class__ is str:
+                writer.write(item)
+                continue
+            head, children, separator, tail = item
+            if all(child.__class__ is str for child in children):
+                writer.write(head + "".join(child + separator
+                                            for child in children) + tail)
+                continue
+            writer.write(head)
+            if tail:
+                stack.append(tail)
+            for child in reversed(children):
+                if separator:
+                    stack.append(separator)
+                stack.append(child)
+
+    def emit(self, engine, data, writer):
+        """
+        Writes a tree like OpenSCADEngine.emit, through the memo, after
+        validating the parts of it that changed
+        """
+        options = engine.options()
+        if options != self.options:
+            self.entries = {}
+            self.options = options
+        if data.__class__ is not dict:
+            engine.fail(None, "expected an object")
+        level = engine.level
+        entries = {}
+        modules = data.get('modules', [])
+        for idx, module in enumerate(modules):
+            if not isinstance(module, dict) or 'name' not in module:
+                engine.fail((None, "modules", idx),
+                            "expected an object with a name and a body")
+            entries[module['name']] = self.entry(
+                engine, module.get('body'), level + 1,
+                self.entries.get(module['name']),
+                "tree.modules[" + str(idx) + "].body")
+        # Keyed by None, which no module name can be
+        entries[None] = self.entry(engine, data, level,
+                                   self.entries.get(None), "tree")
+        pad = " " * level * engine.indent
+        for module in modules:
+            writer.write(pad + "module " + module['name'] + "(){\n")
+            self.write(entries[module['name']][2], writer)
+            writer.write("\n" + pad + "}\n")
+        self.write(entries[None][2], writer)
+        self.entries = entries
+
+
+class ParallelEmitter:
+    """
+    Spreads the children of wide operations over worker processes for
+    emitModel. An operation with at least threshold children has them
+    cut into contiguous chunks, each emitted by a worker at the level of
+    the children, and the texts are written back in order, so the output
+    is the same as a serial emission. Where the platform can fork, the
+    workers inherit the nodes instead of receiving them pickled; only
+    the text comes back. Each wide operation starts its own pool, a
+    fixed cost of about 10 ms, so the default threshold sits well above
+    the crossover benchmarks/bench_parallel.py measures with four
+    workers. With one worker everything stays serial.
+    """
+    adopted = None
+
+    def __init__(self, workers=None, threshold=10000, chunks=4):
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold = threshold
+        self.chunks = chunks
+        self.fanouts = 0
+
+    @staticmethod
+    def adopt(indent, nodes, level, library=None, passes=()):
+        """Keeps a worker's share of the nodes, as its initializer"""
+        engine = OpenSCADEngine(indent)
+        engine.library = library
+        engine.passes = list(passes)
+        ParallelEmitter.adopted = (engine, nodes, level)
+
+    @staticmethod
+    def emitRange(start, stop):
+        """Returns the text of adopted nodes[start:stop] in a worker"""
+        engine, nodes, level = ParallelEmitter.adopted
+        sink = io.StringIO()
+        writer = ScadWriter(sink)
+        for node in nodes[start:stop]:
+            engine.emitModel(Model(node, []), writer, level)
+            writer.write("\n")
+        writer.flush()
+        return sink.getvalue()
+
+    def emit(self, engine, nodes, level):
+        """Yields the text of the nodes, each followed by a newline"""
+        self.fanouts += 1
+        count = min(self.workers * self.chunks, len(nodes))
+        bounds = [len(nodes) * idx // count for idx in range(count + 1)]
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            "fork" if "fork" in methods else None)
+        # Forked workers would write out anything still buffered here
+        sys.stdout.flush()
+        sys.stderr.flush()
+        with concurrent.futures.ProcessPoolExecutor(
+                min(self.workers, count), mp_context=context,
+                initializer=self.adopt,
+                initargs=(engine.indent, nodes, level,
+                          engine.library, engine.passes)) as pool:
+            for text in pool.map(self.emitRange, bounds[:-1], bounds[1:]):
+                yield text
+
+
+class CompileStats:
+    """
+    What a compile did and what it leaves for OpenSCAD, for --stats.
+    compile() writes the same text as writeJSON, less the cache and the
+    memo, through a copy of the engine whose emitters are timed, then
+    reports node counts by category and name, the depth of the tree,
+    the time and calls of each emitter, the output bytes of the largest
+    subtrees under the root, and an estimate of the render cost: $fn
+    and facet totals of the primitives and the count of the booleans,
+    hulls and minkowski sums that CGAL will evaluate, arrays counted per
+    copy. Nothing of this runs unless a CompileStats is used.
+    """
+    booleans = ["union", "difference", "intersection"]
+
+    def __init__(self, largest=10):
+        self.largest = largest
+        self.stages = {}
+        self.nodes = {}
+        self.depth = 0
+        self.emitters = {}
+        self.subtrees = []
+        self.outputBytes = 0
+        self.cost = {"fragments": 0, "facets": 0, "primitives": 0,
+                     "booleans": 0, "hull": 0, "minkowski": 0}
+
+    def timed(self, name, emitter):
+        """Returns emitter, adding its calls and time to self.emitters"""
+        totals = self.emitters.setdefault(name, [0, 0.0])
+        clock = time.perf_counter
+
+        def run(argument):
+            start = clock()
+            text = emitter(argument)
+            totals[1] += clock() - start
+            totals[0] += 1
+            return text
+        return run
+
+    def instrument(self, engine):
+        """Returns a copy of engine whose emitters are timed"""
+        timedEngine = copy.copy(engine)
+        timedEngine.nodeEmitters = {
+            kind: self.timed(kind.__name__, emitter)
+            for kind, emitter in engine.nodeEmitters.items()}
+        timedEngine.operationEmitters = {
+            name: self.timed(name, emitter)
+            for name, emitter in engine.operationEmitters.items()}
+        timedEngine.wrappers = {
+            key: self.timed("placement " + key, emitter)
+            for key, emitter in engine.wrappers.items()}
+        return timedEngine
+
+    def compile(self, engine, data, stream, flushSize=65536):
+        """Writes the text for a tree, measuring it, and returns reports"""
+        reports = {}
+        clock = time.perf_counter
+        start = clock()
+        model = engine.load(data)
+        self.stages['load'] = clock() - start
+        if engine.passes or engine.resolution:
+            start = clock()
+            data = engine.optimize(data, reports)
+            model = engine.load(data)
+            self.stages['optimize'] = clock() - start
+        start = clock()
+        self.measure(engine, data if engine.library is None
+                     else engine.library.expand(data))
+        self.stages['analyze'] = clock() - start
+        timedEngine = self.instrument(engine)
+        sink = io.StringIO()
+        writer = ScadWriter(sink, flushSize)
+        start = clock()
+        self.emitMeasured(timedEngine, model, writer)
+        writer.flush()
+        self.stages['emit'] = clock() - start
+        text = sink.getvalue()
+        self.outputBytes = len(text.encode())
+        start = clock()
+        if engine.compact:
+            stream = CompactStream(stream, engine.compact)
+        writer = ScadWriter(stream, flushSize)
+        writer.write(text)
+        writer.flush()
+        self.stages['write'] = clock() - start
+        if engine.compact:
+            reports['CompactFormat'] = stream.report()
+        return reports
+
+    def measure(self, engine, data):
+        """Counts the nodes, depth and render cost of a tree"""
+        policy = ResolutionPolicy()
+        cost = self.cost
+        stack = [(data, 1, 1)]
+        for module in data.get('modules', []):
+            stack.append((module['body'], 1, 1))
+        while stack:
+            node, depth, copies = stack.pop()
+            category, name = node.get('category'), node.get('name')
+            if not category:
+                continue
+            key = category + " " + name
+            self.nodes[key] = self.nodes.get(key, 0) + 1
+            self.depth = max(self.depth, depth)
+            if category == "element" and name in engine.elements:
+                if name in ResolutionPolicy.rounded:
+                    fragments = engine.fragmentCount(
+                        node.get('fragments'), policy.radius(node))
+                elif name == "hole":
+                    fragments = engine.holeSides(node['radius'])
+                elif name == "ntube":
+                    fragments = node['sides']
+                else:
+                    fragments = 0
+                cost['primitives'] += copies
+                cost['fragments'] += copies * fragments
+                cost['facets'] += copies * policy.facets(name, fragments)
+            elif category == "operation":
+                if name in self.booleans:
+                    cost['booleans'] += copies
+                elif name in ("hull", "minkowski"):
+                    cost[name] += copies
+            inner = copies
+            if category == "operation" and name in engine.arrays:
+                inner = copies * engine.arrayCount(node)
+            for child in node.get('elements', []):
+                stack.append((child, depth + 1, inner))
+            if 'construction' in node:
+                stack.append((node['construction'], depth + 1, copies))
+
+    def emitText(self, engine, model, level):
+        sink = io.StringIO()
+        writer = ScadWriter(sink)
+        engine.emitModel(model, writer, level)
+        writer.flush()
+        return sink.getvalue()
+
+    def emitMeasured(self, engine, model, writer):
+        """
+        Writes a Model as emitModel does, but the children of a root
+        operation one at a time, keeping the output bytes of the
+        largest from the same pass. Those children are emitted serially,
+        even with a ParallelEmitter set.
+        """
+        root = model.root
+        level = engine.level
+        if root.__class__ is Operation:
+            shell = copy.copy(root)
+            shell.elements = []
+            children = root.elements
+            tail = " " * level * engine.indent + "}\n"
+            separator = "\n"
+            childLevel = level + 1
+        else:
+            shell = Empty()
+            children = [root]
+            tail = separator = ""
+            childLevel = level
+        head = self.emitText(engine, Model(shell, model.modules), level)
+        writer.write(head[:len(head) - len(tail)])
+        sizes = []
+        for idx, child in enumerate(children):
+            text = self.emitText(engine, Model(child, []), childLevel)
+            writer.write(text + separator)
+            path = "tree" if child is root \
+                else "tree.elements[" + str(idx) + "]"
+            sizes.append((len(text.encode()), path))
+        writer.write(tail)
+        sizes.sort(key=lambda size: -size[0])
+        self.subtrees = [{"path": path, "bytes": size}
+                         for size, path in sizes[:self.largest]]
+
+    def report(self):
+        """Returns the statistics as JSON data"""
+        return {"stages": self.stages,
+                "nodes": dict(sorted(self.nodes.items())),
+                "depth": self.depth,
+                "emitters": {name: {"calls": calls, "seconds": seconds}
+                             for name, (calls, seconds)
+                             in sorted(self.emitters.items()) if calls},
+                "outputBytes": self.outputBytes,
+                "largestSubtrees": self.subtrees,
+                "renderCost": self.cost}
+
+    def describe(self):
+        """Returns the statistics as text for stderr"""
+        lines = ["stages: " + ", ".join(
+            "%s %.1f ms" % (stage, seconds * 1000)
+            for stage, seconds in self.stages.items())]
+        lines.append("nodes: %d, depth %d" % (sum(self.nodes.values()),
+                                              self.depth))
+        lines += ["  %-28s %d" % (key, count)
+                  for key, count in sorted(self.nodes.items())]
+        lines.append("emitters:")
+        lines += ["  %-28s %8d calls %9.2f ms" % (name, calls,
+                                                   seconds * 1000)
+                  for name, (calls, seconds) in sorted(
+                      self.emitters.items(), key=lambda item: -item[1][1])
+                  if calls]
+        lines.append("output: %d bytes, largest subtrees:"
+                     % self.outputBytes)
+        lines += ["  %-28s %d bytes" % (subtree['path'], subtree['bytes'])
+                  for subtree in self.subtrees]
+        lines.append("render cost: %(primitives)d primitives, "
+                     "%(fragments)d fragments, ~%(facets)d facets, "
+                     "%(booleans)d booleans, %(hull)d hulls, "
+                     "%(minkowski)d minkowski sums" % self.cost)
+        return "\n".join(lines)
+
+
+class Watcher:
+    """
+    Recompiles a textcad file whenever its modification time or size
+    changes, polling every interval seconds. The engine is given a
+    SubtreeMemo so each rebuild only re-emits the edited path. Output
+    files are replaced atomically so viewers never read partial text.
+    """
+    def __init__(self, engine, inputPath, output, interval=0.1):
+        self.engine = engine
+        if not engine.memo:
+            engine.memo = SubtreeMemo()
+        self.inputPath = inputPath
+        self.output = output
+        self.interval = interval
+        self.stamp = None
+        self.builds = 0
+
+    def changed(self):
+        info = os.stat(self.inputPath)
+        stamp = (info.st_mtime_ns, info.st_size)
+        if stamp == self.stamp:
+            return False
+        self.stamp = stamp
+        return True
+
+    def poll(self):
+        """
+        Rebuilds if the input changed; returns the rebuild time in
+        seconds, or None if nothing changed
+        """
+        try:
+            if not self.changed():
+                return None
+        except OSError:
+            return None
+        start = time.time()
+        with open(self.inputPath) as source:
+            data = json.load(source)
+        if isinstance(self.output, str):
+            partial = self.output + ".part"
+            with open(partial, 'w') as output:
+                self.engine.writeJSON(data, output)
+            os.replace(partial, self.output)
+        else:
+            self.engine.writeJSON(data, self.output)
+            self.output.flush()
+        self.builds += 1
+        return time.time() - start
+
+    def rebuild(self, report=sys.stderr):
+        """Polls once, reporting the rebuild or the error it hit"""
+        try:
+            elapsed = self.poll()
+        except (ValueError, KeyError, TypeError) as error:
+            report.write(self.inputPath + ": " + type(error).__name__
+                         + ": " + str(error) + "\n")
+            return False
+        if elapsed is None:
+            return False
+        memo = self.engine.memo
+        report.write("rebuilt in %.1f ms (%d reused, %d emitted)\n"
+                     % (elapsed * 1000, memo.hits, memo.misses))
+        memo.hits = memo.misses = 0
+        return True
+
+    def run(self, report=sys.stderr):
+        while True:
+            self.rebuild(report)
+            time.sleep(self.interval)
+
+
+class ComponentLibrary:
+    """
+    Named constructions kept as textcad files in a directory, one per
+    file named after it: bracket.json holds the component bracket. A
+    custom element without a construction of its own is resolved here
+    by name. The directory is indexed when the library is made; each
+    file is read and validated the first time it is used, and compiled
+    once per level it is emitted at, the text then being reused for
+    every occurrence. At most maxEntries components are kept, the least
+    recently used being evicted and reloaded on demand. Components may
+    use other components. Components are compiled with the local
+    passes of the engine emitting them; an engine with passes over the
+    whole tree or a resolution policy expands them into the design
+    before optimizing it instead. fingerprint changes whenever a file
+    is added, removed or modified, and keys cached output.
+    """
+    def __init__(self, directory, maxEntries=128):
+        self.directory = os.path.abspath(directory)
+        self.maxEntries = maxEntries
+        self.index = {}
+        fingerprint = hashlib.sha256()
+        for entry in sorted(os.scandir(self.directory),
+                            key=lambda entry: entry.name):
+            name, extension = os.path.splitext(entry.name)
+            if extension == ".json" and entry.is_file():
+                self.index[name] = entry.path
+                info = entry.stat()
+                fingerprint.update(json.dumps(
+                    [name, info.st_mtime_ns, info.st_size]).encode())
+        self.fingerprint = fingerprint.hexdigest()
+        self.entries = collections.OrderedDict()
+        self.loading = set()
+        self.lock = threading.RLock()
+        self.loads = 0
+        self.evictions = 0
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def options(self):
+        return {"directory": self.directory, "fingerprint": self.fingerprint}
+
+    def entry(self, name):
+        """
+        Returns the entry of a component, reading and validating its
+        file if it is not loaded. Raises ValueError for a file that is
+        not valid JSON or a valid tree, or a component that uses itself.
+        """
+        with self.lock:
+            if name in self.entries:
+                self.entries.move_to_end(name)
+                return self.entries[name]
+            if name in self.loading:
+                raise ValueError("component '" + name + "' uses itself")
+            self.loading.add(name)
+            try:
+                with open(self.index[name]) as source:
+                    tree = json.load(source)
+                engine = OpenSCADEngine()
+                engine.library = self
+                entry = {"tree": tree, "model": engine.load(tree),
+                         "texts": {}}
+            finally:
+                self.loading.discard(name)
+            self.entries[name] = entry
+            self.loads += 1
+            logger.info("loaded component '%s' from %s", name,
+                        self.index[name],
+                        extra={"component": name, "path": self.index[name]})
+            while len(self.entries) > self.maxEntries:
+                evicted = self.entries.popitem(last=False)[0]
+                self.evictions += 1
+                logger.debug("evicted component '%s'", evicted,
+                             extra={"component": evicted})
+            return entry
+
+    def text(self, name, engine, level):
+        """
+        Returns the OpenSCAD text of a component emitted at level by
+        engine, compiled with its indent and passes
+        """
+        entry = self.entry(name)
+        key = (json.dumps(engine.options(), sort_keys=True), level)
+        with self.lock:
+            text = entry['texts'].get(key)
+            if text is None:
+                compiler = OpenSCADEngine(engine.indent)
+                compiler.library = self
+                compiler.passes = engine.passes
+                compiler.resolution = engine.resolution
+                model = entry['model']
+                if compiler.passes or compiler.resolution:
+                    model = compiler.load(compiler.optimize(entry['tree']))
+                sink = io.StringIO()
+                writer = ScadWriter(sink)
+                compiler.emitModel(model, writer, level)
+                writer.flush()
+                text = entry['texts'][key] = sink.getvalue()
+            return text
+
+    def expand(self, data):
+        """
+        Returns the tree with the construction of each component filled
+        in, for code that walks constructions rather than emitting them
+        """
+        if not any(node.get('category') == "element"
+                   and 'construction' not in node and node['name'] in self
+                   for node in iterNodes(data)):
+            return data
+        data = copyTree(data)
+        for node in iterNodes(data):
+            if node.get('category') == "element" \
+                    and 'construction' not in node and node['name'] in self:
+                node['construction'] = self.expand(
+                    self.entry(node['name'])['tree'])
+        return data
+
+    def stats(self):
+        return {"components": len(self.index), "loaded": len(self.entries),
+                "loads": self.loads, "evictions": self.evictions}
+
+
+class CompileCache:
+    """
+    Persistent cache of emitted OpenSCAD text in a SQLite file.
+    Entries are keyed by a hash of the canonical input JSON, the engine
+    version and source, and the engine's emission options. Once the
+    stored text exceeds maxSize bytes the least recently used entries
+    are evicted. Hit and miss counts are kept in the file as well.
+    One connection is shared by all threads, one transaction at a time.
+    """
+    def __init__(self, path=None, maxSize=256 * 1024 * 1024):
+        self.path = path or self.defaultPath()
+        self.maxSize = maxSize
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=30,
+                                  check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS entries ("
+                            "key TEXT PRIMARY KEY, output TEXT, "
+                            "size INTEGER, used REAL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS entries_used "
+                            "ON entries (used)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS counters ("
+                            "name TEXT PRIMARY KEY, value INTEGER)")
+            # The stored size is counted, so inserts need not sum it
+            self.db.execute("INSERT OR IGNORE INTO counters SELECT 'bytes', "
+                            "COALESCE(SUM(size), 0) FROM entries")
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def defaultPath():
+        root = os.environ.get("XDG_CACHE_HOME",
+                              os.path.join(os.path.expanduser("~"),
+                                           ".cache"))
+        return os.path.join(root, "textcad", "cache.sqlite")
+
+    @staticmethod
+    def engineDigest():
+        """Hash of the engine version and source, computed once"""
+        if not hasattr(CompileCache, '_engineDigest'):
+            digest = hashlib.sha256(__version__.encode())
+            try:
+                with open(__file__, 'rb') as source:
+                    digest.update(source.read())
+            except (NameError, OSError):
+                pass
+            CompileCache._engineDigest = digest.hexdigest()
+        return CompileCache._engineDigest
+
+    def key(self, data, options):
+        digest = hashlib.sha256(self.engineDigest().encode())
+        digest.update(json.dumps(options, sort_keys=True).encode())
+        digest.update(json.dumps(data, sort_keys=True,
+                                 separators=(",", ":")).encode())
+        return digest.hexdigest()
+
+    def count(self, name, amount=1):
+        self.db.execute("INSERT OR IGNORE INTO counters VALUES (?, 0)",
+                        (name,))
+        self.db.execute("UPDATE counters SET value = value + ? "
+                        "WHERE name = ?", (amount, name))
+
+    def get(self, key):
+        """Returns the cached text for key, or None on a miss"""
+        with self.lock, self.db:
+            row = self.db.execute("SELECT output FROM entries WHERE key = ?",
+                                  (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                self.count("misses")
+                return None
+            self.hits += 1
+            self.count("hits")
+            self.db.execute("UPDATE entries SET used = ? WHERE key = ?",
+                            (time.time(), key))
+        return row[0]
+
+    def put(self, key, output):
+        size = len(output.encode())
+        if size > self.maxSize:
+            return
+        with self.lock, self.db:
+            row = self.db.execute("SELECT size FROM entries WHERE key = ?",
+                                  (key,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO entries "
+                            "VALUES (?, ?, ?, ?)",
+                            (key, output, size, time.time()))
+            self.count("bytes", size - (row[0] if row else 0))
+            excess = self.db.execute("SELECT value FROM counters "
+                                     "WHERE name = 'bytes'").fetchone()[0] \
+                - self.maxSize
+            if excess <= 0:
+                return
+            # Walks the used index from the oldest entry only as far as
+            # needed, then deletes that many
+            rows = self.db.execute("SELECT size FROM entries ORDER BY used")
+            count = freed = 0
+            for oldSize, in rows:
+                count += 1
+                freed += oldSize
+                if freed >= excess:
+                    break
+            rows.close()
+            self.db.execute("DELETE FROM entries WHERE key IN (SELECT key "
+                            "FROM entries ORDER BY used LIMIT ?)", (count,))
+            self.count("bytes", -freed)
+
+    def clear(self):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM entries")
+            self.db.execute("DELETE FROM counters")
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.db.execute("SELECT COUNT(*), "
+                                            "COALESCE(SUM(size), 0) "
+                                            "FROM entries").fetchone()
+            counters = dict(self.db.execute("SELECT name, value "
+                                            "FROM counters"))
+        return {"entries": entries, "bytes": size,
+                "hits": counters.get("hits", 0),
+                "misses": counters.get("misses", 0)}
+
+    def close(self):
+        self.db.close()
+
+
+class RenderResult:
+    """
+    The outcome of rendering one .scad text: returncode is None when
+    openscad could not be run or was killed, error says why the render
+    failed or is None, and peakMemory is the largest resident size of
+    the openscad process in bytes, None where it cannot be measured.
+    """
+    def __init__(self, output, returncode=None, stderr="", wallTime=0.0,
+                 peakMemory=None, cached=False, error=None):
+        self.output = output
+        self.returncode = returncode
+        self.stderr = stderr
+        self.wallTime = wallTime
+        self.peakMemory = peakMemory
+        self.cached = cached
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def describe(self):
+        """One line for a report"""
+        if self.error:
+            return self.output + ": " + self.error
+        if self.cached:
+            return self.output + ": cached"
+        line = self.output + ": rendered in %.2fs" % self.wallTime
+        if self.peakMemory is not None:
+            line += ", peak %.1f MB" % (self.peakMemory / 1e6)
+        return line
+
+
+class RenderPool:
+    """
+    Renders OpenSCAD text headlessly with `openscad -o`, to STL, 3MF
+    or any format the output extension names. Each job runs in its own
+    openscad process, at most workers at a time, and is killed after
+    timeout seconds; its stderr is captured. With a cacheDir, outputs
+    are kept under a hash of the .scad text, format and arguments, so
+    identical parts render once; jobs for the same part wait for the
+    first rather than rendering it again. Hit and render counts are kept
+    in hits and renders.
+    """
+    def __init__(self, workers=None, timeout=300, cacheDir=None,
+                 executable="openscad", arguments=()):
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.cacheDir = cacheDir
+        self.executable = executable
+        self.arguments = list(arguments)
+        self.lock = threading.Lock()
+        self.keyLocks = {}
+        self.hits = 0
+        self.renders = 0
+
+    def key(self, text, extension):
+        digest = hashlib.sha256(json.dumps([extension, self.arguments])
+                                .encode())
+        digest.update(text.encode())
+        return digest.hexdigest()
+
+    def cachePath(self, key, extension):
+        return os.path.join(self.cacheDir, key[:2], key + extension)
+
+    def run(self, command, stderr):
+        """
+        Runs command until it exits or times out and returns its exit
+        code, or None once killed, and its peak resident memory. The
+        peak is sampled while polling for the exit, every 50 ms at
+        most, and taken from the exit status only for jobs too short
+        to sample.
+        """
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.DEVNULL, stderr=stderr)
+        if not hasattr(os, "wait4"):
+            try:
+                return process.wait(self.timeout), None
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+                return None, None
+        killed = []
+
+        def kill():
+            killed.append(True)
+            process.kill()
+
+        timer = threading.Timer(self.timeout, kill)
+        timer.start()
+        peak = None
+        delay = 0.001
+        try:
+            while True:
+                pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+                if pid:
+                    break
+                peak = self.residentPeak(process.pid) or peak
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+        finally:
+            timer.cancel()
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if peak is None:
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+            peak = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+        return (None if killed else process.returncode), peak
+
+    def residentPeak(self, pid):
+        """
+        Returns the peak resident size of a running process from
+        /proc, or None where there is no /proc. Unlike ru_maxrss, it
+        leaves out what this process held when it spawned the child.
+        """
+        try:
+            with open("/proc/" + str(pid) + "/status") as status:
+                for line in status:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            return None
+        return None
+
+    def render(self, text, output):
+        """
+        Renders OpenSCAD text to the output path and returns a
+        RenderResult; failures are reported there, not raised
+        """
+        extension = os.path.splitext(output)[1].lower()
+        if not self.cacheDir:
+            return self.renderText(text, output)
+        key = self.key(text, extension)
+        with self.lock:
+            keyLock = self.keyLocks.setdefault(key, threading.Lock())
+        with keyLock:
+            cached = self.cachePath(key, extension)
+            if os.path.exists(cached):
+                shutil.copyfile(cached, output)
+                with self.lock:
+                    self.hits += 1
+                return RenderResult(output, returncode=0, cached=True)
+            result = self.renderText(text, output)
+            if result.ok:
+                os.makedirs(os.path.dirname(cached), exist_ok=True)
+                partial = cached + "." + str(threading.get_ident())
+                shutil.copyfile(output, partial)
+                os.replace(partial, cached)
+        return result
+
+    def renderText(self, text, output):
+        executable = shutil.which(self.executable)
+        if executable is None:
+            return RenderResult(output, error=self.executable
+                                + " not found on PATH")
+        # openscad writes into a scratch directory, so a failed render
+        # never leaves a partial file at output
+        with tempfile.TemporaryDirectory() as workDir:
+            source = os.path.join(workDir, "part.scad")
+            partial = os.path.join(workDir, "part"
+                                   + os.path.splitext(output)[1])
+            with open(source, 'w') as scad:
+                scad.write(text)
+            with tempfile.TemporaryFile(dir=workDir) as stderr:
+                start = time.perf_counter()
+                returncode, peak = self.run([executable, "-o", partial]
+                                            + self.arguments + [source],
+                                            stderr)
+                wallTime = time.perf_counter() - start
+                stderr.seek(0)
+                errors = stderr.read().decode(errors="replace")
+            result = RenderResult(output, returncode, errors, wallTime, peak)
+            if returncode is None:
+                result.error = "timed out after %gs" % self.timeout
+            elif returncode != 0:
+                lines = errors.strip().splitlines()
+                result.error = "openscad exited with " + str(returncode) \
+                    + (": " + lines[-1] if lines else "")
+            elif not os.path.exists(partial):
+                result.error = "openscad wrote no output"
+            else:
+                shutil.move(partial, output)
+        with self.lock:
+            self.renders += 1
+        return result
+
+    def renderAll(self, jobs):
+        """
+        Renders (text, output) pairs across the pool and returns their
+        RenderResults in order
+        """
+        jobs = list(jobs)
+        if len(jobs) < 2 or self.workers == 1:
+            return [self.render(*job) for job in jobs]
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            return list(executor.map(lambda job: self.render(*job), jobs))
+
+
+def parameterTable(source, names=None):
+    """
+    Returns the (names, rows) of a table of parameter sets, one row per
+    variant: a NumPy array, structured or 2-D with names given for its
+    columns, a .npy file, or a CSV path or file whose header row names
+    the columns. CSV cells are read as JSON numbers, so 10 stays an
+    integer and 10.0 a float, as they would in a tree.
+    """
+    if isinstance(source, str) and source.endswith(".npy"):
+        if numpy is None:
+            raise ImportError(".npy parameter tables require NumPy")
+        source = numpy.load(source)
+    if numpy is not None and isinstance(source, numpy.ndarray):
+        if source.dtype.names:
+            return list(source.dtype.names), source.tolist()
+        if names is None or source.ndim != 2 \
+                or source.shape[1] != len(names):
+            raise ValueError("a plain array needs a name for each of its "
+                             "columns")
+        return list(names), source.tolist()
+    if isinstance(source, str):
+        with open(source, newline="") as stream:
+            return parameterTable(stream)
+    reader = csv.reader(source)
+    header = next(reader, None)
+    if not header:
+        raise ValueError("the parameter table has no header row")
+    names = [name.strip() for name in header]
+    rows = []
+    for line, cells in enumerate(reader, 2):
+        if not cells:
+            continue
+        if len(cells) != len(names):
+            raise ValueError("line " + str(line) + ": expected "
+                             + str(len(names)) + " values, got "
+                             + str(len(cells)))
+        row = []
+        for cell in cells:
+            try:
+                row.append(json.loads(cell))
+            except ValueError:
+                row.append(cell.strip())
+        rows.append(row)
+    return names, rows
+
+
+class Expression:
+    """
+    An arithmetic expression over named parameters, such as
+    "width - 2 * wall". It is parsed once into nested closures, with
+    constant subexpressions folded. Only numbers, names, pi, the
+    operators + - * / // % ** and calls to the functions below are
+    accepted, so evaluating one never runs arbitrary code. Functions
+    take radians, as in Python's math module.
+    """
+    operators = {ast.Add: operator.add, ast.Sub: operator.sub,
+                 ast.Mult: operator.mul, ast.Div: operator.truediv,
+                 ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod}
+    signs = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+    functions = {"abs": abs, "min": min, "max": max, "round": round,
+                 "floor": math.floor, "ceil": math.ceil, "sqrt": math.sqrt,
+                 "sin": math.sin, "cos": math.cos, "tan": math.tan,
+                 "asin": math.asin, "acos": math.acos, "atan": math.atan,
+                 "atan2": math.atan2, "hypot": math.hypot,
+                 "radians": math.radians, "degrees": math.degrees,
+                 "exp": math.exp, "log": math.log}
+    constants = {"pi": math.pi}
+
+    def __init__(self, text):
+        self.text = text
+        self.names = set()
+        try:
+            self.constant, built = self.build(ast.parse(text.strip(),
+                                                        mode="eval").body)
+        except SyntaxError as error:
+            raise ValueError("invalid expression '" + text + "': "
+                             + error.msg)
+        except (ArithmeticError, TypeError) as error:
+            raise ValueError("invalid expression '" + text + "': "
+                             + str(error))
+        self.names = frozenset(self.names)
+        if self.constant:
+            self.value = built
+            self.function = lambda values: built
+        else:
+            self.value = None
+            self.function = built
+
+    @classmethod
+    def reference(cls, name):
+        """The expression that is just the named parameter"""
+        expression = cls.__new__(cls)
+        expression.text = name
+        expression.names = frozenset([name])
+        expression.constant = False
+        expression.value = None
+        expression.function = lambda values: values[name]
+        return expression
+
+    maxBits = 1 << 16
+
+    def power(self, base, exponent):
+        """
+        ** with the exponent bounded, and integer results bounded to
+        maxBits bits, so nested powers such as (10**1000)**1000 are
+        rejected instead of computed. A result that is not real, as for
+        (-8)**(1/3), is rejected too.
+        """
+        if abs(exponent) > 1024:
+            raise ValueError("exponent " + str(exponent) + " is too large")
+        if isinstance(base, int) and isinstance(exponent, int) \
+                and abs(base).bit_length() * exponent > self.maxBits:
+            raise ValueError("power of a " + str(base.bit_length())
+                             + " bit integer is too large")
+        result = base ** exponent
+        if isinstance(result, complex):
+            raise ValueError("power of " + str(base) + " to "
+                             + str(exponent) + " is not a real number")
+        return result
+
+    def build(self, node):
+        """
+        Returns (True, value) for a constant subexpression, or
+        (False, function of the parameter values)
+        """
+        kind = node.__class__
+        if kind is ast.Constant and isNumber(node.value):
+            return True, node.value
+        if kind is ast.Name:
+            if node.id in self.constants:
+                return True, self.constants[node.id]
+            name = node.id
+            self.names.add(name)
+            return False, lambda values: values[name]
+        if kind is ast.UnaryOp and node.op.__class__ in self.signs:
+            apply = self.signs[node.op.__class__]
+            constant, operand = self.build(node.operand)
+            if constant:
+                return True, apply(operand)
+            return False, lambda values: apply(operand(values))
+        if kind is ast.BinOp and (node.op.__class__ in self.operators
+                                  or node.op.__class__ is ast.Pow):
+            apply = self.operators.get(node.op.__class__, self.power)
+            leftConstant, left = self.build(node.left)
+            rightConstant, right = self.build(node.right)
+            if leftConstant and rightConstant:
+                return True, apply(left, right)
+            if leftConstant:
+                return False, lambda values: apply(left, right(values))
+            if rightConstant:
+                return False, lambda values: apply(left(values), right)
+            return False, lambda values: apply(left(values), right(values))
+        if kind is ast.Call and node.func.__class__ is ast.Name \
+                and node.func.id in self.functions and not node.keywords:
+            apply = self.functions[node.func.id]
+            args = [self.build(arg) for arg in node.args]
+            if all(constant for constant, arg in args):
+                return True, apply(*[arg for constant, arg in args])
+            return False, lambda values: apply(*[
+                arg if constant else arg(values) for constant, arg in args])
+        raise SyntaxError("'" + ast.unparse(node) + "' is not allowed")
+
+    def evaluate(self, values):
+        """Returns the value for a dict of parameter values"""
+        return self.function(values)
+
+
+class Parameters:
+    """
+    Named parameters, each a number or an expression over the others.
+    The names each expression uses form a dependency graph, which must
+    be acyclic; order lists every parameter after those it uses, and
+    update() re-evaluates only the parameters downstream of a change.
+    """
+    def __init__(self, definitions=None):
+        if not isinstance(definitions or {}, dict):
+            raise SchemaError("tree.parameters", "expected an object")
+        self.definitions = {name: self.parse(name, value)
+                            for name, value in (definitions or {}).items()}
+        self.sort()
+
+    def parse(self, name, value):
+        if isinstance(value, str):
+            try:
+                return Expression(value)
+            except ValueError as error:
+                raise SchemaError("tree.parameters." + name, str(error))
+        if not isNumber(value):
+            raise SchemaError("tree.parameters." + name,
+                              "expected a number or an expression, got "
+                              + json.dumps(value, default=repr))
+        return value
+
+    def uses(self, name):
+        """The defined parameters the named one's expression uses"""
+        definition = self.definitions[name]
+        if definition.__class__ is not Expression:
+            return []
+        return sorted(definition.names & self.definitions.keys())
+
+    def sort(self):
+        """
+        Sets order and dependents, walking the graph depth first with
+        an explicit stack and failing on the first cycle found
+        """
+        order = []
+        dependents = {name: set() for name in self.definitions}
+        state = {}
+        for root in self.definitions:
+            if root in state:
+                continue
+            state[root] = "open"
+            trail = [root]
+            stack = [(root, iter(self.uses(root)))]
+            while stack:
+                name, pending = stack[-1]
+                for used in pending:
+                    dependents[used].add(name)
+                    if state.get(used) == "open":
+                        cycle = trail[trail.index(used):] + [used]
+                        raise SchemaError("tree.parameters." + used,
+                                          "cycle " + " -> ".join(cycle))
+                    if used not in state:
+                        state[used] = "open"
+                        trail.append(used)
+                        stack.append((used, iter(self.uses(used))))
+                        break
+                else:
+                    stack.pop()
+                    trail.pop()
+                    state[name] = "done"
+                    order.append(name)
+        self.order = order
+        self.dependents = dependents
+
+    def redefine(self, name, value):
+        """
+        Returns these parameters with one set to a number or an
+        expression; the others keep their parsed expressions
+        """
+        changed = copy.copy(self)
+        changed.definitions = dict(self.definitions)
+        changed.definitions[name] = self.parse(name, value)
+        changed.sort()
+        return changed
+
+    def compute(self, name, values):
+        definition = self.definitions[name]
+        if definition.__class__ is not Expression:
+            return definition
+        try:
+            return definition.evaluate(values)
+        except KeyError as error:
+            raise SchemaError("tree.parameters." + name,
+                              "unknown parameter '" + error.args[0] + "'")
+        except (ArithmeticError, ValueError, TypeError) as error:
+            raise SchemaError("tree.parameters." + name, "evaluating '"
+                              + definition.text + "': " + str(error))
+
+    def evaluate(self, inputs=None):
+        """
+        Returns the value of every parameter, those given in inputs
+        taking the place of their definitions
+        """
+        values = dict(inputs or {})
+        for name in self.order:
+            if name not in values:
+                values[name] = self.compute(name, values)
+        return values
+
+    def downstream(self, names):
+        """The given names and every parameter that depends on them"""
+        found = set(names)
+        stack = list(names)
+        while stack:
+            for dependent in self.dependents.get(stack.pop(), ()):
+                if dependent not in found:
+                    found.add(dependent)
+                    stack.append(dependent)
+        return found
+
+    def update(self, values, names):
+        """
+        Returns new values after the definitions of names changed, and
+        the names whose values changed, re-evaluating only the
+        parameters downstream of names
+        """
+        affected = self.downstream(names)
+        values = dict(values)
+        changed = set()
+        for name in self.order:
+            if name in affected:
+                value = self.compute(name, values)
+                old = values.get(name)
+                if value.__class__ is not old.__class__ or value != old:
+                    changed.add(name)
+                values[name] = value
+        return values, changed
+
+
+class Sweep:
+    """
+    Writes one template tree for many sets of parameters.
+    Any value of a node, or any number within one, may be
+    {"parameter": name} or {"expression": text}, an Expression over the
+    parameters; the template's 'parameters' object defines those the
+    table leaves out, as numbers or expressions. The template is validated
+    and walked once, into static text and a slot for each node that
+    uses a parameter. Every slot is then rendered for all variants at
+    once, the radii, sides, centering offsets and fragment counts of
+    primitives being computed on NumPy columns, when NumPy is installed
+    and there are columnMin variants or more. Each variant's text is
+    the static text joined with its slot texts. Booleans cannot be
+    parameters, and passes and resolution policies, which need each
+    variant's whole tree, cannot be used. Local passes, such as
+    HullRewritePass, run on each subtree rooted at one of their
+    operations: once in the template if it uses no parameter, or else
+    for every variant, the subtree being one slot.
+    """
+    structure = ("category", "name", "elements", "construction", "modules",
+                 "parameters")
+    # Fewest variants for which NumPy columns beat the engine's emitters
+    columnMin = 12
+
+    def __init__(self, engine, template):
+        if engine.wholeTreePasses() or engine.resolution:
+            raise ValueError("a sweep emits the template once for all "
+                             "variants; passes and resolution policies "
+                             "cannot be used")
+        self.engine = engine
+        # Only local passes are left, and each rewrites whole subtrees
+        self.rewritten = set().union(*[job.operations
+                                       for job in engine.passes])
+        if engine.library is not None:
+            template = engine.library.expand(template)
+        self.template = template
+        engine.load(json.loads(json.dumps(template), object_hook=lambda obj:
+                               1 if self.isReference(obj) else obj))
+        self.parameters = Parameters(template.get('parameters'))
+        self.expressions = {}
+        self.parts, self.slots = self.compile(template)
+
+    def isReference(self, value):
+        return value.__class__ is dict and len(value) == 1 \
+            and ('parameter' in value or 'expression' in value)
+
+    def substitute(self, value, row):
+        """Returns value with each reference replaced by its value in row"""
+        if value.__class__ is dict:
+            if self.isReference(value):
+                return self.expressions[id(value)].evaluate(row)
+            return {key: self.substitute(item, row)
+                    for key, item in value.items()}
+        if value.__class__ is list:
+            return [self.substitute(item, row) for item in value]
+        return value
+
+    def fieldKind(self, node, key):
+        engine = self.engine
+        if key in engine.placementKinds:
+            return engine.placementKinds[key]
+        fields = ()
+        if node['category'] == "element" and node['name'] in engine.primitives:
+            fields = engine.primitives[node['name']].fields
+        elif node['category'] == "operation":
+            fields = Operation.arguments.get(node['name'], ())
+        for field, kind, required in fields:
+            if field == key:
+                return kind
+        return "any"
+
+    def references(self, node, path):
+        """
+        Returns (key, expression, kind, path) for each reference in the
+        fields of one node, kind being what each of its values must be
+        """
+        found = []
+        for key, value in node.items():
+            if key in self.structure:
+                continue
+            kind = self.fieldKind(node, key).rstrip("?")
+            stack = [value]
+            while stack:
+                item = stack.pop()
+                if self.isReference(item):
+                    if kind in ("flags", "auto"):
+                        self.engine.fail((path, key, None),
+                                         "booleans cannot be parameters")
+                    text = item.get('parameter', item.get('expression'))
+                    if not isinstance(text, str):
+                        self.engine.fail((path, key, None),
+                                         "expected a parameter name")
+                    try:
+                        expression = Expression(text) if 'expression' in item \
+                            else Expression.reference(text)
+                    except ValueError as error:
+                        self.engine.fail((path, key, None), str(error))
+                    self.expressions[id(item)] = expression
+                    found.append((key, expression,
+                                  "integer" if kind == "integer" else
+                                  "count" if kind in ("count", "counts")
+                                  else "number", (path, key, None)))
+                elif item.__class__ is dict:
+                    stack.extend(item.values())
+                elif item.__class__ is list:
+                    stack.extend(item)
+        return found
+
+    def subtreeReferences(self, node, path):
+        """references for every node of a subtree"""
+        found = []
+        stack = [(node, path)]
+        while stack:
+            node, path = stack.pop()
+            found.extend(self.references(node, path))
+            if 'construction' in node:
+                stack.append((node['construction'],
+                              (path, "construction", None)))
+            stack.extend((child, (path, "elements", idx))
+                         for idx, child in enumerate(node.get('elements',
+                                                              [])))
+        return found
+
+    def isRewritten(self, node):
+        return node['category'] == "operation" \
+            and node['name'] in self.rewritten
+
+    def subtreeText(self, node, level):
+        """The text of a subtree at level, after the local passes"""
+        sink = io.StringIO()
+        writer = ScadWriter(sink)
+        self.engine.emitModel(self.engine.loadOptimized(node), writer, level)
+        writer.flush()
+        return sink.getvalue()
+
+    def compile(self, template):
+        """
+        Walks the template like emit, returning its text as a list of
+        strings and slot indices, and a (node, level, references) slot
+        for each node whose own text depends on parameters
+        """
+        engine = self.engine
+        parts = []
+        slots = []
+
+        def write(text):
+            if parts and parts[-1].__class__ is str:
+                parts[-1] += text
+            else:
+                parts.append(text)
+
+        start = engine.level
+        pad = " " * start * engine.indent
+        # The modules are written here, ahead of the root's own text
+        stack = [({key: val for key, val in template.items()
+                   if key not in ('modules', 'parameters')}, start, None)]
+        modules = template.get('modules', [])
+        for idx in range(len(modules) - 1, -1, -1):
+            stack.append(("\n" + pad + "}\n", start, None))
+            stack.append((modules[idx]['body'], start + 1,
+                          ((None, "modules", idx), "body", None)))
+            stack.append((pad + "module " + modules[idx]['name'] + "(){\n",
+                          start, None))
+        while stack:
+            node, level, path = stack.pop()
+            if node.__class__ is str:
+                write(node)
+                continue
+            category = node['category']
+            builtin = category == "operation" \
+                and node['name'] in engine.operations
+            if category and self.isRewritten(node):
+                refs = self.subtreeReferences(node, path)
+                if refs:
+                    parts.append(len(slots))
+                    slots.append((node, level, refs))
+                else:
+                    write(self.subtreeText(node, level))
+                continue
+            if builtin:
+                children = [(child, level + 1, (path, "elements", idx))
+                            for idx, child in enumerate(node['elements'])]
+            elif category in ("operation", "element") \
+                    and node['name'] not in engine.elements:
+                children = [(node['construction'], level,
+                             (path, "construction", None))]
+            else:
+                children = []
+            refs = self.references(node, path) if category else []
+            if refs:
+                parts.append(len(slots))
+                slots.append((node, level, refs))
+                separator = "\n" if builtin else ""
+                tail = " " * level * engine.indent + "}\n" if builtin else ""
+            else:
+                head, _, separator, tail = engine.nodeParts(node, level)
+                write(head)
+            if tail:
+                stack.append((tail, level, None))
+            for child in reversed(children):
+                if separator:
+                    stack.append((separator, level, None))
+                stack.append(child)
+        return parts, slots
+
+    def variants(self, names, rows):
+        """Returns each row as a dict of every parameter's value"""
+        return [self.parameters.evaluate(zip(names, row)) for row in rows]
+
+    def check(self, variants, slots, numbered=True):
+        """
+        Fails unless every reference of the given slots evaluates to a
+        value its field accepts, naming the variant when numbered
+        """
+        engine = self.engine
+        for node, level, refs in map(self.slots.__getitem__, slots):
+            for key, expression, kind, path in refs:
+                for name in expression.names:
+                    if variants and name not in variants[0]:
+                        engine.fail(path, "unknown parameter '" + name + "'")
+                check, description = fieldKinds[kind]
+                for idx, values in enumerate(variants):
+                    prefix = "variant " + str(idx) + ": " if numbered else ""
+                    try:
+                        value = expression.evaluate(values)
+                    except (ArithmeticError, ValueError, TypeError) as error:
+                        engine.fail(path, prefix + "evaluating '"
+                                    + expression.text + "': " + str(error))
+                    if not check(value):
+                        engine.fail(path, prefix + "expected " + description
+                                    + " for '" + expression.text + "', got "
+                                    + json.dumps(value, default=repr))
+
+    def cosines(self, sides):
+        """
+        Returns cos(pi / sides) for a column of side counts, computed
+        once per distinct count with math.cos, so radii match the
+        engine's to the last bit
+        """
+        unique, inverse = numpy.unique(sides, return_inverse=True)
+        return numpy.array([math.cos(math.pi / count)
+                            for count in unique.tolist()])[inverse]
+
+    def offsets(self, center, extrema, default):
+        """centeringOffset for columns of extrema, one vector per variant"""
+        axes = []
+        for idx, val in enumerate(center):
+            if val and not default[idx]:
+                axes.append((-extrema[idx] / 2).tolist())
+            elif not val and default[idx]:
+                axes.append((extrema[idx] / 2).tolist())
+            else:
+                axes.append(itertools.repeat(0, len(extrema[idx])))
+        return [list(vector) for vector in zip(*axes)]
+
+    def fragmentCounts(self, nodes, radius):
+        """fragmentCount for a column of radii"""
+        if nodes[0].get('fragments') is None:
+            return numpy.rint(radius * 20).astype(int).tolist()
+        return [node['fragments'] for node in nodes]
+
+    def primitives(self, name, nodes):
+        """
+        Returns the text of one primitive for every variant, as the
+        engine's emitters would write it
+        """
+        translate = self.engine.translate
+        values = lambda key: [node[key] for node in nodes]
+        column = lambda key: numpy.array(values(key), float)
+        center = nodes[0]['center']
+        flat = [True, True, False]
+        if name == "cube":
+            sizes = values('size')
+            offsets = self.offsets(center, numpy.array(sizes, float).T,
+                                   [False, False, False])
+            return [translate(offset) + "cube(size=" + str(size) + ");"
+                    for offset, size in zip(offsets, sizes)]
+        heights = values('height') if name != "sphere" else None
+        if name == "sphere":
+            radius = column('radius')
+            offsets = self.offsets(center, [radius] * 3, [True, True, True])
+            return [translate(offset) + "sphere(r=" + str(value)
+                    + ", $fn=" + str(fragments) + ");"
+                    for offset, value, fragments
+                    in zip(offsets, values('radius'),
+                           self.fragmentCounts(nodes, radius))]
+        height = numpy.array(heights, float)
+        if name == "cylinder":
+            radius = column('radius')
+            offsets = self.offsets(center, [radius, radius, height], flat)
+            return [translate(offset) + "cylinder(r=" + str(value) + ", h="
+                    + str(tall) + ", $fn=" + str(fragments) + ");"
+                    for offset, value, tall, fragments
+                    in zip(offsets, values('radius'), heights,
+                           self.fragmentCounts(nodes, radius))]
+        if name == "cone":
+            radius = numpy.maximum(column('topRadius'),
+                                   column('bottomRadius'))
+            offsets = self.offsets(center, [radius, radius, height], flat)
+            return [translate(offset) + "cylinder(r1=" + str(bottom)
+                    + ", r2=" + str(top) + ", h=" + str(tall) + ", $fn="
+                    + str(fragments) + ");"
+                    for offset, bottom, top, tall, fragments
+                    in zip(offsets, values('bottomRadius'),
+                           values('topRadius'), heights,
+                           self.fragmentCounts(nodes, radius))]
+        if name == "ntube":
+            sides = values('sides')
+            radius = column('apothem') / self.cosines(sides)
+        else:
+            inner = column('radius')
+            sides = numpy.maximum(numpy.floor(4 * inner), 3).astype(int)
+            radius = inner / self.cosines(sides)
+            sides = sides.tolist()
+            if nodes[0].get('tolerance') is not None:
+                radius = radius + column('tolerance')
+        offsets = self.offsets(center, [radius, radius, height], flat)
+        return [translate(offset) + "cylinder(r=" + str(value) + ", h="
+                + str(tall) + ", $fn=" + str(count) + ");"
+                for offset, value, tall, count
+                in zip(offsets, radius.tolist(), heights, sides)]
+
+    def render(self, variants, slots):
+        """Returns the texts of each of the given slots, one per variant"""
+        engine = self.engine
+        rendered = []
+        for node, level, refs in map(self.slots.__getitem__, slots):
+            if self.isRewritten(node):
+                rendered.append([self.subtreeText(self.substitute(node,
+                                                                  values),
+                                                  level)
+                                 for values in variants])
+                continue
+            keys = {ref[0] for ref in refs}
+            nodes = [dict(node, **{key: self.substitute(node[key], values)
+                                   for key in keys})
+                     for values in variants]
+            pad = " " * level * engine.indent
+            name = node['name']
+            if node['category'] == "element" and name in engine.elements:
+                texts = self.primitives(name, nodes) \
+                    if numpy is not None and len(nodes) >= self.columnMin \
+                    else map(engine.parseElement, nodes)
+                rendered.append([pad + engine.parseProperties(part) + text
+                                 for part, text in zip(nodes, texts)])
+            elif node['category'] == "element":
+                rendered.append([pad + engine.parseProperties(part)
+                                 for part in nodes])
+            else:
+                rendered.append([engine.nodeParts(part, level)[0]
+                                 for part in nodes])
+        return rendered
+
+    def texts(self, names, rows):
+        """Yields the OpenSCAD text of each row of parameter values"""
+        variants = self.variants(names, rows)
+        if not variants:
+            return
+        slots = range(len(self.slots))
+        self.check(variants, slots)
+        rendered = self.render(variants, slots)
+        for idx in range(len(variants)):
+            yield "".join([part if part.__class__ is str
+                           else rendered[part][idx] for part in self.parts])
+
+    def write(self, names, rows, outputDir, prefix="variant"):
+        """
+        Writes each variant to outputDir as prefix-N.scad, N being its
+        row number, and returns the paths written
+        """
+        os.makedirs(outputDir, exist_ok=True)
+        width = len(str(max(len(rows) - 1, 0)))
+        paths = []
+        for idx, text in enumerate(self.texts(names, rows)):
+            path = os.path.join(outputDir, prefix + "-"
+                                + str(idx).zfill(width) + ".scad")
+            with open(path, 'w') as output:
+                if self.engine.compact:
+                    output = CompactStream(output, self.engine.compact)
+                output.write(text)
+            paths.append(path)
+        return paths
+
+
+class ParametricModel:
+    """
+    A parametric template kept compiled between edits, for editors and
+    optimizers that change a parameter and re-emit. set() re-evaluates
+    only the parameters derived from the one changed and re-renders only
+    the nodes whose fields use a parameter whose value changed; all
+    other text is reused from the previous emission.
+    """
+    def __init__(self, engine, template):
+        self.sweep = Sweep(engine, template)
+        self.parameters = self.sweep.parameters
+        self.values = self.parameters.evaluate()
+        self.users = {}
+        for idx, (node, level, refs) in enumerate(self.sweep.slots):
+            for ref in refs:
+                for name in ref[1].names:
+                    self.users.setdefault(name, set()).add(idx)
+        self.texts = self.render(self.values, range(len(self.sweep.slots)))
+        self.rendered = len(self.texts)
+
+    def render(self, values, slots):
+        self.sweep.check([values], slots, numbered=False)
+        return [texts[0] for texts in self.sweep.render([values], slots)]
+
+    def set(self, name, value):
+        """
+        Sets a parameter to a number or an expression and returns the
+        names of the parameters whose values changed. Nothing changes
+        if the new value leaves the model invalid.
+        """
+        parameters = self.parameters.redefine(name, value)
+        values, changed = parameters.update(self.values, [name])
+        slots = sorted(set().union(*[self.users.get(used, ())
+                                     for used in changed]))
+        texts = self.render(values, slots)
+        self.parameters = parameters
+        self.values = values
+        for idx, text in zip(slots, texts):
+            self.texts[idx] = text
+        self.rendered = len(slots)
+        return changed
+
+    def write(self, stream, flushSize=65536):
+        """Writes the OpenSCAD text for the current parameter values"""
+        if self.sweep.engine.compact:
+            stream = CompactStream(stream, self.sweep.engine.compact)
+        writer = ScadWriter(stream, flushSize)
+        for part in self.sweep.parts:
+            writer.write(part if part.__class__ is str else self.texts[part])
+        writer.flush()
+
+    def text(self):
+        sink = io.StringIO()
+        self.write(sink)
+        return sink.getvalue()
+
+
+class CompileOptions:
+    """
+    Settings for compileTree, given explicitly instead of through the
+    command line. The engine they describe is built once, here; it keeps
+    no traversal state between calls, so one CompileOptions can serve
+    any number of concurrent compiles.
+    resolution is a ResolutionPolicy, cache a CompileCache, parallel a
+    ParallelEmitter, compact a CompactFormat and library a
+    ComponentLibrary, or None. Minkowski sums
+    and hulls are rewritten by HullRewritePass unless hullRewrite is
+    False.
+    """
+    def __init__(self, indent=4, flushSize=65536, simplify=False,
+                 foldTransforms=False, dedup=False, dedupMinNodes=4,
+                 dedupMinCount=2, resolution=None, cache=None,
+                 parallel=None, compact=None, hullRewrite=True,
+                 library=None):
+        self.flushSize = flushSize
+        self.engine = OpenSCADEngine(indent=indent)
+        if hullRewrite:
+            self.engine.passes.append(HullRewritePass())
+        if simplify:
+            self.engine.passes.append(SimplifyPass())
+        if foldTransforms:
+            self.engine.passes.append(TransformFoldPass())
+        if dedup:
+            self.engine.passes.append(DeduplicatePass(
+                minNodes=dedupMinNodes, minCount=dedupMinCount))
+        self.engine.resolution = resolution
+        self.engine.cache = cache
+        self.engine.parallel = parallel
+        self.engine.compact = compact
+        self.engine.library = library
+
+
+def compileTree(tree, sink, options=None):
+    """
+    Writes the OpenSCAD text for a textcad tree to a file-like sink and
+    returns the reports of the passes that ran, keyed by pass name.
+    A template with parameters is written with their default values.
+    The tree is not modified. Safe to call from many threads at once,
+    with shared or separate options.
+    """
+    options = options or defaultOptions
+    if isinstance(tree, dict) and 'parameters' in tree:
+        ParametricModel(options.engine, tree).write(sink, options.flushSize)
+        return {}
+    return options.engine.writeJSON(tree, sink, flushSize=options.flushSize)
+
+
+defaultOptions = CompileOptions()
+
+
+def compileSweep(template, names, rows, outputDir, options=None,
+                 prefix="variant"):
+    """
+    Writes one .scad file per row of parameter values for a template
+    tree, as Sweep.write does, and returns their paths
+    """
+    options = options or defaultOptions
+    return Sweep(options.engine, template).write(names, rows, outputDir,
+                                                 prefix)
+
+
+class CompileServer:
+    """
+    Keeps compile engines warm for editors and tools that would
+    otherwise start the command line for every compile. Requests and
+    responses are JSON lines, over a Unix socket or stdin and stdout:
+        {"id": 1, "op": "compile", "tree": {...}, "options": {...}}
+        {"id": 2, "op": "compile", "path": "/abs/part.json"}
+        {"op": "stats"}, {"op": "ping"}, {"op": "shutdown"}
+    Each response echoes the id and has "ok", then "output" and
+    "reports" for a compile, or "error". options takes the optionKeys;
+    one CompileOptions is built per distinct set and reused. Compiles
+    run on a thread pool, so clients are served concurrently and a long
+    compile never holds up reading other requests.
+    """
+    optionKeys = {"indent": isInteger, "simplify": isFlag,
+                  "foldTransforms": isFlag, "dedup": isFlag,
+                  "dedupMinNodes": isInteger, "dedupMinCount": isInteger,
+                  "resolution": lambda value: value in ResolutionPolicy.modes,
+                  "facetBudget": isInteger, "hullRewrite": isFlag}
+    lineLimit = 1 << 30
+
+    def __init__(self, cache=None, workers=None, library=None):
+        self.cache = cache
+        self.library = library
+        self.executor = concurrent.futures.ThreadPoolExecutor(workers)
+        self.lock = threading.Lock()
+        self.configured = {}
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.compiles = 0
+        self.compileTime = 0.0
+        self.slowest = 0.0
+        self.stopping = None
+
+    @staticmethod
+    def defaultSocket():
+        root = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+        return os.path.join(root, "textcad-" + str(os.getuid()) + ".sock")
+
+    def compileOptions(self, options):
+        """Returns the CompileOptions for a request's options, built once"""
+        if not isinstance(options, dict):
+            raise ValueError("options must be an object")
+        for key, value in options.items():
+            if key not in self.optionKeys or not self.optionKeys[key](value):
+                raise ValueError("bad option " + json.dumps({key: value}))
+        canonical = json.dumps(options, sort_keys=True)
+        with self.lock:
+            if canonical not in self.configured:
+                settings = dict(options)
+                resolution = None
+                if 'resolution' in settings or 'facetBudget' in settings:
+                    resolution = ResolutionPolicy(
+                        settings.pop('resolution', "production"),
+                        facetBudget=settings.pop('facetBudget', None))
+                self.configured[canonical] = CompileOptions(
+                    resolution=resolution, cache=self.cache,
+                    library=self.library, **settings)
+            return self.configured[canonical]
+
+    def compile(self, request):
+        """Runs one compile request on a worker thread"""
+        options = self.compileOptions(request.get('options', {}))
+        if 'path' in request:
+            with open(request['path']) as source:
+                tree = json.load(source)
+        elif 'tree' in request:
+            tree = request['tree']
+        else:
+            raise ValueError("a compile needs a tree or a path")
+        start = time.perf_counter()
+        sink = io.StringIO()
+        reports = compileTree(tree, sink, options)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.compiles += 1
+            self.compileTime += elapsed
+            self.slowest = max(self.slowest, elapsed)
+        return {"ok": True, "output": sink.getvalue(), "reports": reports}
+
+    def stats(self):
+        with self.lock:
+            stats = {"uptime": time.time() - self.started,
+                     "requests": self.requests, "errors": self.errors,
+                     "compiles": self.compiles,
+                     "compileSeconds": self.compileTime,
+                     "meanCompileMs": self.compileTime * 1000
+                     / max(self.compiles, 1),
+                     "slowestCompileMs": self.slowest * 1000}
+        stats['cache'] = self.cache.stats() if self.cache else None
+        return stats
+
+    async def respond(self, line):
+        """Returns the response to one request line"""
+        request = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request must be an object")
+            op = request.get('op', "compile")
+            if op == "compile":
+                response = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self.compile, request)
+            elif op == "stats":
+                response = {"ok": True, "stats": self.stats()}
+            elif op == "ping":
+                response = {"ok": True}
+            elif op == "shutdown":
+                self.stopping.set()
+                response = {"ok": True}
+            else:
+                raise ValueError("unknown op " + json.dumps(op))
+        except Exception as error:
+            with self.lock:
+                self.errors += 1
+            response = {"ok": False,
+                        "error": type(error).__name__ + ": " + str(error)}
+        with self.lock:
+            self.requests += 1
+        if 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    async def serveLines(self, reader, write):
+        """
+        Answers each line from reader as soon as it is done, so one
+        client may have several requests in flight
+        """
+        pending = set()
+
+        async def answer(line):
+            response = await self.respond(line)
+            write((json.dumps(response) + "\n").encode())
+
+        while not self.stopping.is_set():
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                task = asyncio.ensure_future(answer(line))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending)
+
+    async def serveUnix(self, path):
+        """Serves clients on a Unix socket at path until shut down"""
+        self.stopping = asyncio.Event()
+
+        async def connection(reader, writer):
+            try:
+                await self.serveLines(reader, writer.write)
+                await writer.drain()
+            finally:
+                writer.close()
+
+        if os.path.exists(path):
+            os.remove(path)
+        server = await asyncio.start_unix_server(connection, path,
+                                                 limit=self.lineLimit)
+        try:
+            await self.stopping.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+            if os.path.exists(path):
+                os.remove(path)
+
+    async def serveStdio(self, stdin=None, stdout=None):
+        """
+        Serves one client on stdin and stdout until either closes.
+        Anything else printed goes to stderr, out of the responses.
+        """
+        self.stopping = asyncio.Event()
+        stdin = stdin or sys.stdin
+        if stdout is None:
+            stdout = sys.stdout.buffer
+            sys.stdout = sys.stderr
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=self.lineLimit)
+        await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), stdin)
+
+        def write(data):
+            stdout.write(data)
+            stdout.flush()
+
+        await self.serveLines(reader, write)
+
+
+def optionsFromArgs(args):
+    """Returns the CompileOptions given by parsed command line args"""
+    resolution = None
+    if args.resolution or args.facet_budget:
+        limits = {}
+        for limit in args.fragment_limit:
+            name, low, high = limit.split(":")
+            limits[name] = (int(low), int(high))
+        resolution = ResolutionPolicy(mode=args.resolution or "production",
+                                      chordError=args.chord_error,
+                                      minFragments=args.min_fragments,
+                                      maxFragments=args.max_fragments,
+                                      limits=limits,
+                                      facetBudget=args.facet_budget)
+    compact = None
+    if args.compact or args.minify:
+        compact = CompactFormat(precision=args.precision,
+                                minify=args.minify)
+    parallel = None
+    if args.emit_workers is not None:
+        parallel = ParallelEmitter(args.emit_workers or None,
+                                   threshold=args.emit_threshold)
+    cache = None
+    cachePath = args.cache or os.environ.get("TEXTCAD_CACHE")
+    if cachePath and not args.no_cache:
+        cache = CompileCache(cachePath, maxSize=args.cache_size)
+    library = None
+    libraryPath = args.library or os.environ.get("TEXTCAD_LIBRARY")
+    if libraryPath:
+        library = ComponentLibrary(libraryPath, maxEntries=args.library_size)
+    return CompileOptions(indent=args.indent, flushSize=args.flush_size,
+                          simplify=args.simplify,
+                          foldTransforms=args.fold_transforms,
+                          dedup=args.dedup,
+                          dedupMinNodes=args.dedup_min_nodes,
+                          dedupMinCount=args.dedup_min_count,
+                          resolution=resolution, cache=cache,
+                          parallel=parallel, compact=compact,
+                          hullRewrite=not args.no_hull_rewrite,
+                          library=library)
+
+
+def engineFromArgs(args):
+    """Returns an OpenSCADEngine configured from parsed command line args"""
+    return optionsFromArgs(args).engine
+
+
+def renderPoolFromArgs(args):
+    """Returns the RenderPool given by parsed command line args"""
+    return RenderPool(workers=args.jobs, timeout=args.render_timeout,
+                      cacheDir=args.render_cache
+                      or os.environ.get("TEXTCAD_RENDER_CACHE"))
+
+
+def findInputs(paths, pattern="*.json"):
+    """
+    Expands files, directories (searched recursively for pattern) and
+    glob patterns into a sorted list of textcad files
+    """
+    found = set()
+    for path in paths:
+        matches = glob.glob(path, recursive=True) if glob.has_magic(path) \
+            else [path]
+        for match in matches:
+            if os.path.isdir(match):
+                found.update(glob.glob(os.path.join(match, "**", pattern),
+                                       recursive=True))
+            else:
+                found.add(match)
+    return sorted(found)
+
+
+batchOptions = None
+
+
+def adoptBatch(args):
+    """
+    Builds the CompileOptions of a batch once per worker process, as its
+    initializer, so the cache and library are opened once, not per file
+    """
+    global batchOptions
+    batchOptions = optionsFromArgs(args)
+
+
+def compileFile(job, options=None):
+    """
+    Compiles one (input, output) pair of a batch with options, or those
+    adoptBatch built, writing through a temporary file so a failure
+    never leaves partial output. Returns the input path and the error
+    message, or None on success.
+    """
+    inputPath, outputPath = job
+    partial = outputPath + ".part"
+    try:
+        with open(inputPath) as source:
+            data = json.load(source)
+        with open(partial, 'w') as output:
+            compileTree(data, output, options or batchOptions)
+        os.replace(partial, outputPath)
+    except Exception as error:
+        if os.path.exists(partial):
+            os.remove(partial)
+        return inputPath, type(error).__name__ + ": " + str(error)
+    return inputPath, None
+
+
+def batchOutputs(paths, outputDir=None, pattern="*.json"):
+    """
+    Returns an (input, output) pair for every textcad file found under
+    paths, the output being next to the input, or under outputDir, with
+    a .scad extension
+    """
+    inputs = findInputs(paths, pattern)
+    if inputs:
+        base = os.path.commonpath([os.path.dirname(os.path.abspath(path))
+                                   for path in inputs])
+    pairs = []
+    for inputPath in inputs:
+        outputPath = os.path.splitext(inputPath)[0] + ".scad"
+        if outputDir:
+            # Keep the layout below the inputs' common directory so files
+            # with the same name in different directories stay apart
+            outputPath = os.path.join(outputDir, os.path.relpath(
+                os.path.abspath(outputPath), base))
+            os.makedirs(os.path.dirname(outputPath), exist_ok=True)
+        pairs.append((inputPath, outputPath))
+    return pairs
+
+
+def compileBatch(paths, args, outputDir=None, jobs=None, pattern="*.json"):
+    """
+    Compiles every textcad file found under paths across a process pool
+    of jobs workers (all cores by default), writing the outputs
+    batchOutputs names. Returns a (path, error) pair per input in order;
+    failures do not stop the batch.
+    """
+    options = argparse.Namespace(**{key: val for key, val in vars(args)
+                                    .items() if key not in ('input',
+                                                            'output')})
+    batch = batchOutputs(paths, outputDir, pattern)
+    if jobs == 1 or len(batch) < 2:
+        compiled = optionsFromArgs(options)
+        return [compileFile(job, compiled) for job in batch]
+    workers = jobs or os.cpu_count() or 1
+    chunk = max(1, len(batch) // (workers * 4))
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=adoptBatch,
+            initargs=(options,)) as executor:
+        return list(executor.map(compileFile, batch, chunksize=chunk))
+
+
+def writeProfile(profiler, destination):
+    """Stops a profile, saving it to destination or printing it if '-'"""
+    profiler.disable()
+    import pstats
+    if destination == "-":
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats(
+            "cumulative").print_stats(25)
+    else:
+        profiler.dump_stats(destination)
+
+
+def argumentParser():
+    """Returns the parser for the textcad command line"""
+    parser = argparse.ArgumentParser(prog="textcad",
+                                     usage="%(prog)s [options] input...",
+                                     description="The textcad engine."
+                                     )
+    parser.add_argument("-o", "--output", nargs='?',
+                        type=argparse.FileType('w'),
+                        default=sys.stdout,
+                        help="Output file, defaults to stdout"
+                        )
+    parser.add_argument("input", nargs='?',
+                        type=argparse.FileType('r'),
+                        default=sys.stdin,
+                        help="input file, defaults to stdin"
+                        )
+    parser.add_argument("-v", "--verbose",
+                        action='store_true',
+                        default=False,
+                        help="log custom elements and library components "
+                             "on stderr while traversing the textcad file"
+                        )
+    parser.add_argument("-s", "--show",
+                        action='store_true',
+                        default=False,
+                        help="launch OpenSCAD with the file when finished"
+                        )
+    parser.add_argument("-i", "--indent",
+                        type=int,
+                        default=4,
+                        help="number of spaces for indentation (default: 4)"
+                        )
+    parser.add_argument("--flush-size",
+                        type=int,
+                        default=65536,
+                        help="characters buffered before each write to the "
+                             "output (default: 65536)"
+                        )
+    parser.add_argument("--compact",
+                        action='store_true',
+                        default=False,
+                        help="round floats, write integral ones as integers "
+                             "and drop wrappers that do nothing, reporting "
+                             "the size saved"
+                        )
+    parser.add_argument("--precision",
+                        type=int,
+                        default=6,
+                        help="decimal places kept by --compact (default: 6)"
+                        )
+    parser.add_argument("--minify",
+                        action='store_true',
+                        default=False,
+                        help="--compact, and drop indentation, newlines and "
+                             "spaces too"
+                        )
+    parser.add_argument("--library",
+                        metavar="DIR",
+                        help="resolve custom elements without a "
+                             "construction from the components in DIR, "
+                             "one NAME.json each (or set TEXTCAD_LIBRARY)"
+                        )
+    parser.add_argument("--library-size",
+                        type=int,
+                        default=128,
+                        help="components kept loaded before the least "
+                             "recently used is evicted (default: 128)"
+                        )
+    parser.add_argument("--stream",
+                        action='store_true',
+                        default=False,
+                        help="emit each element of the root operation as "
+                             "soon as it is read, for inputs too large to "
+                             "hold in memory"
+                        )
+    parser.add_argument("--json-lines",
+                        action='store_true',
+                        default=False,
+                        help="read input as JSON lines, one part per line, "
+                             "streaming each"
+                        )
+    parser.add_argument("--dedup",
+                        action='store_true',
+                        default=False,
+                        help="hoist repeated subtrees into OpenSCAD modules"
+                        )
+    parser.add_argument("--dedup-min-nodes",
+                        type=int,
+                        default=4,
+                        help="smallest subtree, in nodes, to hoist "
+                             "(default: 4)"
+                        )
+    parser.add_argument("--dedup-min-count",
+                        type=int,
+                        default=2,
+                        help="fewest occurrences of a subtree to hoist "
+                             "(default: 2)"
+                        )
+    parser.add_argument("--simplify",
+                        action='store_true',
+                        default=False,
+                        help="drop booleans that bounding boxes prove have "
+                             "no effect (requires NumPy)"
+                        )
+    parser.add_argument("--no-hull-rewrite",
+                        action='store_true',
+                        default=False,
+                        help="emit minkowski sums and hulls as written "
+                             "instead of as cheaper hulls"
+                        )
+    parser.add_argument("--fold-transforms",
+                        action='store_true',
+                        default=False,
+                        help="compose transforms into one multmatrix per "
+                             "primitive or group (requires NumPy)"
+                        )
+    parser.add_argument("-r", "--resolution",
+                        choices=sorted(ResolutionPolicy.modes),
+                        help="choose $fn for round primitives by chord "
+                             "error instead of 20 per unit of radius"
+                        )
+    parser.add_argument("--chord-error",
+                        type=float,
+                        help="largest gap between a circle and its polygon"
+                        )
+    parser.add_argument("--min-fragments",
+                        type=int,
+                        help="fewest fragments for any round primitive"
+                        )
+    parser.add_argument("--max-fragments",
+                        type=int,
+                        help="most fragments for any round primitive"
+                        )
+    parser.add_argument("--fragment-limit",
+                        action='append',
+                        default=[],
+                        metavar="NAME:MIN:MAX",
+                        help="fragment range for one primitive, e.g. "
+                             "sphere:8:64 (repeatable)"
+                        )
+    parser.add_argument("--facet-budget",
+                        type=int,
+                        help="estimated facets allowed for the whole model"
+                        )
+    parser.add_argument("--emit-workers",
+                        type=int,
+                        metavar="N",
+                        help="emit the children of wide operations on N "
+                             "processes, or one per core if N is 0"
+                        )
+    parser.add_argument("--emit-threshold",
+                        type=int,
+                        default=10000,
+                        help="fewest children of an operation emitted in "
+                             "parallel (default: 10000)"
+                        )
+    parser.add_argument("-b", "--batch",
+                        nargs='+',
+                        metavar="PATH",
+                        help="compile many files, directories or globs "
+                             "instead of input"
+                        )
+    parser.add_argument("-j", "--jobs",
+                        type=int,
+                        help="worker processes for --batch "
+                             "(default: one per core)"
+                        )
+    parser.add_argument("--output-dir",
+                        help="directory for --batch outputs (default: next "
+                             "to each input) or --sweep outputs (default: "
+                             "the current directory)"
+                        )
+    parser.add_argument("--set",
+                        action='append',
+                        default=[],
+                        metavar="NAME=VALUE",
+                        help="set a parameter of a parametric input to a "
+                             "number or an expression (repeatable)"
+                        )
+    parser.add_argument("--sweep",
+                        metavar="TABLE",
+                        help="write input, a template with parameters, once "
+                             "per row of a CSV or .npy table of parameter sets"
+                        )
+    parser.add_argument("--render",
+                        metavar="PATH",
+                        help="render the output headlessly with openscad to "
+                             "PATH, in the format its extension names "
+                             "(.stl, .3mf, ...)"
+                        )
+    parser.add_argument("--stl",
+                        metavar="PATH",
+                        help="write binary STL to PATH with NumPy when the "
+                             "model only unions primitives, else render it "
+                             "with openscad as --render does"
+                        )
+    parser.add_argument("--render-format",
+                        metavar="EXT",
+                        help="with --batch, render each output to EXT "
+                             "next to it"
+                        )
+    parser.add_argument("--render-timeout",
+                        type=float,
+                        default=300,
+                        help="seconds before a render is killed "
+                             "(default: 300)"
+                        )
+    parser.add_argument("--render-cache",
+                        metavar="DIR",
+                        help="reuse renders of identical OpenSCAD text "
+                             "from DIR, or set TEXTCAD_RENDER_CACHE"
+                        )
+    parser.add_argument("--cache",
+                        metavar="PATH",
+                        help="reuse output for unchanged input from the "
+                             "SQLite cache at PATH, or set TEXTCAD_CACHE "
+                             "(--clear-cache and --cache-stats default to "
+                             + CompileCache.defaultPath() + ")"
+                        )
+    parser.add_argument("--no-cache",
+                        action='store_true',
+                        default=False,
+                        help="bypass the compile cache"
+                        )
+    parser.add_argument("--cache-size",
+                        type=int,
+                        default=256 * 1024 * 1024,
+                        help="bytes of output kept in the cache before the "
+                             "least recently used is evicted"
+                        )
+    parser.add_argument("--clear-cache",
+                        action='store_true',
+                        default=False,
+                        help="empty the compile cache and exit"
+                        )
+    parser.add_argument("--cache-stats",
+                        action='store_true',
+                        default=False,
+                        help="print compile cache statistics and exit"
+                        )
+    parser.add_argument("--serve",
+                        metavar="SOCKET",
+                        help="keep an engine warm and compile requests from "
+                             "textcad_client.py on a Unix socket (the client "
+                             "connects to " + CompileServer.defaultSocket()
+                             + " by default)"
+                        )
+    parser.add_argument("--stdio-server",
+                        action='store_true',
+                        default=False,
+                        help="compile JSON-lines requests from stdin, "
+                             "answering on stdout"
+                        )
+    parser.add_argument("--stats",
+                        action='store_true',
+                        default=False,
+                        help="report node counts, emitter times, output "
+                             "sizes and estimated render cost on stderr"
+                        )
+    parser.add_argument("--stats-format",
+                        choices=["text", "json"],
+                        default="text",
+                        help="write --stats as text or JSON (default: text)"
+                        )
+    parser.add_argument("--check-clashes",
+                        action='store_true',
+                        default=False,
+                        help="report the parts whose bounding boxes overlap "
+                             "on stderr (requires NumPy)"
+                        )
+    parser.add_argument("--clash-level",
+                        choices=AssemblyIndex.levels,
+                        default="parts",
+                        help="compare the boxes of parts or of primitives "
+                             "for --check-clashes (default: parts)"
+                        )
+    parser.add_argument("--no-gc",
+                        action="store_true",
+                        help="turn the garbage collector off for the run; "
+                             "a one-off compile keeps every node it builds, "
+                             "so collections find little to free")
+    parser.add_argument("--profile",
+                        metavar="PATH",
+                        help="run under cProfile, saving the profile to "
+                             "PATH, or printing the hottest functions on "
+                             "stderr if PATH is -"
+                        )
+    parser.add_argument("-w", "--watch",
+                        action='store_true',
+                        default=False,
+                        help="recompile whenever input changes; with "
+                             "--show, OpenSCAD reloads the output itself"
+                        )
+    parser.add_argument("--interval",
+                        type=float,
+                        default=0.1,
+                        help="seconds between checks for --watch "
+                             "(default: 0.1)"
+                        )
+    parser.add_argument('--version',
+                        action='version',
+                        version="%(prog)s " + __version__
+                        )
+    return parser
+
+
+if __name__ == "__main__":
+    parser = argumentParser()
+
+    #Always output help by default
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(0)  # Exit after help display
+
+    args = parser.parse_args()
+
+    if args.verbose:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(name)s: %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+
+    if args.no_gc:
+        gc.disable()
+
+    if args.profile:
+        # Imported here so runs without --profile never load it
+        import cProfile
+        profiler = cProfile.Profile()
+        atexit.register(writeProfile, profiler, args.profile)
+        profiler.enable()
+
+    if args.clear_cache or args.cache_stats:
+        cache = CompileCache(args.cache or os.environ.get("TEXTCAD_CACHE"))
+        if args.clear_cache:
+            cache.clear()
+        if args.cache_stats:
+            sys.stdout.write(json.dumps(cache.stats()) + "\n")
+        sys.exit(0)
+
+    if args.serve or args.stdio_server:
+        engine = engineFromArgs(args)
+        server = CompileServer(engine.cache, workers=args.jobs,
+                               library=engine.library)
+        try:
+            if args.stdio_server:
+                asyncio.run(server.serveStdio())
+            else:
+                sys.stderr.write("serving on " + args.serve + "\n")
+                asyncio.run(server.serveUnix(args.serve))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if args.batch:
+        start = time.time()
+        results = compileBatch(args.batch, args, outputDir=args.output_dir,
+                               jobs=args.jobs)
+        failures = [(path, error) for path, error in results if error]
+        for path, error in failures:
+            sys.stderr.write(path + ": " + error + "\n")
+        sys.stderr.write("compiled " + str(len(results) - len(failures))
+                         + " of " + str(len(results)) + " files in "
+                         + "%.2fs" % (time.time() - start) + "\n")
+        if args.render_format:
+            outputs = dict(batchOutputs(args.batch, args.output_dir))
+            jobs = []
+            for path, error in results:
+                if not error:
+                    with open(outputs[path]) as scad:
+                        jobs.append((scad.read(), os.path.splitext(
+                            outputs[path])[0] + "."
+                            + args.render_format.lstrip(".")))
+            renders = renderPoolFromArgs(args).renderAll(jobs)
+            for result in renders:
+                sys.stderr.write(result.describe() + "\n")
+            failures += [result for result in renders if not result.ok]
+        sys.exit(1 if failures else 0)
+
+    if args.watch:
+        if args.input is sys.stdin:
+            parser.error("--watch needs an input file")
+        c = engineFromArgs(args)
+        c.cache = None
+        output = args.output
+        if output is not sys.stdout:
+            output.close()
+            output = output.name
+        watcher = Watcher(c, args.input.name, output, interval=args.interval)
+        watcher.rebuild()
+        if args.show and output is not sys.stdout:
+            subprocess.Popen(["openscad", os.path.abspath(output)])
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            sys.exit(0)
+
+    if args.sweep:
+        template = json.loads(args.input.read())
+        prefix = "variant" if args.input is sys.stdin else \
+            os.path.splitext(os.path.basename(args.input.name))[0]
+        try:
+            names, rows = parameterTable(args.sweep)
+            paths = compileSweep(template, names, rows,
+                                 args.output_dir or ".",
+                                 optionsFromArgs(args), prefix)
+        except SchemaError as error:
+            sys.stderr.write(args.input.name + ": " + str(error) + "\n")
+            sys.exit(1)
+        except ValueError as error:
+            sys.stderr.write(args.sweep + ": " + str(error) + "\n")
+            sys.exit(1)
+        sys.stderr.write("wrote " + str(len(paths)) + " variants to "
+                         + (args.output_dir or ".") + "\n")
+        sys.exit(0)
+
+    if args.stream or args.json_lines:
+        try:
+            engineFromArgs(args).writeStream(
+                args.input, args.output, flushSize=args.flush_size,
+                lines=args.json_lines)
+        except ValueError as error:
+            sys.stderr.write(args.input.name + ": " + str(error) + "\n")
+            sys.exit(1)
+        args.output.flush()
+        if args.show:
+            subprocess.Popen(["openscad", os.path.abspath(args.output.name)])
+        sys.exit(0)
+
+    j = json.loads(args.input.read())
+    options = optionsFromArgs(args)
+    engine = options.engine
+    mesh = None
+    if args.stl:
+        if numpy is None:
+            blocker = "NumPy is not installed"
+        elif isinstance(j, dict) and 'parameters' in j or args.set:
+            blocker = "the input has parameters"
+        else:
+            try:
+                engine.load(j)
+                mesh = engine.optimize(j if engine.library is None
+                                       else engine.library.expand(j))
+            except ValueError as error:
+                sys.stderr.write(args.input.name + ": " + str(error) + "\n")
+                sys.exit(1)
+            blocker = MeshExport().blocker(engine, mesh)
+        if blocker:
+            sys.stderr.write(args.stl + ": " + blocker
+                             + " needs OpenSCAD, rendering the output\n")
+            mesh = None
+            args.render = args.stl
+    # A render needs the text as well, so it is collected first
+    sink = io.StringIO() if args.render else args.output
+    stats = None
+    try:
+        if args.stats and not (isinstance(j, dict) and 'parameters' in j
+                               or args.set):
+            stats = CompileStats()
+            reports = stats.compile(engine, j, sink,
+                                    flushSize=args.flush_size)
+        elif args.set:
+            model = ParametricModel(engine, j)
+            for assignment in args.set:
+                name, _, value = assignment.partition("=")
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+                model.set(name.strip(), value)
+            model.write(sink, flushSize=args.flush_size)
+            reports = {}
+        else:
+            reports = compileTree(j, sink, options)
+    except ValueError as error:
+        sys.stderr.write(args.input.name + ": " + str(error) + "\n")
+        sys.exit(1)
+    if args.render:
+        args.output.write(sink.getvalue())
+    args.output.flush()
+    for report in reports.values():
+        sys.stderr.write(report + "\n")
+    if stats:
+        sys.stderr.write((json.dumps(stats.report()) if args.stats_format == "json"
+                          else stats.describe()) + "\n")
+    if args.check_clashes:
+        if isinstance(j, dict) and 'parameters' in j:
+            sys.stderr.write(args.input.name + ": clashes are checked on "
+                             "trees without parameters\n")
+            sys.exit(1)
+        sys.stderr.write(AssemblyIndex(engine, j, args.clash_level)
+                         .describe() + "\n")
+    if mesh is not None:
+        with open(args.stl, 'wb') as stl:
+            facets = MeshExport().write(engine, mesh, stl)
+        sys.stderr.write("wrote " + str(facets) + " facets to " + args.stl
+                         + "\n")
+    if args.render:
+        result = renderPoolFromArgs(args).render(sink.getvalue(),
+                                                 args.render)
+        sys.stderr.write(result.describe() + "\n")
+        if not result.ok:
+            sys.stderr.write(result.stderr)
+            sys.exit(1)
     if args.show:
         subprocess.Popen(["openscad", os.path.abspath(args.output.name)])